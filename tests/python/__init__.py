@@ -1,3 +1,13 @@
 from .test_single_layer_conv import *
 from .test_single_layer_conv_tiny import *
 from .test_to_dense import *
+from .test_hashmap import *
+from .test_downsample import *
+from .test_voxelize import *
+from .test_kmap_reuse import *
+from .test_tensor_cache import *
+from .test_kmap_cache import *
+from .test_update_kmap import *
+from .test_derive_kmap import *
+from .test_plan import *
+from .test_workspace import *
@@ -0,0 +1,65 @@
+from typing import Tuple
+
+import numpy as np
+import torch
+
+from torchsparse import nn as spnn
+from torchsparse.nn import functional as F
+
+from .test_kmap_reuse import fresh, random_sparse_tensor
+
+__all__ = ["test_sub_kernel_map_forward"]
+
+
+def test_sub_kernel_map_forward(
+    kernel_size: Tuple[int, ...] = (5, 5, 5),
+    sub_kernel_sizes: Tuple[Tuple[int, ...], ...] = ((3, 3, 3), (1, 3, 5)),
+    dataflow=F.Dataflow.ImplicitGEMM,
+    ifsort: bool = False,
+    training: bool = False,
+    channels: int = 8,
+    device="cpu",
+):
+    """Mismatching out_in_map entries and max abs diff of the outputs (and
+    input gradients when training) between kernel maps derived from a larger
+    kernel and fresh builds, and the number of sub-kernel maps that were
+    built instead of derived.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    config = F.conv_config.get_default_conv_config(training=training)
+    config.dataflow = dataflow
+    config.ifsort = ifsort
+    input = random_sparse_tensor(channels=channels, device=device)
+    input.feats.requires_grad_(training)
+    conv = spnn.Conv3d(channels, channels, kernel_size, config=config)
+    conv.train(training).to(device)(input)
+    # sub-kernel maps built from scratch would add a hash table again
+    input._caches.hashmaps.clear()
+
+    num_mismatches, max_adiff = 0, 0.0
+    for sub_kernel_size in sub_kernel_sizes:
+        conv = spnn.Conv3d(channels, channels, sub_kernel_size, config=config)
+        conv = conv.train(training).to(device)
+        ref_input = fresh(input)
+        output = conv(input)
+        ref_output = conv(ref_input)
+        adiff = torch.max(torch.abs(output.feats - ref_output.feats))
+        max_adiff = max(max_adiff, adiff.item())
+        if training:
+            grad = torch.autograd.grad(output.feats.sum(), input.feats)[0]
+            ref_grad = torch.autograd.grad(ref_output.feats.sum(), input.feats)[0]
+            max_adiff = max(max_adiff, torch.max(torch.abs(grad - ref_grad)).item())
+
+        key = ((1, 1, 1), conv.kernel_size, (1, 1, 1), (1, 1, 1))
+        num_mismatches += torch.sum(
+            input._caches.kmaps[key]["out_in_map"]
+            != ref_input._caches.kmaps[key]["out_in_map"]
+        ).item()
+    return num_mismatches, max_adiff, len(input._caches.hashmaps)
+
+
+if __name__ == "__main__":
+    print(test_sub_kernel_map_forward())
@@ -0,0 +1,78 @@
+from typing import Tuple, Union
+
+import numpy as np
+import torch
+
+from torchsparse.nn import functional as F
+from torchsparse.utils import make_ntuple
+
+from .test_hashmap import random_coords
+
+__all__ = ["test_spdownsample_forward"]
+
+
+def reference_spdownsample(
+    coords: np.ndarray,
+    kernel_size: Tuple[int, ...],
+    stride: Tuple[int, ...],
+    padding: Tuple[int, ...],
+) -> np.ndarray:
+    # every output o with o * stride - padding + k == x for an input x and
+    # an offset k < kernel_size, bounded like spdownsample without a
+    # spatial_range
+    coords_max = (
+        coords[:, 1:].max(0) + 2 * np.array(padding) - (np.array(kernel_size) - 1)
+    ) // np.array(stride)
+    outputs = set()
+    for b, *xyz in coords.tolist():
+        candidates = []
+        for i in range(3):
+            candidates.append(
+                [
+                    (xyz[i] + padding[i] - k) // stride[i]
+                    for k in range(kernel_size[i])
+                    if (xyz[i] + padding[i] - k) % stride[i] == 0
+                    and 0 <= (xyz[i] + padding[i] - k) // stride[i] <= coords_max[i]
+                ]
+            )
+        for x in candidates[0]:
+            for y in candidates[1]:
+                for z in candidates[2]:
+                    outputs.add((b, x, y, z))
+    return np.array(sorted(outputs), dtype=np.int32).reshape(-1, 4)
+
+
+def test_spdownsample_forward(
+    batch_size: int = 2,
+    shape: Union[int, Tuple[int, ...]] = 10,
+    num_points: int = 200,
+    kernel_size: int = 3,
+    stride: int = 2,
+    device="cpu",
+):
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    kernel_size = make_ntuple(kernel_size, ndim=3)
+    stride = make_ntuple(stride, ndim=3)
+    padding = tuple((k - 1) // 2 for k in kernel_size)
+
+    coords = random_coords(shape, num_points, batch_size)[:, [3, 0, 1, 2]]
+    coords = np.ascontiguousarray(coords)
+    coords_t = torch.from_numpy(coords).to(device)
+
+    out_coords = F.spdownsample(
+        coords_t, stride, kernel_size, padding, downsample_mode="spconv"
+    )
+    out_coords = out_coords.cpu().numpy()
+    ref_out_coords = reference_spdownsample(coords, kernel_size, stride, padding)
+    if out_coords.shape != ref_out_coords.shape:
+        return max(len(out_coords), len(ref_out_coords))
+    return np.sum(np.any(out_coords != ref_out_coords, axis=1))
+
+
+if __name__ == "__main__":
+    num_mismatches = test_spdownsample_forward()
+    print(num_mismatches)
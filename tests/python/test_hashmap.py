@@ -0,0 +1,191 @@
+from typing import Tuple, Union
+
+import numpy as np
+import torch
+
+import torchsparse.backend
+import torchsparse.backends
+from torchsparse.nn import functional as F
+from torchsparse.utils import make_ntuple
+
+__all__ = [
+    "test_hashtable_forward",
+    "test_sphashquery_offsets_forward",
+    "test_packed_keys_out_of_range_forward",
+]
+
+
+def random_coords(
+    shape: Tuple[int, ...], num_points: int, batch_size: int
+) -> np.ndarray:
+    # unique (x, y, z, b) coordinates
+    coords = []
+    for b in range(batch_size):
+        flat = np.random.choice(np.prod(shape), num_points, replace=False)
+        xyz = np.stack(np.unravel_index(flat, shape), axis=-1)
+        coords.append(np.pad(xyz, ((0, 0), (0, 1)), constant_values=b))
+    return np.concatenate(coords, axis=0).astype(np.int32)
+
+
+def reference_lookup(
+    references: np.ndarray,
+    queries: np.ndarray,
+    kernel_size: Tuple[int, ...],
+    stride: Tuple[int, ...],
+) -> np.ndarray:
+    # index of the reference at queries * stride + offset, or -1; offsets
+    # are enumerated like lookup_coords
+    table = {tuple(c): i for i, c in enumerate(references.tolist())}
+    kernel_volume = int(np.prod(kernel_size))
+    results = np.full((len(queries), kernel_volume), -1, dtype=np.int64)
+    for k in range(kernel_volume):
+        offset, rest = [0, 0, 0], k
+        axes = range(3) if kernel_volume % 2 else range(2, -1, -1)
+        for i in axes:
+            offset[i] = rest % kernel_size[i] - (kernel_size[i] - 1) // 2
+            rest //= kernel_size[i]
+        for j, q in enumerate(queries.tolist()):
+            key = tuple(q[i] * stride[i] + offset[i] for i in range(3)) + (q[3],)
+            results[j, k] = table.get(key, -1)
+    return results
+
+
+def test_hashtable_forward(
+    batch_size: int = 2,
+    shape: Union[int, Tuple[int, ...]] = 8,
+    num_points: int = 100,
+    kernel_size: int = 3,
+    stride: int = 1,
+    packed: bool = False,
+    device="cpu",
+):
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    kernel_size = make_ntuple(kernel_size, ndim=3)
+    stride = make_ntuple(stride, ndim=3)
+    kernel_volume = int(np.prod(kernel_size))
+
+    coords = random_coords(shape, num_points, batch_size)
+    queries = np.unique(coords // np.array(stride + (1,), dtype=np.int32), axis=0)
+    coords_t = torch.from_numpy(coords).to(device)
+    queries_t = torch.from_numpy(queries).to(device)
+
+    keys = torch.zeros(2 * len(coords), dtype=torch.int64, device=device)
+    vals = torch.zeros(2 * len(coords), dtype=torch.int32, device=device)
+    if device == "cpu":
+        hashtable = torchsparse.backend.CPUHashTable(keys, vals, packed)
+    else:
+        hashtable = torchsparse.backend.GPUHashTable(keys, vals, packed)
+    hashtable.insert_coords(coords_t)
+
+    kernel_size_t = torch.tensor(kernel_size, dtype=torch.int, device=device)
+    stride_t = torch.tensor(stride, dtype=torch.int, device=device)
+    results = hashtable.lookup_coords(queries_t, kernel_size_t, stride_t, kernel_volume)
+    results = results[: len(queries)].cpu().numpy() - 1
+    ref_results = reference_lookup(coords, queries, kernel_size, stride)
+    num_mismatches = np.sum(results != ref_results)
+
+    if stride == (1, 1, 1) and kernel_volume % 2:
+        results = hashtable.lookup_coords_subm(coords_t, kernel_size_t, kernel_volume)
+        results = results[: len(coords)].cpu().numpy() - 1
+        ref_results = reference_lookup(coords, coords, kernel_size, stride)
+        num_mismatches += np.sum(results != ref_results)
+
+    # bulk insert / lookup of sphash keys in the same storage
+    keys.zero_()
+    vals.zero_()
+    hashtable.insert_vals(F.sphash(coords_t))
+    results = hashtable.lookup_vals(F.sphash(queries_t))
+    results = results[: len(queries)].cpu().numpy() - 1
+    ref_results = reference_lookup(coords, queries, (1, 1, 1), (1, 1, 1))
+    num_mismatches += np.sum(results != ref_results[:, 0])
+    return num_mismatches
+
+
+def test_sphashquery_offsets_forward(
+    batch_size: int = 2,
+    shape: Union[int, Tuple[int, ...]] = 8,
+    num_points: int = 100,
+    kernel_size: int = 3,
+    packed: bool = False,
+    device="cpu",
+):
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    kernel_size = make_ntuple(kernel_size, ndim=3)
+
+    references = torch.from_numpy(random_coords(shape, num_points, batch_size))
+    queries = torch.from_numpy(random_coords(shape, num_points, batch_size))
+    references, queries = references.to(device), queries.to(device)
+    offsets = torch.stack(
+        torch.meshgrid(
+            *[torch.arange(k, device=device) - (k - 1) // 2 for k in kernel_size],
+            indexing="ij",
+        ),
+        dim=-1,
+    )
+    offsets = offsets.view(-1, 3).int()
+
+    reference_keys = F.sphash(references, packed=packed)
+    table = F.sphashtable(reference_keys, packed=packed)
+    results = F.sphashquery_offsets(queries, offsets, table, packed=packed)
+    ref_results = F.sphashquery(
+        F.sphash(queries, offsets, packed=packed), reference_keys
+    ).t()
+    return torch.sum(results != ref_results).item()
+
+
+def test_packed_keys_out_of_range_forward(device="cpu"):
+    """Mismatching entries of hash table lookups and of a submanifold kernel
+    map built with packed keys forced, for coordinates outside of their
+    16-bit range, which are never found.
+    """
+
+    # (x, y, z, b), the last two share the packed key of out-of-range ones
+    coords = np.array([[0, 0, 0, 0], [40000, 0, 0, 0], [50000, 0, 0, 0]], np.int32)
+    coords_t = torch.from_numpy(coords).to(device)
+    kernel_size = (3, 3, 3)
+
+    keys = torch.zeros(2 * len(coords), dtype=torch.int64, device=device)
+    vals = torch.zeros(2 * len(coords), dtype=torch.int32, device=device)
+    if device == "cpu":
+        hashtable = torchsparse.backend.CPUHashTable(keys, vals, True)
+    else:
+        hashtable = torchsparse.backend.GPUHashTable(keys, vals, True)
+    hashtable.insert_coords(coords_t)
+    kernel_size_t = torch.tensor(kernel_size, dtype=torch.int, device=device)
+    stride_t = torch.ones(3, dtype=torch.int, device=device)
+    results = hashtable.lookup_coords(coords_t, kernel_size_t, stride_t, 27)
+    results = results[: len(coords)].cpu().numpy() - 1
+    ref_results = reference_lookup(coords[:1], coords, kernel_size, (1, 1, 1))
+    num_mismatches = np.sum(results != ref_results)
+
+    # submanifold maps still map every coordinate to itself
+    torchsparse.backends.hash_key_mode = "packed"
+    try:
+        kmap = F.build_kernel_map(
+            coords_t[:, [3, 0, 1, 2]].contiguous(),
+            len(coords),
+            kernel_size,
+            1,
+            1,
+            mode="hashmap",
+            dataflow=F.Dataflow.GatherScatter,
+        )
+    finally:
+        torchsparse.backends.hash_key_mode = "auto"
+    results = kmap["out_in_map"][: len(coords)].cpu().numpy()
+    ref_results = reference_lookup(coords, coords, kernel_size, (1, 1, 1))
+    num_mismatches += np.sum(results != ref_results)
+    return num_mismatches
+
+
+if __name__ == "__main__":
+    num_mismatches = test_hashtable_forward()
+    print(num_mismatches)
@@ -0,0 +1,85 @@
+import gc
+from typing import Tuple
+
+import numpy as np
+import torch
+from torch import nn
+
+from torchsparse import SparseTensor
+from torchsparse import nn as spnn
+from torchsparse.utils import kmap_cache
+from torchsparse.utils.kmap_cache import (
+    KernelMapCache,
+    coords_fingerprint,
+    set_kmap_cache,
+)
+
+from .test_kmap_reuse import random_sparse_tensor
+
+__all__ = ["test_coords_fingerprint", "test_kmap_cache_forward"]
+
+
+def test_coords_fingerprint():
+    """Whether fingerprints match for equal coordinates, change with an
+    in-place update and are forgotten with their tensor.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    coords = random_sparse_tensor().coords
+    gc.collect()
+    num_fingerprints = len(kmap_cache._fingerprints)
+    fingerprint = coords_fingerprint(coords)
+    same = fingerprint == coords_fingerprint(coords.clone())
+    coords[0, 1] += 1
+    changed = fingerprint != coords_fingerprint(coords)
+    del coords
+    gc.collect()
+    forgotten = len(kmap_cache._fingerprints) == num_fingerprints
+    return same, changed, forgotten
+
+
+def test_kmap_cache_forward(
+    devices: Tuple[str, ...] = ("cpu", "cpu"), channels: int = 8
+):
+    """Max abs diff to forward passes without the kernel map cache, and the
+    stats of the cache, for copies of one input on every device in `devices`.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    model = nn.Sequential(
+        spnn.Conv3d(channels, channels, 3),
+        spnn.Conv3d(channels, channels, 2, 2),
+        spnn.Conv3d(channels, channels, 3),
+    )
+    input = random_sparse_tensor(channels=channels)
+    cache = KernelMapCache()
+    max_adiff = 0.0
+    with torch.no_grad():
+        for device in devices:
+            model = model.to(device)
+            feats, coords = input.feats.to(device), input.coords.to(device)
+            set_kmap_cache(None)
+            ref_output = model(
+                SparseTensor(feats, coords.clone(), 1, input.spatial_range)
+            )
+            set_kmap_cache(cache)
+            try:
+                output = model(
+                    SparseTensor(feats, coords.clone(), 1, input.spatial_range)
+                )
+            finally:
+                set_kmap_cache(None)
+            if output.feats.shape != ref_output.feats.shape:
+                return float("inf"), cache.stats()
+            adiff = torch.max(torch.abs(output.feats - ref_output.feats))
+            max_adiff = max(max_adiff, adiff.item())
+    return max_adiff, cache.stats()
+
+
+if __name__ == "__main__":
+    print(test_coords_fingerprint())
+    print(test_kmap_cache_forward())
@@ -0,0 +1,260 @@
+from typing import List, Tuple, Union
+
+import numpy as np
+import torch
+
+import torchsparse
+import torchsparse.backends
+from torchsparse import SparseTensor
+from torchsparse import nn as spnn
+from torchsparse.nn import functional as F
+from torchsparse.utils import make_ntuple
+
+from .test_hashmap import random_coords
+
+__all__ = [
+    "test_hash_key_modes_forward",
+    "test_mixed_kmap_modes_forward",
+    "test_compact_kmaps_forward",
+    "test_transposed_kmap_reuse_forward",
+    "test_lazy_backward_maps_forward",
+]
+
+
+def random_sparse_tensor(
+    batch_size: int = 2,
+    shape: Union[int, Tuple[int, ...]] = 10,
+    num_points: int = 300,
+    channels: int = 8,
+    with_spatial_range: bool = True,
+    device="cpu",
+) -> SparseTensor:
+    shape = make_ntuple(shape, ndim=3)
+    coords = random_coords(shape, num_points, batch_size)[:, [3, 0, 1, 2]]
+    coords = torch.from_numpy(np.ascontiguousarray(coords)).to(device)
+    feats = torch.randn(coords.shape[0], channels, device=device)
+    spatial_range = (batch_size,) + shape if with_spatial_range else None
+    return SparseTensor(feats, coords, spatial_range=spatial_range)
+
+
+def fresh(input: SparseTensor) -> SparseTensor:
+    # the same tensor with an empty tensor cache
+    return SparseTensor(
+        input.feats, input.coords, input.stride, spatial_range=input.spatial_range
+    )
+
+
+def test_hash_key_modes_forward(
+    layers: List[Tuple] = ((3, 1, "packed"), (2, 1, "fnv"), (3, 2, "packed")),
+    channels: int = 8,
+    device="cpu",
+):
+    """Max abs diff between layers sharing one tensor cache and layers that
+    build every kernel map from scratch, with a hash key mode per layer.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    output = random_sparse_tensor(channels=channels, device=device)
+    max_adiff = 0.0
+    try:
+        for kernel_size, stride, hash_key_mode in layers:
+            torchsparse.backends.hash_key_mode = hash_key_mode
+            conv = spnn.Conv3d(channels, channels, kernel_size, stride).to(device)
+            ref_output = conv(fresh(output))
+            output = conv(output)
+            max_adiff = max(
+                max_adiff, torch.max(torch.abs(output.feats - ref_output.feats)).item()
+            )
+    finally:
+        torchsparse.backends.hash_key_mode = "auto"
+    return max_adiff
+
+
+def test_mixed_kmap_modes_forward(
+    layers: List[Tuple] = (
+        (3, 1, "hashmap"),
+        (2, 1, "sorted"),
+        (3, 2, "sorted"),
+        (2, 1, "hashmap"),
+        (5, 1, "sorted"),
+        (2, 2, "hashmap_on_the_fly"),
+        (3, 1, "hashmap"),
+    ),
+    channels: int = 8,
+    device="cpu",
+):
+    """Max abs diff between layers sharing one tensor cache and layers that
+    build every kernel map from scratch, with a kmap_mode per layer.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    output = random_sparse_tensor(channels=channels, device=device)
+    max_adiff = 0.0
+    for kernel_size, stride, kmap_mode in layers:
+        config = F.conv_config.get_default_conv_config()
+        config.kmap_mode = kmap_mode
+        conv = spnn.Conv3d(channels, channels, kernel_size, stride, config=config)
+        conv = conv.to(device)
+        ref_output = conv(fresh(output))
+        output = conv(output)
+        max_adiff = max(
+            max_adiff, torch.max(torch.abs(output.feats - ref_output.feats)).item()
+        )
+    return max_adiff
+
+
+def test_compact_kmaps_forward(
+    dataflow=F.Dataflow.ImplicitGEMM,
+    training: bool = True,
+    channels: int = 8,
+    device="cpu",
+):
+    """Whether the outputs, input gradients and weight gradients of a model
+    are bit-identical with and without compact kernel maps.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    config = F.conv_config.get_default_conv_config(training=training)
+    config.dataflow = dataflow
+    model = torch.nn.Sequential(
+        spnn.Conv3d(channels, channels, 3, config=config),
+        spnn.Conv3d(channels, channels, 3, 2, config=config),
+        spnn.Conv3d(channels, channels, 3, config=config),
+        spnn.Conv3d(channels, channels, 3, 2, transposed=True, config=config),
+    )
+    model = model.train(training).to(device)
+    input = random_sparse_tensor(channels=channels, device=device)
+
+    results = []
+    try:
+        for compact_kmaps in [False, True]:
+            torchsparse.backends.compact_kmaps = compact_kmaps
+            feats = input.feats.clone().requires_grad_(training)
+            output = model(
+                SparseTensor(feats, input.coords, spatial_range=input.spatial_range)
+            )
+            tensors = [output.feats]
+            if training:
+                params = [feats] + list(model.parameters())
+                tensors += torch.autograd.grad(output.feats.sum(), params)
+            results.append(tensors)
+    finally:
+        torchsparse.backends.compact_kmaps = False
+    return all(torch.equal(a, b) for a, b in zip(*results))
+
+
+def test_transposed_kmap_reuse_forward(channels: int = 8, device="cpu"):
+    """Calls of transpose_kernel_map and cached transposed kernel maps for
+    decoder layers sharing one downsampling map, two of them with the same
+    settings, and whether the downsampling map was left unchanged.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    input = random_sparse_tensor(channels=channels, device=device)
+    down = spnn.Conv3d(channels, channels, 2, 2).to(device)
+    output = down(input)
+    key = ((1, 1, 1), (2, 2, 2), (2, 2, 2), (1, 1, 1))
+    kmap = input._caches.kmaps[key]
+    fields = dict(kmap)
+    lazy = dict(kmap._lazy)
+
+    configs = []
+    for ifsort in [False, True]:
+        # the default config is shared, the copies are not
+        config = F.conv_config.get_default_conv_config().copy()
+        config.dataflow = F.Dataflow.ImplicitGEMM
+        config.ifsort = ifsort
+        configs.append(config)
+    ups = [
+        spnn.Conv3d(channels, channels, 2, 2, transposed=True, config=configs[0]),
+        spnn.Conv3d(channels, channels, 2, 2, transposed=True, config=configs[0]),
+        spnn.Conv3d(channels, channels, 2, 2, transposed=True, config=configs[1]),
+    ]
+    # the same settings as the first two, but in training
+    ups = [up.eval() for up in ups] + [
+        spnn.Conv3d(channels, channels, 2, 2, transposed=True, config=configs[0])
+    ]
+
+    num_calls = 0
+    transpose_kernel_map = F.transpose_kernel_map
+
+    def counted_transpose_kernel_map(*args, **kwargs):
+        nonlocal num_calls
+        num_calls += 1
+        return transpose_kernel_map(*args, **kwargs)
+
+    F.transpose_kernel_map = counted_transpose_kernel_map
+    try:
+        with torch.no_grad():
+            for up in ups:
+                up.to(device)(output)
+    finally:
+        F.transpose_kernel_map = transpose_kernel_map
+
+    num_transposed = sum(len(k) == 8 for k in input._caches.kmaps)
+    unchanged = (
+        input._caches.kmaps[key] is kmap
+        and dict(kmap).keys() == fields.keys()
+        and all(kmap[name] is value for name, value in fields.items())
+        and kmap._lazy == lazy
+    )
+    return num_calls, num_transposed, unchanged
+
+
+def test_lazy_backward_maps_forward(
+    ifsort: bool = False, channels: int = 8, device="cpu"
+):
+    """Whether the backward maps of a trained layer are pending after its
+    forward pass and computed after the backward pass, whether those of a
+    frozen layer on an input without gradients stay pending, and the max
+    abs diff of the weight gradients to kernel maps computed eagerly.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    config = F.conv_config.get_default_conv_config(training=True).copy()
+    config.dataflow = F.Dataflow.ImplicitGEMM
+    config.ifsort = ifsort
+    frozen = spnn.Conv3d(channels, channels, 5, config=config).to(device)
+    frozen.requires_grad_(False)
+    conv = spnn.Conv3d(channels, channels, 3, config=config).to(device)
+    frozen_key = ((1, 1, 1), (5, 5, 5), (1, 1, 1), (1, 1, 1))
+    key = ((1, 1, 1), (3, 3, 3), (1, 1, 1), (1, 1, 1))
+    input = random_sparse_tensor(channels=channels, device=device)
+
+    grads = []
+    for eager in [False, True]:
+        x = fresh(input)
+        output = conv(frozen(x))
+        kmaps = x._caches.kmaps
+        if eager:
+            for k in [frozen_key, key]:
+                kmaps[k].materialize()
+        else:
+            pending = kmaps[key].is_lazy("out_in_map_bwd")
+        output.feats.sum().backward()
+        grads.append(conv.kernel.grad.clone())
+        conv.kernel.grad = None
+        if not eager:
+            frozen_pending = kmaps[frozen_key].is_lazy("out_in_map_bwd")
+            computed = not kmaps[key].is_lazy("out_in_map_bwd")
+
+    max_adiff = torch.max(torch.abs(grads[0] - grads[1])).item()
+    return pending, frozen_pending, computed, max_adiff
+
+
+if __name__ == "__main__":
+    print(test_hash_key_modes_forward())
+    print(test_mixed_kmap_modes_forward())
+    print(test_compact_kmaps_forward())
+    print(test_transposed_kmap_reuse_forward())
+    print(test_lazy_backward_maps_forward())
@@ -0,0 +1,98 @@
+from typing import Tuple
+
+import numpy as np
+import torch
+from torch import nn
+
+import torchsparse
+from torchsparse import nn as spnn
+
+from torchsparse import SparseTensor
+from torchsparse.utils.collate import sparse_collate
+
+from .test_kmap_reuse import fresh, random_sparse_tensor
+
+__all__ = ["test_plan_forward", "test_plan_collate_forward"]
+
+
+def test_plan_forward(channels: int = 8, device="cpu"):
+    """Max abs diff between a forward pass on kernel maps built by a plan
+    and one building them on demand, and the tensor cache misses of the
+    forward pass after the plan was built.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    model = nn.Sequential(
+        spnn.Conv3d(channels, channels, 5),
+        spnn.Conv3d(channels, channels, 3),
+        spnn.Conv3d(channels, channels, 3, 2),
+        spnn.Conv3d(channels, channels, 3),
+        spnn.Conv3d(channels, channels, 2, 2),
+        spnn.Conv3d(channels, channels, 2, 2, transposed=True),
+        spnn.Conv3d(channels, channels, 3, 2, transposed=True),
+        spnn.Conv3d(channels, channels, (1, 3, 3)),
+    )
+    model = model.to(device).eval()
+    sample_input = random_sparse_tensor(channels=channels, device=device)
+    input = random_sparse_tensor(channels=channels, device=device)
+
+    with torch.no_grad():
+        plan = torchsparse.plan(model, sample_input)
+        ref_output = model(fresh(input))
+        plan.build(input)
+        input._caches.reset_stats()
+        output = model(input)
+
+    max_adiff = torch.max(torch.abs(output.feats - ref_output.feats)).item()
+    return max_adiff, input._caches.stats()["num_misses"]
+
+
+def test_plan_collate_forward(
+    shapes: Tuple[int, ...] = (10, 6, 8), channels: int = 8, device="cpu"
+):
+    """Max abs diff between a batch collated with the kernel maps of a plan
+    and one building them on demand, for samples of different extents, and
+    the number of kernel maps the forward pass on the former had to build.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    model = nn.Sequential(
+        spnn.Conv3d(channels, channels, 3),
+        spnn.Conv3d(channels, channels, 3, 2),
+        spnn.Conv3d(channels, channels, 3),
+        spnn.Conv3d(channels, channels, 3, 2),
+        spnn.Conv3d(channels, channels, 3),
+    )
+    model = model.to(device).eval()
+    samples = []
+    for shape in shapes:
+        sample = random_sparse_tensor(
+            batch_size=1,
+            shape=shape,
+            num_points=100,
+            channels=channels,
+            device=device,
+        )
+        samples.append(SparseTensor(sample.feats, sample.coords[:, 1:]))
+
+    with torch.no_grad():
+        plan = torchsparse.plan(model, sparse_collate(samples))
+        ref_output = model(sparse_collate(samples))
+        input = sparse_collate(samples, plan=plan)
+        num_kmaps = len(input._caches.kmaps)
+        output = model(input)
+    num_built = len(input._caches.kmaps) - num_kmaps
+
+    if not torch.equal(output.coords, ref_output.coords):
+        return float("inf"), num_built
+    max_adiff = torch.max(torch.abs(output.feats - ref_output.feats)).item()
+    return max_adiff, num_built
+
+
+if __name__ == "__main__":
+    print(test_plan_forward())
+    print(test_plan_collate_forward())
@@ -11,7 +11,10 @@ from torchsparse.utils import make_ntuple
 
 from .test_utils import *
 
-__all__ = ["test_single_layer_convolution_forward"]
+__all__ = [
+    "test_single_layer_convolution_forward",
+    "test_single_layer_convolution_backward",
+]
 
 
 class TestSparseConv(nn.Module):
@@ -55,9 +58,9 @@ class TestSparseConv(nn.Module):
         ).to(device)
         self.shape = shape
 
-    def forward(self, feats, coords):
+    def forward(self, feats, coords, spatial_range=None):
         coords = coords.int()
-        ts_tensor = torchsparse.SparseTensor(feats, coords)
+        ts_tensor = torchsparse.SparseTensor(feats, coords, spatial_range=spatial_range)
         return self.net(ts_tensor)
 
 
@@ -118,6 +121,7 @@ def test_single_layer_convolution_forward(
     stride: int = 1,
     device="cuda:0",
     is_half=True,
+    with_spatial_range=False,
 ):
 
     np.random.seed(0)
@@ -199,7 +203,8 @@ def test_single_layer_convolution_forward(
         dense_feats_t = dense_pad(dense_feats_t, kernel_size)
 
     ref_out = ref_model(dense_feats_t)
-    out = model(feats_t, coords_t)
+    spatial_range = (batch_size,) + shape if with_spatial_range else None
+    out = model(feats_t, coords_t, spatial_range)
 
     ts_coords = out.C
     ts_coords_np = np.array(ts_coords.detach().cpu())
@@ -220,6 +225,96 @@ def test_single_layer_convolution_forward(
     return mean_adiff, max_rdiff
 
 
+def test_single_layer_convolution_backward(
+    batch_size: int = 1,
+    shape: Union[int, Tuple[int, ...]] = 5,
+    num_points: int = 20,
+    IC: int = 16,
+    OC: int = 32,
+    kernel_size: int = 3,
+    stride: int = 1,
+    device="cuda:0",
+):
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    if num_points > np.prod(shape):
+        num_points = np.prod(shape)
+    num_points = [num_points] * batch_size
+
+    if kernel_size % 2 == 0:
+        layer_padding = 0
+    else:
+        layer_padding = (kernel_size - 1) // 2
+
+    kwargs = dict(
+        num_layers=1,
+        shape=shape,
+        in_channels=IC,
+        out_channels=OC,
+        kernel_size=kernel_size,
+        stride=stride,
+        padding=layer_padding,
+        dilation=1,
+        device=device,
+    )
+    model = TestSparseConv(**kwargs).train()
+    ref_model = TestTorchConv(**kwargs).train()
+
+    sparse_dict = generate_feature_map(shape, num_points, IC, dtype=np.float32)
+    feats = np.ascontiguousarray(sparse_dict["feats"])
+    coords = np.ascontiguousarray(sparse_dict["coords"][:, [3, 0, 1, 2]])
+
+    coords_t = torch.from_numpy(coords).int().to(device)
+    feats_t = torch.from_numpy(feats).to(device).requires_grad_()
+    dense_feats_t = (
+        torch.from_numpy(sparse_dict["dense_feats"]).to(device).requires_grad_()
+    )
+
+    filters = np.random.uniform(
+        -1, 1, size=[kernel_size, kernel_size, kernel_size, IC, OC]
+    ).astype(np.float32)
+    filters_t = torch.from_numpy(filters).to(device)
+    if kernel_size % 2 == 1:
+        permutation = (4, 3, 2, 1, 0)
+    else:
+        permutation = (4, 3, 0, 1, 2)
+    ref_model.net[0].weight.data[:] = filters_t.permute(*permutation).contiguous()
+    model.net[0].kernel.data[:] = filters_t.reshape(-1, IC, OC)
+
+    out = model(feats_t, coords_t)
+    grad_out = torch.rand_like(out.F) * 2 - 1
+    (out.F * grad_out).sum().backward()
+
+    if kernel_size % 2 == 0:  # manually pad
+        ref_out = ref_model(dense_pad(dense_feats_t, kernel_size))
+    else:
+        ref_out = ref_model(dense_feats_t)
+    out_coords = out.C.long()
+    ref_grad_out = torch.zeros_like(ref_out)
+    ref_grad_out[
+        out_coords[:, 0], :, out_coords[:, 1], out_coords[:, 2], out_coords[:, 3]
+    ] = grad_out
+    (ref_out * ref_grad_out).sum().backward()
+
+    coords_l = coords_t.long()
+    ref_grad_feats = dense_feats_t.grad[
+        coords_l[:, 0], :, coords_l[:, 1], coords_l[:, 2], coords_l[:, 3]
+    ]
+    inverse = tuple(permutation.index(i) for i in range(5))
+    ref_grad_kernel = ref_model.net[0].weight.grad.permute(*inverse).reshape(-1, IC, OC)
+
+    grad_feats_rdiff = torch.max(torch.abs(feats_t.grad - ref_grad_feats)) / torch.mean(
+        torch.abs(ref_grad_feats)
+    )
+    grad_kernel_rdiff = torch.max(
+        torch.abs(model.net[0].kernel.grad - ref_grad_kernel)
+    ) / torch.mean(torch.abs(ref_grad_kernel))
+    return grad_feats_rdiff.item(), grad_kernel_rdiff.item()
+
+
 if __name__ == "__main__":
     # Only support single conv layer
     # Cannot support even kernel sizes >= 4 (because of the different definition of anchor point)
@@ -0,0 +1,150 @@
+import gc
+import os
+import tempfile
+
+import numpy as np
+import torch
+from torch import nn
+
+from torchsparse import nn as spnn
+from torchsparse.utils.tensor_cache import (
+    TensorCache,
+    TensorCacheMode,
+    clear_global_tensor_cache,
+    load_tensor_cache,
+    save_tensor_cache,
+    set_tensor_cache_mode,
+)
+
+from .test_kmap_reuse import fresh, random_sparse_tensor
+
+__all__ = [
+    "test_tensor_cache_eviction",
+    "test_tensor_cache_pinning",
+    "test_global_tensor_cache_forward",
+    "test_tensor_cache_file",
+]
+
+
+def test_tensor_cache_eviction():
+    """Keys left in the cache after a sequence of inserts, reads and pins
+    with room for three entries, in least recently used order, and the stats
+    of the cache.
+    """
+    entry = torch.zeros(256, dtype=torch.uint8)
+    caches = TensorCache(max_bytes=3 * entry.nbytes)
+    caches.kmaps["a"] = {"out_in_map": entry.clone()}
+    caches.hashmaps["b"] = [entry.clone(), None, None]
+    caches.grids["c"] = entry.clone()
+    # reads refresh "a", "b" is now the least recently used entry
+    caches.kmaps.get("a")
+    caches.kmaps.get("x")
+    caches.sortedmaps["d"] = [entry.clone(), torch.zeros(0, dtype=torch.int)]
+    # an entry sharing the storage of "d" is accounted once
+    caches.kmaps["e"] = {"keys": caches.sortedmaps["d"][0]}
+    # pinned entries are skipped, "a" is evicted in place of "c"
+    caches.grids.pin("c")
+    caches.kmaps["f"] = {"out_in_map": entry.clone()}
+    caches.grids.unpin("c")
+    keys = [key for _, key in caches._order]
+    return keys, caches.stats()
+
+
+def test_tensor_cache_pinning(device="cpu"):
+    """Pinned kernel maps while the autograd graph of a convolution is alive,
+    after its backward pass and after dropping it without one.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    input = random_sparse_tensor(device=device)
+    conv = spnn.Conv3d(8, 8, 3).to(device)
+    num_pins = []
+
+    output = conv(input)
+    num_pins.append(len(input._caches._pins))
+    output.feats.sum().backward()
+    del output
+    gc.collect()
+    num_pins.append(len(input._caches._pins))
+
+    output = conv(input)
+    del output
+    gc.collect()
+    num_pins.append(len(input._caches._pins))
+    return num_pins
+
+
+def test_global_tensor_cache_forward(device="cpu"):
+    """Max abs diff between consecutive inputs sharing the global tensor
+    cache and the same inputs with their own caches.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    conv = spnn.Conv3d(8, 8, 3).to(device)
+    down = spnn.Conv3d(8, 8, 2, 2).to(device)
+    max_adiff = 0.0
+    set_tensor_cache_mode(TensorCacheMode.GLOBAL_TENSOR_CACHE)
+    try:
+        with torch.no_grad():
+            for num_points in [300, 300, 200]:
+                input = random_sparse_tensor(num_points=num_points, device=device)
+                output = down(conv(input))
+                set_tensor_cache_mode(TensorCacheMode.SEPARATE_TENSOR_CACHE)
+                ref_output = down(conv(fresh(input)))
+                set_tensor_cache_mode(TensorCacheMode.GLOBAL_TENSOR_CACHE)
+                if output.feats.shape != ref_output.feats.shape:
+                    return float("inf")
+                adiff = torch.max(torch.abs(output.feats - ref_output.feats))
+                max_adiff = max(max_adiff, adiff.item())
+    finally:
+        set_tensor_cache_mode(TensorCacheMode.SEPARATE_TENSOR_CACHE)
+        clear_global_tensor_cache()
+    return max_adiff
+
+
+def test_tensor_cache_file(device="cpu"):
+    """Max abs diff between a forward pass on a tensor cache read back from
+    a file and one building its kernel maps on demand, the number of kernel
+    maps it had to build, and the bytes and kernel maps left when reading
+    the file with room for half of it, along with that budget.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    model = nn.Sequential(
+        spnn.Conv3d(8, 8, 3),
+        spnn.Conv3d(8, 8, 3, 2),
+        spnn.Conv3d(8, 8, 3),
+    )
+    model = model.to(device).eval()
+    input = random_sparse_tensor(device=device)
+    with torch.no_grad():
+        ref_output = model(input)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "caches.bin")
+            save_tensor_cache(input._caches, path)
+            caches = load_tensor_cache(path, device=device)
+            max_bytes = caches.stats()["nbytes"] // 2
+            budget_caches = load_tensor_cache(path, max_bytes=max_bytes)
+
+        input = fresh(input)
+        input._caches = caches
+        num_kmaps = len(caches.kmaps)
+        output = model(input)
+
+    max_adiff = torch.max(torch.abs(output.feats - ref_output.feats)).item()
+    num_built = len(caches.kmaps) - num_kmaps
+    budget = (budget_caches.stats()["nbytes"], len(budget_caches.kmaps), max_bytes)
+    return max_adiff, num_built, budget
+
+
+if __name__ == "__main__":
+    print(test_tensor_cache_eviction())
+    print(test_tensor_cache_pinning())
+    print(test_global_tensor_cache_forward())
+    print(test_tensor_cache_file())
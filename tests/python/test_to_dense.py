@@ -19,6 +19,7 @@ def test_to_dense_forward(
     num_points: int = 6,
     channel: int = 4,
     device="cuda:0",
+    channels_first: bool = False,
 ):
 
     np.random.seed(0)
@@ -45,7 +46,10 @@ def test_to_dense_forward(
     coords_t = torch.from_numpy(coords).int().to(device)
     feats_t = torch.from_numpy(feats).to(torch_dtype).to(device)
 
-    output = to_dense(feats_t, coords_t, spatial_range).cpu().numpy()
+    output = to_dense(feats_t, coords_t, spatial_range, channels_first)
+    if channels_first:
+        output = output.permute(0, 2, 3, 4, 1)
+    output = output.cpu().numpy()
 
     # print(output)
     # print(ref_dense_feats)
@@ -0,0 +1,86 @@
+from typing import Tuple
+
+import numpy as np
+import torch
+
+from torchsparse import SparseTensor
+from torchsparse import nn as spnn
+from torchsparse.nn import functional as F
+
+from .test_kmap_reuse import random_sparse_tensor
+
+__all__ = ["test_update_tensor_cache_forward"]
+
+
+def test_update_tensor_cache_forward(
+    kernel_sizes: Tuple[int, ...] = (3, 5),
+    num_inserted: int = 40,
+    num_removed: int = 40,
+    channels: int = 8,
+    device="cpu",
+):
+    """Mismatching out_in_map entries and max abs diff of the outputs between
+    a patched tensor cache and one rebuilt for the new coordinates, and
+    whether inserting a kept coordinate is rejected.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    input = random_sparse_tensor(channels=channels, device=device)
+    coords = input.coords
+    # inserted coordinates are drawn from the free cells
+    candidates = random_sparse_tensor(num_points=300, device=device).coords
+    candidates = candidates[
+        ~torch.isin(F.pack_coords(candidates), F.pack_coords(coords))
+    ]
+    inserted = candidates[torch.randperm(candidates.shape[0])[:num_inserted]]
+    removed = coords[torch.randperm(coords.shape[0])[:num_removed]]
+
+    convs = []
+    for dataflow in [
+        F.Dataflow.ImplicitGEMM,
+        F.Dataflow.GatherScatter,
+        F.Dataflow.FetchOnDemand,
+    ]:
+        for kernel_size in kernel_sizes:
+            config = F.conv_config.get_default_conv_config()
+            config.dataflow = dataflow
+            conv = spnn.Conv3d(channels, channels, kernel_size, config=config)
+            convs.append(conv.to(device))
+
+    num_mismatches, max_adiff = 0, 0.0
+    with torch.no_grad():
+        for conv in convs:
+            input._caches.kmaps.clear()
+            conv(input)
+            new_coords, new_caches = F.update_tensor_cache(
+                input._caches, coords, inserted, removed
+            )
+            feats = torch.randn(new_coords.shape[0], channels, device=device)
+            output = SparseTensor(feats, new_coords, spatial_range=input.spatial_range)
+            output._caches = new_caches
+            output = conv(output)
+            ref_input = SparseTensor(
+                feats, new_coords, spatial_range=input.spatial_range
+            )
+            ref_output = conv(ref_input)
+
+            key = ((1, 1, 1), conv.kernel_size, (1, 1, 1), (1, 1, 1))
+            num_mismatches += torch.sum(
+                new_caches.kmaps[key]["out_in_map"]
+                != ref_input._caches.kmaps[key]["out_in_map"]
+            ).item()
+            adiff = torch.max(torch.abs(output.feats - ref_output.feats))
+            max_adiff = max(max_adiff, adiff.item())
+
+    try:
+        F.update_tensor_cache(input._caches, coords, coords[:1], removed[:0])
+        rejected = False
+    except ValueError:
+        rejected = True
+    return num_mismatches, max_adiff, rejected
+
+
+if __name__ == "__main__":
+    print(test_update_tensor_cache_forward())
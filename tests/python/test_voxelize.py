@@ -0,0 +1,79 @@
+import numpy as np
+import torch
+
+from torchsparse.nn import functional as F
+
+__all__ = ["test_voxelize_forward", "test_devoxelize_forward"]
+
+
+def test_voxelize_forward(
+    num_points: int = 2000,
+    num_voxels: int = 300,
+    channel: int = 8,
+    dtype=torch.float32,
+    device="cpu",
+):
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    idx = torch.randint(0, num_voxels, (num_points,), device=device).int()
+    # voxels without points are skipped by the caller
+    idx = torch.unique(idx, return_inverse=True)[1].int()
+    num_voxels = int(idx.max()) + 1
+    counts = torch.bincount(idx, minlength=num_voxels).int()
+    feats = torch.randn(num_points, channel, device=device, dtype=dtype)
+    feats.requires_grad_()
+    ref_feats = feats.detach().double().requires_grad_()
+
+    output = F.spvoxelize(feats, idx, counts)
+    ref_output = torch.zeros(num_voxels, channel, device=device, dtype=torch.double)
+    ref_output = ref_output.index_add(0, idx.long(), ref_feats)
+    ref_output = ref_output / counts.unsqueeze(1)
+
+    grad_output = torch.randn_like(ref_output)
+    (output * grad_output.to(dtype)).sum().backward()
+    (ref_output * grad_output).sum().backward()
+
+    max_adiff = torch.max(torch.abs(output.double() - ref_output)).item()
+    max_grad_adiff = torch.max(torch.abs(feats.grad.double() - ref_feats.grad)).item()
+    return max_adiff, max_grad_adiff
+
+
+def test_devoxelize_forward(
+    num_points: int = 2000,
+    num_voxels: int = 300,
+    channel: int = 8,
+    dtype=torch.float32,
+    device="cpu",
+):
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    # trilinear neighbors of every point, -1 for missing ones
+    idx = torch.randint(0, num_voxels, (num_points, 8), device=device).int()
+    idx[torch.rand(num_points, 8, device=device) < 0.3] = -1
+    weights = torch.rand(num_points, 8, device=device, dtype=dtype)
+    weights[idx == -1] = 0
+    feats = torch.randn(num_voxels, channel, device=device, dtype=dtype)
+    feats.requires_grad_()
+    ref_feats = feats.detach().double().requires_grad_()
+
+    output = F.spdevoxelize(feats, idx, weights)
+    valid = (idx >= 0).unsqueeze(-1)
+    ref_output = ref_feats[idx.long().clamp(min=0)] * valid
+    ref_output = (ref_output * weights.double().unsqueeze(-1)).sum(1)
+
+    grad_output = torch.randn_like(ref_output)
+    (output * grad_output.to(dtype)).sum().backward()
+    (ref_output * grad_output).sum().backward()
+
+    max_adiff = torch.max(torch.abs(output.double() - ref_output)).item()
+    max_grad_adiff = torch.max(torch.abs(feats.grad.double() - ref_feats.grad)).item()
+    return max_adiff, max_grad_adiff
+
+
+if __name__ == "__main__":
+    print(test_voxelize_forward())
+    print(test_devoxelize_forward())
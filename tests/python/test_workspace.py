@@ -0,0 +1,62 @@
+import numpy as np
+import torch
+
+import torchsparse.backends
+from torchsparse import nn as spnn
+from torchsparse.backends import Workspace
+from torchsparse.nn import functional as F
+
+from .test_kmap_reuse import random_sparse_tensor
+
+__all__ = ["test_workspace_reuse", "test_workspace_forward"]
+
+
+def test_workspace_reuse():
+    """Stats of a workspace with room for 1 KiB after three requests of the
+    same size and one over the limit, and whether the buffer of the first
+    request was kept through the one over the limit.
+    """
+    workspace = Workspace(max_bytes=1024)
+    device = torch.device("cpu")
+    data_ptr = workspace.get(64, torch.float32, device).data_ptr()
+    for _ in range(2):
+        workspace.get(64, torch.float32, device)
+    overflow = workspace.get(512, torch.float32, device)
+    stats = workspace.stats()
+    retained = (
+        overflow.data_ptr() != data_ptr
+        and workspace.get(64, torch.float32, device).data_ptr() == data_ptr
+    )
+    return stats, retained
+
+
+def test_workspace_forward(channels: int = 8, device="cpu"):
+    """Buffers allocated by the workspace in the first and in the second of
+    two gather-scatter forward passes.
+    """
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    config = F.conv_config.get_default_conv_config().copy()
+    config.dataflow = F.Dataflow.GatherScatter
+    conv = spnn.Conv3d(channels, channels, 3, config=config).to(device)
+    input = random_sparse_tensor(channels=channels, device=device)
+
+    workspace = torchsparse.backends.workspace
+    torchsparse.backends.workspace = Workspace()
+    num_allocs = []
+    try:
+        with torch.no_grad():
+            for _ in range(2):
+                torchsparse.backends.workspace.reset_stats()
+                conv(input)
+                num_allocs.append(torchsparse.backends.workspace.num_allocs)
+    finally:
+        torchsparse.backends.workspace = workspace
+    return num_allocs
+
+
+if __name__ == "__main__":
+    print(test_workspace_reuse())
+    print(test_workspace_forward())
@@ -1,8 +1,33 @@
 import unittest
+import torch
 from torchsparse.nn import functional as F
 from python import (
     test_single_layer_convolution_forward,
+    test_single_layer_convolution_backward,
     test_to_dense_forward,
+    test_hashtable_forward,
+    test_sphashquery_offsets_forward,
+    test_packed_keys_out_of_range_forward,
+    test_spdownsample_forward,
+    test_voxelize_forward,
+    test_devoxelize_forward,
+    test_hash_key_modes_forward,
+    test_mixed_kmap_modes_forward,
+    test_compact_kmaps_forward,
+    test_transposed_kmap_reuse_forward,
+    test_lazy_backward_maps_forward,
+    test_tensor_cache_eviction,
+    test_tensor_cache_pinning,
+    test_global_tensor_cache_forward,
+    test_tensor_cache_file,
+    test_coords_fingerprint,
+    test_kmap_cache_forward,
+    test_update_tensor_cache_forward,
+    test_sub_kernel_map_forward,
+    test_plan_forward,
+    test_plan_collate_forward,
+    test_workspace_reuse,
+    test_workspace_forward,
 )
 
 
@@ -40,12 +65,401 @@ class SparseConvTestCase(unittest.TestCase):
         self.assertLessEqual(acc_adiff / count, 1e-4)
         self.assertLessEqual(acc_rdiff / count, 1e-2)
 
+    def test_single_layer_cpu(self):
+        kernel_sizes = [2, 3, 5]
+        strides = [1, 2, 3]
+        acc_adiff = 0.0
+        acc_rdiff = 0.0
+        count = 0
+
+        for dataflow, flag in [
+            (F.Dataflow.ImplicitGEMM, False),
+            (F.Dataflow.ImplicitGEMM, True),
+            (F.Dataflow.FetchOnDemand, False),
+            (F.Dataflow.FetchOnDemand, True),
+            (F.Dataflow.GatherScatter, False),
+        ]:
+            config = F.conv_config.get_default_conv_config()
+            config.dataflow = dataflow
+            config.ifsort = flag
+            config.FOD_fusion = flag
+            F.conv_config.set_global_conv_config(config)
+            for kernel_size in kernel_sizes:
+                for stride in strides:
+                    mean_adiff, max_rdiff = test_single_layer_convolution_forward(
+                        kernel_size=kernel_size,
+                        stride=stride,
+                        device="cpu",
+                        is_half=False,
+                    )
+                    acc_adiff += mean_adiff
+                    acc_rdiff += max_rdiff
+                    count += 1
+        F.conv_config.clear_global_conv_config()
+
+        self.assertLessEqual(acc_adiff / count, 1e-4)
+        self.assertLessEqual(acc_rdiff / count, 1e-2)
+
+    def test_single_layer_backward_cpu(self):
+        kernel_sizes = [2, 3, 5]
+        strides = [1, 2, 3]
+
+        for dataflow in [F.Dataflow.ImplicitGEMM, F.Dataflow.GatherScatter]:
+            config = F.conv_config.get_default_conv_config(training=True)
+            config.dataflow = dataflow
+            F.conv_config.set_global_conv_config(config)
+            for kernel_size in kernel_sizes:
+                for stride in strides:
+                    (
+                        grad_feats_rdiff,
+                        grad_kernel_rdiff,
+                    ) = test_single_layer_convolution_backward(
+                        batch_size=2,
+                        shape=10,
+                        num_points=300,
+                        kernel_size=kernel_size,
+                        stride=stride,
+                        device="cpu",
+                    )
+                    self.assertLessEqual(grad_feats_rdiff, 1e-4)
+                    self.assertLessEqual(grad_kernel_rdiff, 1e-4)
+        F.conv_config.clear_global_conv_config()
+
+    def test_single_layer_on_the_fly_cpu(self):
+        kernel_sizes = [2, 3, 5]
+        strides = [1, 2, 3]
+        acc_adiff = 0.0
+        acc_rdiff = 0.0
+        count = 0
+
+        for dataflow in [
+            F.Dataflow.ImplicitGEMM,
+            F.Dataflow.GatherScatter,
+            F.Dataflow.FetchOnDemand,
+        ]:
+            for with_spatial_range in [False, True]:
+                config = F.conv_config.get_default_conv_config()
+                config.kmap_mode = "hashmap_on_the_fly"
+                config.dataflow = dataflow
+                F.conv_config.set_global_conv_config(config)
+                for kernel_size in kernel_sizes:
+                    for stride in strides:
+                        mean_adiff, max_rdiff = test_single_layer_convolution_forward(
+                            kernel_size=kernel_size,
+                            stride=stride,
+                            device="cpu",
+                            is_half=False,
+                            with_spatial_range=with_spatial_range,
+                        )
+                        acc_adiff += mean_adiff
+                        acc_rdiff += max_rdiff
+                        count += 1
+        F.conv_config.clear_global_conv_config()
+
+        self.assertLessEqual(acc_adiff / count, 1e-4)
+        self.assertLessEqual(acc_rdiff / count, 1e-2)
+
+    def test_single_layer_kmap_modes_cpu(self):
+        kernel_sizes = [2, 3, 5]
+        strides = [1, 2, 3]
+        acc_adiff = 0.0
+        acc_rdiff = 0.0
+        count = 0
+
+        for kmap_mode in ["sorted", "grid"]:
+            for dataflow in [
+                F.Dataflow.ImplicitGEMM,
+                F.Dataflow.GatherScatter,
+                F.Dataflow.FetchOnDemand,
+            ]:
+                config = F.conv_config.get_default_conv_config()
+                config.kmap_mode = kmap_mode
+                config.dataflow = dataflow
+                F.conv_config.set_global_conv_config(config)
+                for kernel_size in kernel_sizes:
+                    for stride in strides:
+                        mean_adiff, max_rdiff = test_single_layer_convolution_forward(
+                            kernel_size=kernel_size,
+                            stride=stride,
+                            device="cpu",
+                            is_half=False,
+                            with_spatial_range=True,
+                        )
+                        acc_adiff += mean_adiff
+                        acc_rdiff += max_rdiff
+                        count += 1
+        F.conv_config.clear_global_conv_config()
+
+        self.assertLessEqual(acc_adiff / count, 1e-4)
+        self.assertLessEqual(acc_rdiff / count, 1e-2)
+
+    def test_sub_kernel_maps_cpu(self):
+        for dataflow, ifsort, training in [
+            (F.Dataflow.ImplicitGEMM, False, False),
+            (F.Dataflow.ImplicitGEMM, False, True),
+            (F.Dataflow.ImplicitGEMM, True, False),
+            (F.Dataflow.ImplicitGEMM, True, True),
+            (F.Dataflow.GatherScatter, False, False),
+            (F.Dataflow.GatherScatter, False, True),
+            (F.Dataflow.FetchOnDemand, False, False),
+        ]:
+            # anisotropic kernels and sub-kernels
+            for kernel_size, sub_kernel_sizes in [
+                ((5, 5, 5), ((3, 3, 3), (1, 3, 5), (5, 1, 3))),
+                ((3, 5, 1), ((1, 3, 1), (3, 1, 1))),
+            ]:
+                num_mismatches, max_adiff, num_built = test_sub_kernel_map_forward(
+                    kernel_size,
+                    sub_kernel_sizes,
+                    dataflow=dataflow,
+                    ifsort=ifsort,
+                    training=training,
+                    device="cpu",
+                )
+                self.assertEqual(num_mismatches, 0)
+                self.assertLessEqual(max_adiff, 1e-5)
+                self.assertEqual(num_built, 0)
+
+    def test_mixed_kmap_modes_cpu(self):
+        # layers of different kmap modes share the tensor cache of a stride
+        max_adiff = test_mixed_kmap_modes_forward(device="cpu")
+        self.assertLessEqual(max_adiff, 1e-5)
+
+    def test_transposed_kmap_reuse_cpu(self):
+        # one transposed map per setting, added next to the forward one
+        num_calls, num_transposed, unchanged = test_transposed_kmap_reuse_forward(
+            device="cpu"
+        )
+        self.assertEqual(num_calls, 3)
+        self.assertEqual(num_transposed, 3)
+        self.assertTrue(unchanged)
+
+    def test_lazy_backward_maps_cpu(self):
+        for ifsort in [False, True]:
+            pending, frozen_pending, computed, max_adiff = (
+                test_lazy_backward_maps_forward(ifsort=ifsort, device="cpu")
+            )
+            # backward maps are only computed by a backward pass that reads them
+            self.assertTrue(pending)
+            self.assertTrue(frozen_pending)
+            self.assertTrue(computed)
+            self.assertLessEqual(max_adiff, 1e-5)
+
+    def test_compact_kmaps_cpu(self):
+        for dataflow in [
+            F.Dataflow.ImplicitGEMM,
+            F.Dataflow.GatherScatter,
+            F.Dataflow.FetchOnDemand,
+        ]:
+            for training in [False, True]:
+                self.assertTrue(
+                    test_compact_kmaps_forward(dataflow, training, device="cpu")
+                )
+
 
 class ToDenseTestCase(unittest.TestCase):
     def test_to_dense(self):
         max_adiff = test_to_dense_forward()
         self.assertLessEqual(max_adiff, 1e-5)
 
+    def test_to_dense_cpu(self):
+        for channels_first in [False, True]:
+            max_adiff = test_to_dense_forward(
+                batch_size=2,
+                num_points=10,
+                device="cpu",
+                channels_first=channels_first,
+            )
+            self.assertLessEqual(max_adiff, 1e-5)
+
+
+class HashTableTestCase(unittest.TestCase):
+    def test_hashtable_cpu(self):
+        for packed in [False, True]:
+            for kernel_size, stride in [
+                (2, 1),
+                (3, 1),
+                (5, 1),
+                ((1, 3, 3), 1),
+                (2, 2),
+                (3, 2),
+            ]:
+                num_mismatches = test_hashtable_forward(
+                    kernel_size=kernel_size,
+                    stride=stride,
+                    packed=packed,
+                    device="cpu",
+                )
+                self.assertEqual(num_mismatches, 0)
+
+    def test_packed_keys_out_of_range_cpu(self):
+        # coordinates outside of the packed range are never found
+        num_mismatches = test_packed_keys_out_of_range_forward(device="cpu")
+        self.assertEqual(num_mismatches, 0)
+
+    def test_sphashquery_offsets_cpu(self):
+        for packed in [False, True]:
+            for kernel_size in [2, 3, (1, 3, 5)]:
+                num_mismatches = test_sphashquery_offsets_forward(
+                    kernel_size=kernel_size, packed=packed, device="cpu"
+                )
+                self.assertEqual(num_mismatches, 0)
+
+    def test_hash_key_modes_cpu(self):
+        # every layer probes the cached hash table with its own key scheme
+        max_adiff = test_hash_key_modes_forward(device="cpu")
+        self.assertLessEqual(max_adiff, 1e-5)
+
+
+class DownsampleTestCase(unittest.TestCase):
+    def test_spdownsample_cpu(self):
+        # kernel sizes that differ from the stride take the spconv path
+        for kernel_size, stride in [
+            (3, 2),
+            (5, 2),
+            (5, 3),
+            (4, 2),
+            ((3, 1, 3), (2, 1, 2)),
+        ]:
+            num_mismatches = test_spdownsample_forward(
+                kernel_size=kernel_size, stride=stride, device="cpu"
+            )
+            self.assertEqual(num_mismatches, 0)
+
+
+class PlanTestCase(unittest.TestCase):
+    def test_plan_cpu(self):
+        for kmap_mode in ["hashmap", "hashmap_on_the_fly", "sorted", "grid"]:
+            for dataflow in [
+                F.Dataflow.ImplicitGEMM,
+                F.Dataflow.GatherScatter,
+                F.Dataflow.FetchOnDemand,
+            ]:
+                config = F.conv_config.get_default_conv_config()
+                config.kmap_mode = kmap_mode
+                config.dataflow = dataflow
+                F.conv_config.set_global_conv_config(config)
+                # the forward pass finds every kernel map in the tensor cache
+                max_adiff, num_misses = test_plan_forward(device="cpu")
+                self.assertLessEqual(max_adiff, 1e-5)
+                self.assertEqual(num_misses, 0)
+        F.conv_config.clear_global_conv_config()
+
+    def test_plan_collate_cpu(self):
+        for kmap_mode in ["hashmap", "hashmap_on_the_fly", "sorted", "grid"]:
+            config = F.conv_config.get_default_conv_config()
+            config.kmap_mode = kmap_mode
+            F.conv_config.set_global_conv_config(config)
+            # the merged cache holds the kernel maps of the batch
+            max_adiff, num_built = test_plan_collate_forward(device="cpu")
+            self.assertLessEqual(max_adiff, 1e-5)
+            self.assertEqual(num_built, 0)
+        F.conv_config.clear_global_conv_config()
+
+
+class TensorCacheTestCase(unittest.TestCase):
+    def test_tensor_cache_eviction_cpu(self):
+        keys, stats = test_tensor_cache_eviction()
+        self.assertEqual(keys, ["c", "d", "e", "f"])
+        self.assertEqual(
+            stats,
+            {"nbytes": 768, "num_hits": 1, "num_misses": 1, "num_evictions": 2},
+        )
+
+    def test_tensor_cache_pinning_cpu(self):
+        # pinned while the graph is alive, released by backward or by gc
+        num_pins = test_tensor_cache_pinning(device="cpu")
+        self.assertEqual(num_pins, [1, 0, 0])
+
+    def test_global_tensor_cache_cpu(self):
+        max_adiff = test_global_tensor_cache_forward(device="cpu")
+        self.assertLessEqual(max_adiff, 1e-5)
+
+    def test_tensor_cache_file_cpu(self):
+        max_adiff, num_built, (nbytes, num_kmaps, max_bytes) = test_tensor_cache_file()
+        self.assertLessEqual(max_adiff, 1e-5)
+        self.assertEqual(num_built, 0)
+        # tensors are accounted by their own size, not that of the file
+        self.assertLessEqual(nbytes, max_bytes)
+        self.assertGreater(num_kmaps, 0)
+
+
+class WorkspaceTestCase(unittest.TestCase):
+    def test_workspace_reuse_cpu(self):
+        stats, retained = test_workspace_reuse()
+        self.assertEqual(
+            stats,
+            {
+                "high_water_mark": 256,
+                "num_allocs": 1,
+                "num_hits": 2,
+                "num_overflows": 1,
+            },
+        )
+        # requests over max_bytes do not replace the retained buffer
+        self.assertTrue(retained)
+
+    def test_workspace_cpu(self):
+        num_allocs = test_workspace_forward(device="cpu")
+        self.assertGreater(num_allocs[0], 0)
+        self.assertEqual(num_allocs[1], 0)
+
+
+class KernelMapCacheTestCase(unittest.TestCase):
+    def test_coords_fingerprint_cpu(self):
+        same, changed, forgotten = test_coords_fingerprint()
+        self.assertTrue(same)
+        self.assertTrue(changed)
+        self.assertTrue(forgotten)
+
+    def test_kmap_cache(self):
+        # kernel maps built on the CPU are not handed to CUDA inputs
+        max_adiff, stats = test_kmap_cache_forward(devices=("cpu", "cuda:0", "cuda:0"))
+        self.assertLessEqual(max_adiff, 1e-4)
+        self.assertEqual(stats["num_misses"], 6)
+        self.assertEqual(stats["num_hits"], 3)
+
+    def test_kmap_cache_cpu(self):
+        max_adiff, stats = test_kmap_cache_forward(devices=("cpu", "cpu"))
+        self.assertLessEqual(max_adiff, 1e-5)
+        self.assertEqual(stats["num_misses"], 3)
+        self.assertEqual(stats["num_hits"], 3)
+
+
+class UpdateTensorCacheTestCase(unittest.TestCase):
+    def test_update_tensor_cache_cpu(self):
+        # patched kernel maps match the ones built for the new coordinates
+        num_mismatches, max_adiff, rejected = test_update_tensor_cache_forward(
+            device="cpu"
+        )
+        self.assertEqual(num_mismatches, 0)
+        self.assertLessEqual(max_adiff, 1e-5)
+        self.assertTrue(rejected)
+
+
+class VoxelizeTestCase(unittest.TestCase):
+    # reduced types accumulate in fp32 but round their inputs and outputs
+    tolerances = {
+        torch.float64: 1e-10,
+        torch.float32: 1e-5,
+        torch.float16: 1e-2,
+        torch.bfloat16: 1e-1,
+    }
+
+    def test_voxelize_cpu(self):
+        for dtype, tolerance in self.tolerances.items():
+            max_adiff, max_grad_adiff = test_voxelize_forward(dtype=dtype, device="cpu")
+            self.assertLessEqual(max_adiff, tolerance)
+            self.assertLessEqual(max_grad_adiff, tolerance)
+
+    def test_devoxelize_cpu(self):
+        for dtype, tolerance in self.tolerances.items():
+            max_adiff, max_grad_adiff = test_devoxelize_forward(
+                dtype=dtype, device="cpu"
+            )
+            self.assertLessEqual(max_adiff, tolerance)
+            self.assertLessEqual(max_grad_adiff, tolerance)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,6 +2,7 @@ import torchsparse.backends as backends
 
 from .operators import *
 from .tensor import *
+from .utils.plan import plan
 from .utils.tune import tune
 from .version import __version__
 
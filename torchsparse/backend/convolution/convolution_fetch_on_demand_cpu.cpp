@@ -0,0 +1,206 @@
+#include "convolution_fetch_on_demand_cpu.h"
+
+#include <ATen/OpMathType.h>
+#include <ATen/Parallel.h>
+#include <torch/extension.h>
+
+#include <algorithm>
+#include <cstring>
+
+#include "convolution_gather_scatter_cpu.h"
+
+// CPU engine for the Fetch-on-Demand dataflow. It consumes the same
+// (2, sum_nnz) neighbor_map as the CUDA kernels, where the pairs of kernel
+// offset k occupy [neighbor_address[k], neighbor_address[k + 1]). Within one
+// offset every output row appears at most once, so the pairs of an offset
+// can be split across threads without synchronization; offsets are visited
+// one after another. Partial sums are kept in the accumulation type
+// (float for half / bfloat16) and cast back once at the end.
+
+#define cta_M 128
+
+namespace {
+
+// out[out_map[p]] += in[in_map[p]] @ weight for every pair p in [begin, end).
+// The input row is read straight from in_feat and the product is accumulated
+// into the output row, so no gathered copy of the features is ever formed.
+template <typename scalar_t, typename acc_t>
+void fetch_on_demand_rows(const scalar_t *in_feat, const acc_t *weight,
+                          const int *in_map, const int *out_map, int begin,
+                          int end, int in_channel, int out_channel,
+                          acc_t *out_feat) {
+  for (int p = begin; p < end; p++) {
+    const scalar_t *in_row = in_feat + (int64_t)in_map[p] * in_channel;
+    acc_t *out_row = out_feat + (int64_t)out_map[p] * out_channel;
+    for (int c = 0; c < in_channel; c++) {
+      acc_t a = static_cast<acc_t>(in_row[c]);
+      const acc_t *w = weight + (int64_t)c * out_channel;
+#pragma omp simd
+      for (int j = 0; j < out_channel; j++) {
+        out_row[j] += a * w[j];
+      }
+    }
+  }
+}
+
+template <typename scalar_t>
+void fetch_on_demand_cpu_template(const at::Tensor &in_feat,
+                                  const at::Tensor &kernel,
+                                  const int *in_map, const int *out_map,
+                                  const int *kpos, const int *qkpos,
+                                  at::Tensor &out_feat) {
+  using acc_t = at::opmath_type<scalar_t>;
+  int in_channel = in_feat.size(1);
+  int out_channel = kernel.size(2);
+  int k_vol = kernel.size(0);
+  const scalar_t *in_ptr = in_feat.data_ptr<scalar_t>();
+  at::Tensor kernel_acc = kernel.to(out_feat.scalar_type()).contiguous();
+  const acc_t *kernel_ptr = kernel_acc.data_ptr<acc_t>();
+  acc_t *out_ptr = out_feat.data_ptr<acc_t>();
+
+  for (int k = 0; k < k_vol; k++) {
+    int begin = kpos[k];
+    int end = kpos[k + 1];
+    int n_blocks = (qkpos[k + 1] - qkpos[k]) / cta_M;
+    if (begin == end) continue;
+    const acc_t *weight = kernel_ptr + (int64_t)k * in_channel * out_channel;
+    // one task per quantified block of cta_M pairs, as in the CUDA kernel
+    at::parallel_for(0, n_blocks, 1, [&](int64_t b_begin, int64_t b_end) {
+      fetch_on_demand_rows<scalar_t, acc_t>(
+          in_ptr, weight, in_map, out_map, begin + b_begin * cta_M,
+          std::min(end, (int)(begin + b_end * cta_M)), in_channel,
+          out_channel, out_ptr);
+    });
+  }
+}
+
+template <typename scalar_t>
+void fetch_on_demand_no_fusion_cpu_template(
+    const at::Tensor &in_feat, const at::Tensor &kernel, const int *in_map,
+    const int *out_map, const int *knnz, at::Tensor &workspace,
+    at::Tensor &out_feat) {
+  using acc_t = at::opmath_type<scalar_t>;
+  int in_channel = in_feat.size(1);
+  int out_channel = kernel.size(2);
+  int k_vol = kernel.size(0);
+  int buffer_size = std::max(*std::max_element(knnz, knnz + k_vol), 1);
+  int64_t in_buffer_numel = (int64_t)buffer_size * in_channel;
+  int64_t out_buffer_numel = (int64_t)buffer_size * out_channel;
+  at::Tensor buffer = borrow_workspace(
+      workspace, in_buffer_numel + out_buffer_numel, in_feat.options());
+  at::Tensor in_buffer =
+      buffer.narrow(0, 0, in_buffer_numel).view({buffer_size, in_channel});
+  at::Tensor out_buffer = buffer.narrow(0, in_buffer_numel, out_buffer_numel)
+                              .view({buffer_size, out_channel});
+  const scalar_t *in_ptr = in_feat.data_ptr<scalar_t>();
+  acc_t *out_ptr = out_feat.data_ptr<acc_t>();
+
+  int cur_idx = 0;
+  for (int k = 0; k < k_vol; k++) {
+    int cur_nnz = knnz[k];
+    if (cur_nnz == 0) continue;
+    const int *cur_in_map = in_map + cur_idx;
+    const int *cur_out_map = out_map + cur_idx;
+    at::Tensor in_buffer_activated = in_buffer.narrow(0, 0, cur_nnz);
+    at::Tensor out_buffer_activated = out_buffer.narrow(0, 0, cur_nnz);
+    scalar_t *in_buffer_ptr = in_buffer_activated.data_ptr<scalar_t>();
+    scalar_t *out_buffer_ptr = out_buffer_activated.data_ptr<scalar_t>();
+
+    // gather
+    at::parallel_for(0, cur_nnz, cta_M, [&](int64_t begin, int64_t end) {
+      for (int64_t p = begin; p < end; p++) {
+        std::memcpy(in_buffer_ptr + p * in_channel,
+                    in_ptr + (int64_t)cur_in_map[p] * in_channel,
+                    in_channel * sizeof(scalar_t));
+      }
+    });
+
+    // matmul
+    torch::mm_out(out_buffer_activated, in_buffer_activated, kernel[k]);
+
+    // scatter
+    at::parallel_for(0, cur_nnz, cta_M, [&](int64_t begin, int64_t end) {
+      for (int64_t p = begin; p < end; p++) {
+        const scalar_t *src = out_buffer_ptr + p * out_channel;
+        acc_t *dst = out_ptr + (int64_t)cur_out_map[p] * out_channel;
+#pragma omp simd
+        for (int j = 0; j < out_channel; j++) {
+          dst[j] += static_cast<acc_t>(src[j]);
+        }
+      }
+    });
+    cur_idx += cur_nnz;
+  }
+}
+
+at::ScalarType get_acc_type(at::ScalarType type) {
+  return (type == at::ScalarType::Half || type == at::ScalarType::BFloat16)
+             ? at::ScalarType::Float
+             : type;
+}
+
+}  // namespace
+
+// in_feat: (N, c) N=# of input points, c = input channels
+// kernel: (k^3, c, c') k = kernel size, c' = output channels
+// neighbor_map: (2, sum_nnz) where neighbor_map[0] holds the input indices
+//               and neighbor_map[1] the output indices, grouped by offset
+// neighbor_address / q_neighbor_address: (k^3 + 1) exclusive scans of the
+//               per-offset pair counts, plain and quantified to 128
+at::Tensor conv_forward_fetch_on_demand_cpu(
+    at::Tensor in_feat, at::Tensor kernel, at::Tensor neighbor_map,
+    const int sum_nnz, at::Tensor neighbor_address,
+    at::Tensor q_neighbor_address, const int output_size, const int qsum_nnz,
+    const bool transpose) {
+  if (in_feat.size(1) != kernel.size(1)) {
+    throw std::invalid_argument("Input feature size and kernel size mismatch");
+  }
+  in_feat = in_feat.contiguous();
+  kernel = kernel.contiguous();
+  neighbor_map = neighbor_map.contiguous();
+  const int *map_ptr = neighbor_map.data_ptr<int>();
+  const int *in_map_ptr = transpose ? map_ptr + sum_nnz : map_ptr;
+  const int *out_map_ptr = transpose ? map_ptr : map_ptr + sum_nnz;
+
+  at::Tensor out_feat = torch::zeros(
+      {output_size, kernel.size(2)},
+      in_feat.options().dtype(get_acc_type(in_feat.scalar_type())));
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, in_feat.scalar_type(),
+      "conv_forward_fetch_on_demand_cpu", [&] {
+        fetch_on_demand_cpu_template<scalar_t>(
+            in_feat, kernel, in_map_ptr, out_map_ptr,
+            neighbor_address.data_ptr<int>(),
+            q_neighbor_address.data_ptr<int>(), out_feat);
+      });
+  return out_feat.to(in_feat.scalar_type());
+}
+
+// neighbor_offset: (k^3) count of active pairs per kernel offset
+at::Tensor conv_forward_fetch_on_demand_no_fusion_cpu(
+    at::Tensor in_feat, at::Tensor kernel, at::Tensor neighbor_map,
+    at::Tensor neighbor_offset, const int sum_nnz, const int output_size,
+    const bool transpose, at::Tensor workspace) {
+  if (in_feat.size(1) != kernel.size(1)) {
+    throw std::invalid_argument("Input feature size and kernel size mismatch");
+  }
+  in_feat = in_feat.contiguous();
+  kernel = kernel.contiguous();
+  neighbor_map = neighbor_map.contiguous();
+  neighbor_offset = neighbor_offset.to(at::ScalarType::Int).contiguous();
+  const int *map_ptr = neighbor_map.data_ptr<int>();
+  const int *in_map_ptr = transpose ? map_ptr + sum_nnz : map_ptr;
+  const int *out_map_ptr = transpose ? map_ptr : map_ptr + sum_nnz;
+
+  at::Tensor out_feat = torch::zeros(
+      {output_size, kernel.size(2)},
+      in_feat.options().dtype(get_acc_type(in_feat.scalar_type())));
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, in_feat.scalar_type(),
+      "conv_forward_fetch_on_demand_no_fusion_cpu", [&] {
+        fetch_on_demand_no_fusion_cpu_template<scalar_t>(
+            in_feat, kernel, in_map_ptr, out_map_ptr,
+            neighbor_offset.data_ptr<int>(), workspace, out_feat);
+      });
+  return out_feat.to(in_feat.scalar_type());
+}
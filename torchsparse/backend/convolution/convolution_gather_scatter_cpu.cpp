@@ -5,17 +5,27 @@
 #include <algorithm>
 #include <chrono>
 
+// Pairs are split across threads and the channels of each row are
+// vectorized. The pairs passed in always belong to a single kernel offset,
+// and within one offset every input and every output appears at most once,
+// so concurrent scatters never touch the same row. Small problems stay
+// single-threaded since a parallel region costs more than the copy.
+#define min_parallel_work 16384
+
 void scatter_cpu(const int n_in, const int n_out, const int c,
                  const float *in_feat, float *out_feat, const int *kmap,
                  const bool transpose) {
+#pragma omp parallel for schedule(static) if ((int64_t)n_in * c > min_parallel_work)
   for (int i = 0; i < n_in; i++) {
     int out_pos = kmap[2 * i + 1 - transpose];
     if (out_pos < 0) {
       continue;
     }
-#pragma omp parallel for
+    const float *src = in_feat + (int64_t)i * c;
+    float *dst = out_feat + (int64_t)out_pos * c;
+#pragma omp simd
     for (int j = 0; j < c; j++) {
-      out_feat[out_pos * c + j] += in_feat[i * c + j];
+      dst[j] += src[j];
     }
   }
 }
@@ -23,21 +33,38 @@ void scatter_cpu(const int n_in, const int n_out, const int c,
 void gather_cpu(const int n_k, const int n_in, const int c,
                 const float *in_feat, float *out_feat, const int *kmap,
                 const bool transpose) {
+#pragma omp parallel for schedule(static) if ((int64_t)n_k * c > min_parallel_work)
   for (int i = 0; i < n_k; i++) {
     int in_pos = kmap[2 * i + transpose];
     if (in_pos < 0) {
       continue;
     }
-#pragma omp parallel for
+    const float *src = in_feat + (int64_t)in_pos * c;
+    float *dst = out_feat + (int64_t)i * c;
+#pragma omp simd
     for (int j = 0; j < c; j++) {
-      out_feat[i * c + j] = in_feat[in_pos * c + j];
+      dst[j] = src[j];
     }
   }
 }
 
+// Scratch memory of at least numel elements. The workspace tensor passed
+// from Python (torchsparse.backends.workspace) is used when it is large
+// enough; otherwise a fresh buffer is allocated. Contents are undefined.
+at::Tensor borrow_workspace(at::Tensor workspace, int64_t numel,
+                            torch::TensorOptions options) {
+  if (workspace.defined() && workspace.is_contiguous() &&
+      workspace.scalar_type() == options.dtype().toScalarType() &&
+      workspace.device() == options.device() && workspace.numel() >= numel) {
+    return workspace.view({-1}).narrow(0, 0, numel);
+  }
+  return torch::empty({numel}, options);
+}
+
 void conv_forward_gather_scatter_cpu(at::Tensor in_feat, at::Tensor out_feat,
                              at::Tensor kernel, at::Tensor neighbor_map,
-                             at::Tensor neighbor_offset, const bool transpose) {
+                             at::Tensor neighbor_offset, const bool transpose,
+                             at::Tensor workspace) {
   if (in_feat.size(1) != kernel.size(1)) {
     throw std::invalid_argument("Input feature size and kernel size mismatch");
   }
@@ -71,8 +98,12 @@ void conv_forward_gather_scatter_cpu(at::Tensor in_feat, at::Tensor out_feat,
 
   auto options =
       torch::TensorOptions().dtype(in_feat.dtype()).device(in_feat.device());
-  auto in_buffer = torch::zeros({in_buffer_size, in_feat.size(1)}, options);
-  auto out_buffer = torch::zeros({in_buffer_size, kernel.size(2)}, options);
+  int64_t in_buffer_numel = (int64_t)in_buffer_size * in_feat.size(1);
+  int64_t out_buffer_numel = (int64_t)in_buffer_size * kernel.size(2);
+  auto buffer = borrow_workspace(workspace, in_buffer_numel + out_buffer_numel,
+                                 options);
+  auto in_buffer = buffer.narrow(0, 0, in_buffer_numel);
+  auto out_buffer = buffer.narrow(0, in_buffer_numel, out_buffer_numel);
   int cur_offset = 0;
   for (int i = 0; i < kernel_volume; i++) {
     if (flag && (i == kernel_volume / 2)) {
@@ -112,7 +143,7 @@ void conv_backward_gather_scatter_cpu(at::Tensor in_feat, at::Tensor grad_in_fea
                               at::Tensor grad_out_feat, at::Tensor kernel,
                               at::Tensor grad_kernel, at::Tensor neighbor_map,
                               at::Tensor neighbor_offset,
-                              const bool transpose) {
+                              const bool transpose, at::Tensor workspace) {
   grad_in_feat.resize_as_(in_feat);
   grad_in_feat.zero_();
   grad_kernel.resize_as_(kernel);
@@ -124,14 +155,18 @@ void conv_backward_gather_scatter_cpu(at::Tensor in_feat, at::Tensor grad_in_fea
   in_buffer_size =
       *std::max_element(neighbor_offset.data_ptr<int>(),
                         neighbor_offset.data_ptr<int>() + kernel_volume);
+  in_buffer_size = std::max(in_buffer_size, 1);
 
   auto options =
       torch::TensorOptions().dtype(in_feat.dtype()).device(in_feat.device());
-  auto in_buffer = torch::zeros({in_buffer_size, in_feat.size(1)}, options);
-  auto in_grad_buffer =
-      torch::zeros({in_buffer_size, in_feat.size(1)}, options);
+  int64_t in_buffer_numel = (int64_t)in_buffer_size * in_feat.size(1);
+  int64_t out_buffer_numel = (int64_t)in_buffer_size * kernel.size(2);
+  auto buffer = borrow_workspace(
+      workspace, 2 * in_buffer_numel + out_buffer_numel, options);
+  auto in_buffer = buffer.narrow(0, 0, in_buffer_numel);
+  auto in_grad_buffer = buffer.narrow(0, in_buffer_numel, in_buffer_numel);
   auto out_grad_buffer =
-      torch::zeros({in_buffer_size, kernel.size(2)}, options);
+      buffer.narrow(0, 2 * in_buffer_numel, out_buffer_numel);
 
   int cur_offset = 0;
   for (int i = 0; i < kernel_volume; i++) {
@@ -0,0 +1,325 @@
+#include "convolution_implicit_gemm_cpu.h"
+
+#include <ATen/Parallel.h>
+#include <torch/extension.h>
+
+#include <algorithm>
+#include <cstring>
+#include <mutex>
+#include <vector>
+
+// CPU engine for the ImplicitGEMM dataflow. It consumes the same out_in_map
+// (or reorder_out_in_map + reduced mask when sorted) as the CUDA kernels.
+// Output rows are processed in tiles: the neighbors of a tile are gathered
+// into an im2col block that stays in cache, and the whole tile is then
+// computed with a single GEMM over all (active) kernel offsets. at::parallel_for
+// is used instead of OpenMP pragmas so that the per-tile GEMMs run
+// single-threaded inside the parallel region.
+
+#define cta_M 128
+#define im2col_bytes (1 << 19)
+
+namespace {
+
+// Largest power-of-two tile (dividing the mask tile) whose im2col block
+// stays within im2col_bytes.
+int get_tile_rows(int64_t row_bytes, int mask_tile) {
+  int tile = mask_tile;
+  while (tile > 16 && tile * row_bytes > im2col_bytes) tile /= 2;
+  return tile;
+}
+
+// Kernel offsets in [col_begin, col_end) used by at least one row of the
+// tile. If the tile lies within one row block of the reduced bitmask, the
+// mask is used instead of scanning.
+void get_active_offsets(const int *out_in_map, int kernel_volume,
+                        int row_begin, int row_end, int col_begin,
+                        int col_end, const int *reduced_mask, int mask_tile,
+                        std::vector<int> &active) {
+  active.clear();
+  if (reduced_mask != nullptr && col_end - col_begin <= 32 &&
+      row_begin / mask_tile == (row_end - 1) / mask_tile) {
+    int mask = reduced_mask[row_begin / mask_tile];
+    for (int k = col_begin; k < col_end; k++) {
+      if (mask & (int)(1u << (k - col_begin))) active.push_back(k);
+    }
+    return;
+  }
+  for (int k = col_begin; k < col_end; k++) {
+    for (int row = row_begin; row < row_end; row++) {
+      if (out_in_map[row * kernel_volume + k] >= 0) {
+        active.push_back(k);
+        break;
+      }
+    }
+  }
+}
+
+// im2col: rows of `feats` selected by out_in_map, one block of c columns per
+// active offset, zeros for missing neighbors.
+template <typename scalar_t>
+void gather_im2col(const scalar_t *feats, int c, const int *out_in_map,
+                   int kernel_volume, int row_begin, int row_end,
+                   const std::vector<int> &active, scalar_t *im2col) {
+  int n_active = active.size();
+  for (int row = row_begin; row < row_end; row++) {
+    scalar_t *dst = im2col + (int64_t)(row - row_begin) * n_active * c;
+    for (int a = 0; a < n_active; a++) {
+      int idx = out_in_map[row * kernel_volume + active[a]];
+      if (idx >= 0) {
+        std::memcpy(dst + a * c, feats + (int64_t)idx * c,
+                    c * sizeof(scalar_t));
+      } else {
+        std::fill(dst + a * c, dst + (a + 1) * c, (scalar_t)0);
+      }
+    }
+  }
+}
+
+// out[row_loc[r]] += (im2col(r) @ kernel[active]) for all rows r < n_rows
+// whose destination is below num_out_feats. row_loc == nullptr means the
+// identity, in which case the GEMM writes the output slice in place.
+template <typename scalar_t>
+void implicit_gemm_forward_cpu_template(const at::Tensor &_in_feats,
+                                        const at::Tensor &_kernel,
+                                        const int *out_in_map, int n_rows,
+                                        int kernel_volume, int col_begin,
+                                        int col_end, const int *row_loc,
+                                        const int *reduced_mask, int mask_tile,
+                                        at::Tensor &_out_feats) {
+  int c = _in_feats.size(1);
+  int num_out_feats = _out_feats.size(0);
+  int num_out_channels = _out_feats.size(1);
+  const scalar_t *in_feats = _in_feats.data_ptr<scalar_t>();
+  scalar_t *out_feats = _out_feats.data_ptr<scalar_t>();
+  at::Tensor kernel_rows = _kernel.view({kernel_volume, -1});
+  if (row_loc == nullptr) n_rows = std::min(n_rows, num_out_feats);
+  int tile_rows = get_tile_rows(
+      (int64_t)(col_end - col_begin) * c * sizeof(scalar_t), mask_tile);
+  int n_tiles = (n_rows + tile_rows - 1) / tile_rows;
+
+  at::parallel_for(0, n_tiles, 1, [&](int64_t begin, int64_t end) {
+    at::Tensor im2col = at::empty({(int64_t)tile_rows * (col_end - col_begin) * c},
+                                  _in_feats.options());
+    std::vector<int> active;
+    for (int64_t tile = begin; tile < end; tile++) {
+      int row_begin = tile * tile_rows;
+      int row_end = std::min(row_begin + tile_rows, n_rows);
+      get_active_offsets(out_in_map, kernel_volume, row_begin, row_end,
+                         col_begin, col_end, reduced_mask, mask_tile, active);
+      if (active.empty()) continue;
+      int n_active = active.size();
+      gather_im2col<scalar_t>(in_feats, c, out_in_map, kernel_volume,
+                              row_begin, row_end, active,
+                              im2col.data_ptr<scalar_t>());
+      // the gathered block is packed with n_active * c columns
+      at::Tensor a = im2col
+                         .narrow(0, 0, (int64_t)(row_end - row_begin) * n_active * c)
+                         .view({row_end - row_begin, (int64_t)n_active * c});
+      at::Tensor b;
+      if (n_active == kernel_volume) {
+        b = _kernel.view({-1, num_out_channels});
+      } else {
+        b = kernel_rows
+                .index_select(0, torch::tensor(active, torch::dtype(torch::kInt)))
+                .view({-1, num_out_channels});
+      }
+      if (row_loc == nullptr) {
+        at::Tensor out = _out_feats.narrow(0, row_begin, row_end - row_begin);
+        at::mm_out(out, a, b);
+      } else {
+        at::Tensor result = at::mm(a, b);
+        const scalar_t *res = result.data_ptr<scalar_t>();
+        for (int row = row_begin; row < row_end; row++) {
+          int out_row = row_loc[row];
+          if (out_row < 0 || out_row >= num_out_feats) continue;
+          scalar_t *dst = out_feats + (int64_t)out_row * num_out_channels;
+          const scalar_t *src =
+              res + (int64_t)(row - row_begin) * num_out_channels;
+          for (int j = 0; j < num_out_channels; j++) dst[j] += src[j];
+        }
+      }
+    }
+  });
+}
+
+// grad_weight^T[k] += gather(in_feats, out_in_map[:, k])^T @ kernel[row_loc],
+// accumulated per thread and reduced at the end (the CPU analogue of
+// split-k). Returns the (K * c_in_feats, c_kernel) layout of the CUDA kernel.
+template <typename scalar_t>
+void implicit_gemm_wgrad_cpu_template(const at::Tensor &_in_feats,
+                                      const at::Tensor &_kernel,
+                                      const int *out_in_map, int n_rows,
+                                      int kernel_volume, int col_begin,
+                                      int col_end, const int *row_loc,
+                                      const int *reduced_mask, int mask_tile,
+                                      at::Tensor &_grad_weight) {
+  int c = _in_feats.size(1);
+  int c_kernel = _kernel.size(1);
+  int num_kernel_rows = _kernel.size(0);
+  const scalar_t *in_feats = _in_feats.data_ptr<scalar_t>();
+  const scalar_t *kernel = _kernel.data_ptr<scalar_t>();
+  if (row_loc == nullptr) n_rows = std::min(n_rows, num_kernel_rows);
+  int tile_rows = get_tile_rows(
+      (int64_t)((col_end - col_begin) * c + c_kernel) * sizeof(scalar_t),
+      mask_tile);
+  int n_tiles = (n_rows + tile_rows - 1) / tile_rows;
+  std::mutex reduce_mutex;
+
+  at::parallel_for(0, n_tiles, 1, [&](int64_t begin, int64_t end) {
+    at::Tensor im2col = at::empty({(int64_t)tile_rows * (col_end - col_begin) * c},
+                                  _in_feats.options());
+    at::Tensor rows = at::zeros({tile_rows, c_kernel}, _kernel.options());
+    at::Tensor acc = at::zeros_like(_grad_weight).view({kernel_volume, -1});
+    scalar_t *rows_ptr = rows.data_ptr<scalar_t>();
+    std::vector<int> active;
+    for (int64_t tile = begin; tile < end; tile++) {
+      int row_begin = tile * tile_rows;
+      int row_end = std::min(row_begin + tile_rows, n_rows);
+      get_active_offsets(out_in_map, kernel_volume, row_begin, row_end,
+                         col_begin, col_end, reduced_mask, mask_tile, active);
+      if (active.empty()) continue;
+      int n_active = active.size();
+      gather_im2col<scalar_t>(in_feats, c, out_in_map, kernel_volume,
+                              row_begin, row_end, active,
+                              im2col.data_ptr<scalar_t>());
+      for (int row = row_begin; row < row_end; row++) {
+        int kernel_row = row_loc == nullptr ? row : row_loc[row];
+        scalar_t *dst = rows_ptr + (int64_t)(row - row_begin) * c_kernel;
+        if (kernel_row >= 0 && kernel_row < num_kernel_rows) {
+          std::memcpy(dst, kernel + (int64_t)kernel_row * c_kernel,
+                      c_kernel * sizeof(scalar_t));
+        } else {
+          std::fill(dst, dst + c_kernel, (scalar_t)0);
+        }
+      }
+      // the gathered block is packed with n_active * c columns
+      at::Tensor a = im2col
+                         .narrow(0, 0, (int64_t)(row_end - row_begin) * n_active * c)
+                         .view({row_end - row_begin, (int64_t)n_active * c});
+      at::Tensor b = rows.narrow(0, 0, row_end - row_begin);
+      at::Tensor partial = at::mm(a.t(), b).view({n_active, -1});
+      acc.index_add_(0, torch::tensor(active, torch::dtype(torch::kLong)),
+                     partial.to(acc.scalar_type()));
+    }
+    std::lock_guard<std::mutex> lock(reduce_mutex);
+    _grad_weight.add_(acc.view_as(_grad_weight));
+  });
+}
+
+at::ScalarType get_accumulate_type(at::ScalarType type) {
+  return (type == at::kHalf || type == at::kBFloat16) ? at::kFloat : type;
+}
+
+}  // namespace
+
+at::Tensor conv_forward_implicit_gemm_cpu(torch::Tensor _in_feats,
+                                          torch::Tensor _kernel,
+                                          torch::Tensor _out_in_map,
+                                          int num_out_feats,
+                                          int num_out_channels) {
+  _in_feats = _in_feats.contiguous();
+  _kernel = _kernel.contiguous();
+  _out_in_map = _out_in_map.contiguous();
+  int kernel_volume = _out_in_map.size(1);
+  at::Tensor _out_feats =
+      torch::zeros({num_out_feats, num_out_channels}, _in_feats.options());
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::kHalf, at::kBFloat16, _in_feats.scalar_type(),
+      "conv_forward_implicit_gemm_cpu", ([&] {
+        implicit_gemm_forward_cpu_template<scalar_t>(
+            _in_feats, _kernel, _out_in_map.data_ptr<int>(),
+            _out_in_map.size(0), kernel_volume, 0, kernel_volume, nullptr,
+            nullptr, cta_M, _out_feats);
+      }));
+  return _out_feats;
+}
+
+at::Tensor conv_forward_implicit_gemm_sorted_cpu(
+    torch::Tensor _in_feats, torch::Tensor _kernel, torch::Tensor _out_in_map,
+    torch::Tensor _reduced_mask, torch::Tensor _reorder_loc,
+    int num_out_feats, int num_out_channels) {
+  _in_feats = _in_feats.contiguous();
+  _kernel = _kernel.contiguous();
+  _out_in_map = _out_in_map.contiguous();
+  int n_rows = _out_in_map.size(0);
+  int kernel_volume = _out_in_map.size(1);
+  int split_mask_num = _reorder_loc.size(0);
+  int split_mask_len = (kernel_volume + split_mask_num - 1) / split_mask_num;
+  int reduced_row_num = _reduced_mask.size(1);
+  int mask_tile = (n_rows + reduced_row_num - 1) / reduced_row_num;
+  const int *reduced_mask = _reduced_mask.data_ptr<int>();
+  const int *reorder_loc = _reorder_loc.data_ptr<int>();
+  at::Tensor _out_feats =
+      torch::zeros({num_out_feats, num_out_channels}, _in_feats.options());
+  // Each split of the kernel offsets has its own row order; every split
+  // writes each output row once, so splits are processed one after another.
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::kHalf, at::kBFloat16, _in_feats.scalar_type(),
+      "conv_forward_implicit_gemm_sorted_cpu", ([&] {
+        for (int s = 0; s < split_mask_num; s++) {
+          implicit_gemm_forward_cpu_template<scalar_t>(
+              _in_feats, _kernel, _out_in_map.data_ptr<int>(), n_rows,
+              kernel_volume, s * split_mask_len,
+              std::min((s + 1) * split_mask_len, kernel_volume),
+              reorder_loc + s * n_rows, reduced_mask + s * reduced_row_num,
+              mask_tile, _out_feats);
+        }
+      }));
+  return _out_feats;
+}
+
+at::Tensor conv_backward_wgrad_implicit_gemm_cpu(torch::Tensor _in_feats,
+                                                 torch::Tensor _kernel,
+                                                 torch::Tensor _out_in_map,
+                                                 int split_k_iters) {
+  _in_feats = _in_feats.contiguous();
+  _kernel = _kernel.contiguous();
+  _out_in_map = _out_in_map.contiguous();
+  int kernel_volume = _out_in_map.size(1);
+  at::Tensor _grad_weight = torch::zeros(
+      {kernel_volume * _in_feats.size(1), _kernel.size(1)},
+      _in_feats.options().dtype(get_accumulate_type(_in_feats.scalar_type())));
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::kHalf, at::kBFloat16, _in_feats.scalar_type(),
+      "conv_backward_wgrad_implicit_gemm_cpu", ([&] {
+        implicit_gemm_wgrad_cpu_template<scalar_t>(
+            _in_feats, _kernel, _out_in_map.data_ptr<int>(),
+            _out_in_map.size(0), kernel_volume, 0, kernel_volume, nullptr,
+            nullptr, cta_M / 2, _grad_weight);
+      }));
+  return _grad_weight.to(_in_feats.scalar_type());
+}
+
+at::Tensor conv_backward_wgrad_implicit_gemm_sorted_cpu(
+    torch::Tensor _in_feats, torch::Tensor _kernel, torch::Tensor _out_in_map,
+    torch::Tensor _reduced_mask, torch::Tensor _reorder_loc,
+    int split_k_iters) {
+  _in_feats = _in_feats.contiguous();
+  _kernel = _kernel.contiguous();
+  _out_in_map = _out_in_map.contiguous();
+  int n_rows = _out_in_map.size(0);
+  int kernel_volume = _out_in_map.size(1);
+  int split_mask_num = _reorder_loc.size(0);
+  int split_mask_len = (kernel_volume + split_mask_num - 1) / split_mask_num;
+  int reduced_row_num = _reduced_mask.size(1);
+  int mask_tile = (n_rows + reduced_row_num - 1) / reduced_row_num;
+  const int *reduced_mask = _reduced_mask.data_ptr<int>();
+  const int *reorder_loc = _reorder_loc.data_ptr<int>();
+  at::Tensor _grad_weight = torch::zeros(
+      {kernel_volume * _in_feats.size(1), _kernel.size(1)},
+      _in_feats.options().dtype(get_accumulate_type(_in_feats.scalar_type())));
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::kHalf, at::kBFloat16, _in_feats.scalar_type(),
+      "conv_backward_wgrad_implicit_gemm_sorted_cpu", ([&] {
+        for (int s = 0; s < split_mask_num; s++) {
+          implicit_gemm_wgrad_cpu_template<scalar_t>(
+              _in_feats, _kernel, _out_in_map.data_ptr<int>(), n_rows,
+              kernel_volume, s * split_mask_len,
+              std::min((s + 1) * split_mask_len, kernel_volume),
+              reorder_loc + s * n_rows, reduced_mask + s * reduced_row_num,
+              mask_tile, _grad_weight);
+        }
+      }));
+  return _grad_weight.to(_in_feats.scalar_type());
+}
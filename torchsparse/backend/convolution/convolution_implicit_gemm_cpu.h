@@ -0,0 +1,24 @@
+#pragma once
+
+#include <torch/torch.h>
+
+at::Tensor conv_forward_implicit_gemm_cpu(torch::Tensor _in_feats,
+                                          torch::Tensor _kernel,
+                                          torch::Tensor _out_in_map,
+                                          int num_out_feats,
+                                          int num_out_channels);
+
+at::Tensor conv_forward_implicit_gemm_sorted_cpu(
+    torch::Tensor _in_feats, torch::Tensor _kernel, torch::Tensor _out_in_map,
+    torch::Tensor _reduced_mask, torch::Tensor _reorder_loc,
+    int num_out_feats, int num_out_channels);
+
+at::Tensor conv_backward_wgrad_implicit_gemm_cpu(torch::Tensor _in_feats,
+                                                 torch::Tensor _kernel,
+                                                 torch::Tensor _out_in_map,
+                                                 int split_k_iters);
+
+at::Tensor conv_backward_wgrad_implicit_gemm_sorted_cpu(
+    torch::Tensor _in_feats, torch::Tensor _kernel, torch::Tensor _out_in_map,
+    torch::Tensor _reduced_mask, torch::Tensor _reorder_loc,
+    int split_k_iters);
@@ -1,9 +1,73 @@
 #include "devoxelize_cpu.h"
 
+#include <ATen/OpMathType.h>
+#include <ATen/Parallel.h>
 #include <torch/torch.h>
 
+#include <algorithm>
 #include <vector>
 
+#include "../others/segment_csr_cpu.h"
+
+// Trilinear devoxelization: every point reads 8 voxels. The forward pass is
+// a per-point gather. The backward pass is a scatter into the voxels; the
+// (point, corner) pairs are first grouped by voxel so that every voxel is
+// reduced by a single thread. Accumulation is done in fp32 for half and
+// bfloat16.
+
+template <typename scalar_t>
+void devoxelize_forward_kernel_cpu(int N, int c, const int *indices,
+                                   const at::opmath_type<scalar_t> *weight,
+                                   const scalar_t *feat, scalar_t *out) {
+  using acc_t = at::opmath_type<scalar_t>;
+  at::parallel_for(0, N, 256, [&](int64_t begin, int64_t end) {
+    std::vector<acc_t> acc(c);
+    for (int64_t i = begin; i < end; i++) {
+      const int *indices_ = indices + i * 8;
+      const acc_t *weight_ = weight + i * 8;
+      std::fill(acc.begin(), acc.end(), (acc_t)0);
+      for (int k = 0; k < 8; k++) {
+        if (indices_[k] < 0) continue;
+        const scalar_t *feat_ = feat + (int64_t)indices_[k] * c;
+        acc_t w = weight_[k];
+#pragma omp simd
+        for (int j = 0; j < c; j++) acc[j] += w * static_cast<acc_t>(feat_[j]);
+      }
+      scalar_t *out_ = out + i * c;
+#pragma omp simd
+      for (int j = 0; j < c; j++) out_[j] = static_cast<scalar_t>(acc[j]);
+    }
+  });
+}
+
+template <typename scalar_t>
+void devoxelize_backward_kernel_cpu(int n, int c, const int64_t *order,
+                                    const int64_t *row_ptr,
+                                    const at::opmath_type<scalar_t> *weight,
+                                    const scalar_t *top_grad,
+                                    scalar_t *bottom_grad) {
+  using acc_t = at::opmath_type<scalar_t>;
+  at::parallel_for(0, n, 64, [&](int64_t begin, int64_t end) {
+    std::vector<acc_t> acc(c);
+    for (int64_t v = begin; v < end; v++) {
+      if (row_ptr[v] == row_ptr[v + 1]) continue;
+      std::fill(acc.begin(), acc.end(), (acc_t)0);
+      for (int64_t e = row_ptr[v]; e < row_ptr[v + 1]; e++) {
+        // order[e] indexes the flattened (N, 8) indices / weight
+        const scalar_t *top_grad_ = top_grad + (order[e] / 8) * c;
+        acc_t w = weight[order[e]];
+#pragma omp simd
+        for (int j = 0; j < c; j++)
+          acc[j] += w * static_cast<acc_t>(top_grad_[j]);
+      }
+      scalar_t *bottom_grad_ = bottom_grad + v * c;
+#pragma omp simd
+      for (int j = 0; j < c; j++)
+        bottom_grad_[j] = static_cast<scalar_t>(acc[j]);
+    }
+  });
+}
+
 // make sure indices is int type
 // feat: (b,c,s) indices: (N, 3) batch_index: (N, ) -> out: (N, c)
 at::Tensor devoxelize_forward_cpu(const at::Tensor feat,
@@ -12,21 +76,17 @@ at::Tensor devoxelize_forward_cpu(const at::Tensor feat,
   int c = feat.size(1);
   int N = indices.size(0);
 
-  at::Tensor out = torch::zeros(
-      {N, c}, at::device(feat.device()).dtype(at::ScalarType::Float));
-#pragma omp parallel for
-  for (int i = 0; i < N; i++) {
-    int *indices_ = indices.data_ptr<int>() + i * 8;
-    float *weight_ = weight.data_ptr<float>() + i * 8;
-    for (int j = 0; j < c; j++) {
-      float *feat_ = feat.data_ptr<float>() + j;
-      float cur_feat;
-      for (int k = 0; k < 8; k++) {
-        cur_feat = (indices_[k] >= 0) ? feat_[indices_[k] * c] : 0;
-        *(out.data_ptr<float>() + i * c + j) += weight_[k] * cur_feat;
-      }
-    }
-  }
+  at::Tensor out = torch::zeros({N, c}, feat.options());
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, feat.scalar_type(),
+      "devoxelize_forward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        at::Tensor _weight =
+            weight.to(c10::CppTypeToScalarType<acc_t>::value).contiguous();
+        devoxelize_forward_kernel_cpu<scalar_t>(
+            N, c, indices.data_ptr<int>(), _weight.data_ptr<acc_t>(),
+            feat.data_ptr<scalar_t>(), out.data_ptr<scalar_t>());
+      }));
   return out;
 }
 
@@ -36,24 +96,19 @@ at::Tensor devoxelize_backward_cpu(const at::Tensor top_grad,
                                    const at::Tensor indices,
                                    const at::Tensor weight, int n) {
   int c = top_grad.size(1);
-  int N = top_grad.size(0);
-  at::Tensor bottom_grad = torch::zeros(
-      {n, c}, at::device(top_grad.device()).dtype(at::ScalarType::Float));
-
-  for (int i = 0; i < N; i++) {
-    int *indices_ = indices.data_ptr<int>() + i * 8;
-    float *weight_ = weight.data_ptr<float>() + i * 8;
-#pragma omp parallel for
-    for (int j = 0; j < c; j++) {
-      float *top_grad_ = top_grad.data_ptr<float>() + j;
-      float cur_top_grad;
-      for (int k = 0; k < 8; k++) {
-        cur_top_grad = (indices_[k] >= 0) ? top_grad_[indices_[k] * c] : 0;
-        *(bottom_grad.data_ptr<float>() + indices_[k] * c + j) +=
-            weight_[k] * cur_top_grad;
-      }
-    }
-  }
+  at::Tensor bottom_grad = torch::zeros({n, c}, top_grad.options());
+  std::vector<at::Tensor> csr = segment_csr_cpu(indices, n);
 
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, top_grad.scalar_type(),
+      "devoxelize_backward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        at::Tensor _weight =
+            weight.to(c10::CppTypeToScalarType<acc_t>::value).contiguous();
+        devoxelize_backward_kernel_cpu<scalar_t>(
+            n, c, csr[0].data_ptr<int64_t>(), csr[1].data_ptr<int64_t>(),
+            _weight.data_ptr<acc_t>(), top_grad.data_ptr<scalar_t>(),
+            bottom_grad.data_ptr<scalar_t>());
+      }));
   return bottom_grad;
 }
@@ -1,28 +1,209 @@
 #include "hashmap_cpu.hpp"
 
-#include <chrono>
+#include <torch/extension.h>
+
 #include <cstdio>
 #include <cstdlib>
 #include <stdexcept>
 
-void HashTableCPU::lookup_vals(const int64_t* const keys,
-                               int64_t* const results, const int n) {
+template <typename key_type, typename val_type>
+void CPUHashTable<key_type, val_type>::insert_many(const key_type* keys,
+                                                   const int n) {
+  bool full = false;
+#pragma omp parallel for
+  for (int idx = 0; idx < n; idx++) {
+    key_type key = keys[idx];
+    if (!insert_at(slot(key), key, idx + 1)) full = true;
+  }
+  if (full) throw_capacity_error();
+}
+
+template <typename key_type, typename val_type>
+void CPUHashTable<key_type, val_type>::insert_many_coords(const int* coords,
+                                                          const int n) {
+  bool full = false;
+#pragma omp parallel for
+  for (int idx = 0; idx < n; idx++) {
+    key_type key = coords_key(coords + idx * 4);
+    // out-of-range coordinates all share the packed key -1
+    if (_packed && key < 0) continue;
+    if (!insert_at(slot(key), key, idx + 1)) full = true;
+  }
+  if (full) throw_capacity_error();
+}
+
+template <typename key_type, typename val_type>
+void CPUHashTable<key_type, val_type>::lookup_many(const key_type* keys,
+                                                   val_type* results,
+                                                   const int n) {
+#pragma omp parallel for
+  for (int idx = 0; idx < n; idx++) {
+    key_type key = keys[idx];
+    results[idx] = lookup_at(slot(key), key);
+  }
+}
+
+template <typename key_type, typename val_type>
+void CPUHashTable<key_type, val_type>::lookup_many_coords(
+    const int* coords, val_type* results, const int* kernel_sizes,
+    const int* strides, const int n, const int kernel_volume) {
+  // Same offset enumeration as lookup_coords_kernel: x varies fastest for
+  // odd kernel volumes (MinkowskiEngine layout), z varies fastest otherwise.
+  bool odd = kernel_volume % 2;
+#pragma omp parallel for
+  for (int idx = 0; idx < n; idx++) {
+    const int* in_coords = coords + 4 * idx;
+    int coords_out[4];
+    coords_out[3] = in_coords[3];
+    for (int kernel_idx = 0; kernel_idx < kernel_volume; kernel_idx++) {
+      int _kernel_idx = kernel_idx;
+      if (odd) {
+        for (int i = 0; i <= 2; i++) {
+          int cur_offset = _kernel_idx % kernel_sizes[i];
+          cur_offset -= (kernel_sizes[i] - 1) / 2;
+          coords_out[i] = in_coords[i] * strides[i] + cur_offset;
+          _kernel_idx /= kernel_sizes[i];
+        }
+      } else {
+        for (int i = 2; i >= 0; i--) {
+          int cur_offset = _kernel_idx % kernel_sizes[i];
+          cur_offset -= (kernel_sizes[i] - 1) / 2;
+          coords_out[i] = in_coords[i] * strides[i] + cur_offset;
+          _kernel_idx /= kernel_sizes[i];
+        }
+      }
+      key_type key = coords_key(coords_out);
+      if (_packed && key < 0) continue;
+      results[idx * kernel_volume + kernel_idx] = lookup_at(slot(key), key);
+    }
+  }
+}
+
+template <typename key_type, typename val_type>
+void CPUHashTable<key_type, val_type>::lookup_many_coords_subm(
+    const int* coords, val_type* results, const int* kernel_sizes, const int n,
+    const int kernel_volume) {
+  // Submanifold maps with odd kernels: offset kernel_volume - 1 - k is the
+  // negation of offset k, so only the first half of the offsets is probed.
+  // Every hit is mirrored into the row of the neighbor, and the center maps
+  // every coordinate (inserted at the same index) to itself. Each mirrored
+  // entry has exactly one writer, so the loop stays race-free.
 #pragma omp parallel for
   for (int idx = 0; idx < n; idx++) {
-    int64_t key = keys[idx];
-    google::dense_hash_map<int64_t, int64_t>::iterator iter = hashmap.find(key);
-    if (iter != hashmap.end()) {
-      results[idx] = iter->second;
-    } else {
-      results[idx] = 0;
+    const int* in_coords = coords + 4 * idx;
+    int coords_out[4];
+    coords_out[3] = in_coords[3];
+    results[idx * kernel_volume + kernel_volume / 2] = idx + 1;
+    for (int kernel_idx = 0; kernel_idx < kernel_volume / 2; kernel_idx++) {
+      int _kernel_idx = kernel_idx;
+      for (int i = 0; i <= 2; i++) {
+        int cur_offset = _kernel_idx % kernel_sizes[i];
+        cur_offset -= (kernel_sizes[i] - 1) / 2;
+        coords_out[i] = in_coords[i] + cur_offset;
+        _kernel_idx /= kernel_sizes[i];
+      }
+      key_type key = coords_key(coords_out);
+      if (_packed && key < 0) continue;
+      val_type val = lookup_at(slot(key), key);
+      if (val != EMPTY_CELL_CPU) {
+        results[idx * kernel_volume + kernel_idx] = val;
+        results[(val - 1) * kernel_volume + kernel_volume - 1 - kernel_idx] =
+            idx + 1;
+      }
     }
   }
 }
 
-void HashTableCPU::insert_vals(const int64_t* const keys,
-                               const int64_t* const vals, const int n) {
-  for (int i = 0; i < 10; i++) {
-    printf("%d, %d, %d, %d\n", i, i < n, n, i < 10);
-    // hashmap[(int)keys[idx]] = (int)vals[idx]+1;
+template <typename key_type, typename val_type>
+void CPUHashTable<key_type, val_type>::lookup_many_offsets(
+    const int* coords, const int* offsets, val_type* results, const int n,
+    const int k_vol) {
+  // Fuses kernel_hash_cpu and lookup_many: the key of every (point, offset)
+  // pair is computed and probed on the fly instead of being written to a
+  // (k_vol, n) key matrix first.
+#pragma omp parallel for
+  for (int idx = 0; idx < n; idx++) {
+    int coords_out[4];
+    coords_out[3] = coords[4 * idx + 3];
+    for (int k = 0; k < k_vol; k++) {
+      for (int i = 0; i < 3; i++) {
+        coords_out[i] = coords[4 * idx + i] + offsets[3 * k + i];
+      }
+      key_type key = _packed ? (key_type)packed_key(coords_out)
+                             : (key_type)hash_func_sphash(coords_out);
+      if (_packed && key < 0) continue;
+      results[idx * k_vol + k] = lookup_at(slot(key), key);
+    }
   }
 }
+
+template <typename key_type, typename val_type>
+void CPUHashTable<key_type, val_type>::insert_vals(at::Tensor keys) {
+  insert_many(keys.data_ptr<key_type>(), keys.size(0));
+}
+
+template <typename key_type, typename val_type>
+void CPUHashTable<key_type, val_type>::insert_coords(at::Tensor coords) {
+  coords = coords.contiguous();
+  insert_many_coords(coords.data_ptr<int>(), coords.size(0));
+}
+
+template <typename key_type, typename val_type>
+at::Tensor CPUHashTable<key_type, val_type>::lookup_vals(at::Tensor keys) {
+  auto options =
+      torch::TensorOptions().dtype(at::ScalarType::Int).device(keys.device());
+  at::Tensor results = torch::zeros(
+      {(keys.size(0) + _divisor - 1) / _divisor * _divisor}, options);
+  lookup_many(keys.data_ptr<key_type>(), results.data_ptr<val_type>(),
+              keys.size(0));
+  return results;
+}
+
+template <typename key_type, typename val_type>
+at::Tensor CPUHashTable<key_type, val_type>::lookup_coords(
+    at::Tensor coords, at::Tensor kernel_sizes, at::Tensor strides,
+    int kernel_volume) {
+  coords = coords.contiguous();
+  auto options =
+      torch::TensorOptions().dtype(at::ScalarType::Int).device(coords.device());
+  at::Tensor results = torch::zeros(
+      {(coords.size(0) + _divisor - 1) / _divisor * _divisor, kernel_volume},
+      options);
+  lookup_many_coords(coords.data_ptr<int>(), results.data_ptr<val_type>(),
+                     kernel_sizes.data_ptr<int>(), strides.data_ptr<int>(),
+                     coords.size(0), kernel_volume);
+  return results;
+}
+
+template <typename key_type, typename val_type>
+at::Tensor CPUHashTable<key_type, val_type>::lookup_coords_subm(
+    at::Tensor coords, at::Tensor kernel_sizes, int kernel_volume) {
+  coords = coords.contiguous();
+  auto options =
+      torch::TensorOptions().dtype(at::ScalarType::Int).device(coords.device());
+  at::Tensor results = torch::zeros(
+      {(coords.size(0) + _divisor - 1) / _divisor * _divisor, kernel_volume},
+      options);
+  lookup_many_coords_subm(coords.data_ptr<int>(), results.data_ptr<val_type>(),
+                          kernel_sizes.data_ptr<int>(), coords.size(0),
+                          kernel_volume);
+  return results;
+}
+
+template <typename key_type, typename val_type>
+at::Tensor CPUHashTable<key_type, val_type>::lookup_offsets(at::Tensor coords,
+                                                            at::Tensor offsets) {
+  coords = coords.contiguous();
+  offsets = offsets.contiguous();
+  auto options =
+      torch::TensorOptions().dtype(at::ScalarType::Int).device(coords.device());
+  at::Tensor results =
+      torch::zeros({coords.size(0), offsets.size(0)}, options);
+  lookup_many_offsets(coords.data_ptr<int>(), offsets.data_ptr<int>(),
+                      results.data_ptr<val_type>(), coords.size(0),
+                      offsets.size(0));
+  return results;
+}
+
+template class CPUHashTable<int64_t, int>;
+template class CPUHashTable<int, int>;
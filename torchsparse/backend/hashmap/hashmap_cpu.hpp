@@ -1,24 +1,185 @@
 #pragma once
 
+#include <torch/extension.h>
+
 #include <cmath>
 #include <cstdint>
 #include <cstdio>
 #include <cstdlib>
-#include <google/dense_hash_map>
+#include <stdexcept>
 #include <vector>
 
-class HashTableCPU {
+/** Reserved value for indicating "empty". */
+#define EMPTY_CELL_CPU (0)
+
+// Open-addressing (linear probing) hash table on the host. It mirrors
+// GPUHashTable in hashmap_cuda.cuh: the storage lives in two tensors
+// (table_keys / table_vals) so that a table built by one layer can be cached
+// in TensorCache.hashmaps and reused by the following layers.
+template <typename key_type, typename val_type>
+class CPUHashTable {
  private:
-  google::dense_hash_map<int64_t, int64_t> hashmap;
+  bool free_pointers;
+  const int _capacity;
+  const int _divisor;
+  const bool _packed;
+  key_type* table_keys;
+  val_type* table_vals;
+  void insert_many_coords(const int* coords, const int n);
+  void lookup_many_coords(const int* coords, val_type* results,
+                          const int* kernel_sizes, const int* tensor_strides,
+                          const int n, const int kernel_volume);
+  void lookup_many_offsets(const int* coords, const int* offsets,
+                           val_type* results, const int n, const int k_vol);
+  void lookup_many_coords_subm(const int* coords, val_type* results,
+                               const int* kernel_sizes, const int n,
+                               const int kernel_volume);
 
- public:
-  HashTableCPU() {}
+  static inline uint64_t hash_func_64b(const int* data) {
+    uint64_t hash = 14695981039346656037UL;
+    for (int j = 0; j < 4; j++) {
+      hash ^= (unsigned int)data[j];
+      hash *= 1099511628211UL;
+    }
+    return hash;
+  }
+
+  // Same hash as hash_cpu / kernel_hash_cpu (sphash), including the final
+  // fold into 60 bits.
+  static inline uint64_t hash_func_sphash(const int* data) {
+    uint64_t hash = hash_func_64b(data);
+    return (hash >> 60) ^ (hash & 0xFFFFFFFFFFFFFFF);
+  }
+
+  // Collision-free key: (b + 1, x, y, z) packed into 15 + 3 x 16 bits, for
+  // b in [0, 32766) and x, y, z in [-32768, 32768). Coordinates outside that
+  // range map to -1, which is never inserted and therefore never found.
+  static inline int64_t packed_key(const int* data) {
+    if (data[3] < 0 || data[3] >= 32766) return -1;
+    int64_t key = data[3] + 1;
+    for (int j = 0; j < 3; j++) {
+      uint32_t cur = (uint32_t)(data[j] + 32768);
+      if (cur > 0xFFFF) return -1;
+      key = (key << 16) | cur;
+    }
+    return key;
+  }
+
+  // Key of a (x, y, z, b) coordinate for insert_coords / lookup_coords.
+  inline key_type coords_key(const int* data) const {
+    return _packed ? (key_type)packed_key(data)
+                   : (key_type)hash_func_64b(data);
+  }
+
+  // Packed keys are structured, so they are mixed before taking the slot.
+  inline int slot(key_type key) const {
+    return _packed ? slot_fmix64(key) : slot_mod(key);
+  }
 
-  ~HashTableCPU() {}
+  inline int slot_fmix64(key_type key) const {
+    uint64_t k = (uint64_t)(int64_t)key;
+    k ^= k >> 33;
+    k *= 0xff51afd7ed558ccdULL;
+    k ^= k >> 33;
+    k *= 0xc4ceb9fe1a85ec53ULL;
+    k ^= k >> 33;
+    return k % _capacity;
+  }
 
-  void insert_vals(const int64_t* const keys, const int64_t* const vals,
-                   const int n);
+  inline int slot_mod(key_type key) const {
+    return (uint64_t)key % _capacity;
+  }
 
-  void lookup_vals(const int64_t* const keys, int64_t* const results,
-                   const int n);
+  inline int slot_murmur3(key_type key) const {
+    uint64_t k = (uint64_t)(int64_t)key;
+    k ^= k >> 16;
+    k *= 0x85ebca6b;
+    k ^= k >> 13;
+    k *= 0xc2b2ae35;
+    k ^= k >> 16;
+    return k % _capacity;
+  }
+
+  // Thread-safe: slots are claimed with a compare-and-swap on the key.
+  // Returns false if every slot is taken; exceptions must not escape an
+  // OpenMP region, so callers collect the flag and throw afterwards.
+  inline bool insert_at(int slot, const key_type key, const val_type val) {
+    for (int probe = 0; probe < _capacity; probe++) {
+      key_type prev =
+          __sync_val_compare_and_swap(&table_keys[slot], EMPTY_CELL_CPU, key);
+      if (prev == EMPTY_CELL_CPU || prev == key) {
+        table_vals[slot] = val;
+        return true;
+      }
+      slot = (slot + 1) % _capacity;
+    }
+    return false;
+  }
+
+  inline val_type lookup_at(int slot, const key_type key) const {
+    for (int probe = 0; probe < _capacity; probe++) {
+      key_type cur_key = table_keys[slot];
+      if (cur_key == key) {
+        return table_vals[slot];
+      }
+      if (cur_key == EMPTY_CELL_CPU) {
+        return EMPTY_CELL_CPU;
+      }
+      slot = (slot + 1) % _capacity;
+    }
+    return EMPTY_CELL_CPU;
+  }
+
+ public:
+  CPUHashTable(const int capacity)
+      : free_pointers(true), _capacity(capacity), _divisor(128),
+        _packed(false) {
+    table_keys = (key_type*)calloc(_capacity, sizeof(key_type));
+    table_vals = (val_type*)calloc(_capacity, sizeof(val_type));
+  };
+  CPUHashTable(torch::Tensor table_keys, torch::Tensor table_vals,
+               bool packed = false)
+      : free_pointers(false),
+        _capacity(table_keys.size(0)),
+        _divisor(128),
+        _packed(packed),
+        table_keys(table_keys.data_ptr<key_type>()),
+        table_vals(table_vals.data_ptr<val_type>()){};
+  ~CPUHashTable() {
+    if (free_pointers) {
+      free(table_keys);
+      free(table_vals);
+    }
+  };
+  void insert_many(const key_type* keys, const int n);
+  void lookup_many(const key_type* keys, val_type* results, const int n);
+  void insert_vals(torch::Tensor keys);
+  torch::Tensor lookup_vals(torch::Tensor keys);
+  void insert_coords(torch::Tensor coords);
+  torch::Tensor lookup_coords(at::Tensor coords, at::Tensor kernel_sizes,
+                              at::Tensor tensor_strides, int kernel_volume);
+  torch::Tensor lookup_offsets(at::Tensor coords, at::Tensor offsets);
+  torch::Tensor lookup_coords_subm(at::Tensor coords, at::Tensor kernel_sizes,
+                                   int kernel_volume);
+  int get_divisor() { return _divisor; }
+  int get_capacity() { return _capacity; }
+  bool is_packed() { return _packed; }
+
+  // Single-key accessors, equivalent to GPUHashTable::device_view. They are
+  // used by the fused kernel map builders and hash with murmur3.
+  inline bool insert(const key_type key, const val_type val) {
+    return insert_at(slot_murmur3(key), key, val);
+  }
+  static void throw_capacity_error() {
+    throw std::runtime_error(
+        "The capacity of hashtable is not sufficient. Please enlarge reserved "
+        "space for hashtable:\n # Python \nimport "
+        "torchsparse.backends\ntorchsparse.backends.hash_rsv_ratio=#Value");
+  }
+  inline val_type lookup(const key_type key) const {
+    return lookup_at(slot_murmur3(key), key);
+  }
 };
+
+using hashtable_cpu = CPUHashTable<int64_t, int>;
+using hashtable32_cpu = CPUHashTable<int, int>;
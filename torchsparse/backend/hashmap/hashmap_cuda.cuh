@@ -45,6 +45,37 @@ __device__ uint64_t hash_func_64b(dtype* data){
   return hash;
 }
 
+// Collision-free key: (b + 1, x, y, z) packed into 15 + 3 x 16 bits, for
+// b in [0, 32766) and x, y, z in [-32768, 32768). Coordinates outside that
+// range map to -1, which is never inserted and therefore never found.
+__device__ __forceinline__ int64_t packed_key(const int* data){
+  if (data[3] < 0 || data[3] >= 32766) return -1;
+  int64_t key = data[3] + 1;
+  #pragma unroll
+  for (int j = 0; j < 3; j++) {
+    uint32_t cur = (uint32_t)(data[j] + 32768);
+    if (cur > 0xFFFF) return -1;
+    key = (key << 16) | cur;
+  }
+  return key;
+}
+
+template <typename key_type>
+__device__ __forceinline__ key_type coords_key(int* data, bool packed){
+  return packed ? (key_type)packed_key(data) : (key_type)hash_func_64b(data);
+}
+
+template <typename key_type>
+__device__ int hash_fmix64(key_type key, int _capacity){
+  uint64_t k = (uint64_t)(int64_t)key;
+  k ^= k >> 33;
+  k *= 0xff51afd7ed558ccdULL;
+  k ^= k >> 33;
+  k *= 0xc4ceb9fe1a85ec53ULL;
+  k ^= k >> 33;
+  return k % _capacity;
+}
+
 template <typename key_type>
 __device__ int hash(key_type key, int _capacity){
   return (uint64_t)key % _capacity;
@@ -68,24 +99,27 @@ class GPUHashTable {
   bool free_pointers;
   const int _capacity;
   const int _divisor;
+  const bool _packed;
   key_type* table_keys;
   val_type* table_vals;
   void insert_many_coords(int *coords, const int n);
   void lookup_many_coords(int *coords, val_type *results, 
     const int* kernel_sizes, const int* tensor_strides,
     const int n, const int kernel_volume);
+  void lookup_many_coords_subm(int *coords, val_type *results,
+    const int* kernel_sizes, const int n, const int kernel_volume);
  public:
   GPUHashTable(const int capacity)
-      : _capacity(capacity), free_pointers(true), _divisor(128){
+      : _capacity(capacity), free_pointers(true), _divisor(128), _packed(false){
     srand(time(NULL));
     cudaMalloc((void **)&table_keys, _capacity * sizeof(key_type));
     cudaMemset(table_keys, 0, sizeof(key_type) * _capacity);
     cudaMalloc((void **)&table_vals, _capacity * sizeof(val_type));
     cudaMemset(table_vals, 0, sizeof(val_type) * _capacity);
   };
-  GPUHashTable(torch::Tensor table_keys, torch::Tensor table_vals)
+  GPUHashTable(torch::Tensor table_keys, torch::Tensor table_vals, bool packed = false)
       : _capacity(table_keys.size(0)), free_pointers(false), table_keys(table_keys.data_ptr<key_type>()),
-      table_vals(table_vals.data_ptr<val_type>()), _divisor(128){};
+      table_vals(table_vals.data_ptr<val_type>()), _divisor(128), _packed(packed){};
   ~GPUHashTable() {
     if(free_pointers){
       cudaFree(table_keys);
@@ -98,8 +132,10 @@ class GPUHashTable {
   torch::Tensor lookup_vals(torch::Tensor keys);
   void insert_coords(torch::Tensor coords);
   torch::Tensor lookup_coords(at::Tensor coords, at::Tensor kernel_sizes, at::Tensor tensor_strides, int kernel_volume);
+  torch::Tensor lookup_coords_subm(at::Tensor coords, at::Tensor kernel_sizes, int kernel_volume);
   int get_divisor(){return _divisor;}
   int get_capacity(){return _capacity;}
+  bool is_packed(){return _packed;}
   class device_view{
     private:
       int _capacity;
@@ -122,7 +158,7 @@ using hashtable32 = GPUHashTable<int, int>;
 
 // Insert into hashmap
 template <typename key_type=int64_t, typename val_type=int>
-__global__ void insert_kernel(key_type* table_keys, val_type* table_vals, const key_type* keys, int n, int _capacity)
+__global__ void insert_kernel(key_type* table_keys, val_type* table_vals, const key_type* keys, int n, int _capacity, bool packed)
 {
     int idx = blockIdx.x * blockDim.x + threadIdx.x;
     if (idx < n)
@@ -130,7 +166,7 @@ __global__ void insert_kernel(key_type* table_keys, val_type* table_vals, const
 
         key_type key = keys[idx];
         int value = idx + 1;
-        int slot = hash(key, _capacity);
+        int slot = packed ? hash_fmix64(key, _capacity) : hash(key, _capacity);
         while (true)
         {
             key_type prev = atomicCAS(&table_keys[slot], EMPTY_CELL, key);
@@ -147,14 +183,16 @@ __global__ void insert_kernel(key_type* table_keys, val_type* table_vals, const
 
 
 template <typename key_type=int64_t, typename val_type=int>
-__global__ void insert_coords_kernel(key_type* table_keys, val_type* table_vals, int* coords, int n, int _capacity)
+__global__ void insert_coords_kernel(key_type* table_keys, val_type* table_vals, int* coords, int n, int _capacity, bool packed)
 {
     int idx = blockIdx.x * blockDim.x + threadIdx.x;
     if (idx < n)
     {
-        key_type key = (key_type)(hash_func_64b(coords + idx * 4));
+        key_type key = coords_key<key_type>(coords + idx * 4, packed);
+        // out-of-range coordinates all share the packed key -1
+        if (packed && key < 0) return;
         int value = idx + 1;
-        int slot = hash(key, _capacity);
+        int slot = packed ? hash_fmix64(key, _capacity) : hash(key, _capacity);
         while (true)
         {
             key_type prev = atomicCAS(&table_keys[slot], EMPTY_CELL, key);
@@ -171,13 +209,13 @@ __global__ void insert_coords_kernel(key_type* table_keys, val_type* table_vals,
 
 // lookup from hashmap
 template <typename key_type=int64_t, typename val_type=int>
-__global__ void lookup_kernel(key_type* table_keys, val_type* table_vals, const key_type* keys, val_type* vals, int n, int _capacity)
+__global__ void lookup_kernel(key_type* table_keys, val_type* table_vals, const key_type* keys, val_type* vals, int n, int _capacity, bool packed)
 {
     int idx = blockIdx.x * blockDim.x + threadIdx.x;
     if (idx < n)
     {
         key_type key = keys[idx];
-        int slot = hash(key, _capacity);
+        int slot = packed ? hash_fmix64(key, _capacity) : hash(key, _capacity);
 
         while (true)
         {
@@ -200,7 +238,7 @@ template <typename key_type=int64_t, typename val_type=int, bool odd>
 __global__ void lookup_coords_kernel(
   key_type* table_keys, val_type* table_vals, int* coords, val_type* vals, 
   const int* kernel_sizes, const int* strides, 
-  int n, int _capacity, int kernel_volume)
+  int n, int _capacity, int kernel_volume, bool packed)
 {
     int tidx = blockIdx.x * blockDim.x + threadIdx.x;
     int idx = tidx / kernel_volume;
@@ -233,8 +271,9 @@ __global__ void lookup_coords_kernel(
     
     if (idx < n)
     {
-        key_type key = (key_type)(hash_func_64b(coords_out));
-        int slot = hash(key, _capacity);
+        key_type key = coords_key<key_type>(coords_out, packed);
+        if (packed && key < 0) return;
+        int slot = packed ? hash_fmix64(key, _capacity) : hash(key, _capacity);
 
         while (true)
         {
@@ -253,14 +292,66 @@ __global__ void lookup_coords_kernel(
 }
 
 
+// Submanifold maps with odd kernels: offset kernel_volume - 1 - k is the
+// negation of offset k, so only the first half of the offsets is probed and
+// every hit is mirrored into the row of the neighbor.
+template <typename key_type=int64_t, typename val_type=int>
+__global__ void lookup_coords_subm_kernel(
+  key_type* table_keys, val_type* table_vals, int* coords, val_type* vals,
+  const int* kernel_sizes, int n, int _capacity, int kernel_volume, bool packed)
+{
+    int tidx = blockIdx.x * blockDim.x + threadIdx.x;
+    int idx = tidx / (kernel_volume / 2);
+    int _kernel_idx = tidx % (kernel_volume / 2);
+    int kernel_idx = _kernel_idx;
+    if (idx >= n) return;
+
+    if (_kernel_idx == 0)
+    {
+        vals[idx * kernel_volume + kernel_volume / 2] = idx + 1;
+    }
+
+    int* in_coords = coords + 4 * idx;
+    int coords_out[4];
+    coords_out[3] = in_coords[3];
+    #pragma unroll
+    for(int i = 0; i <= 2; i++){
+      int cur_offset = _kernel_idx % kernel_sizes[i];
+      cur_offset -= (kernel_sizes[i] - 1) / 2;
+      coords_out[i] = in_coords[i] + cur_offset;
+      _kernel_idx /= kernel_sizes[i];
+    }
+
+    key_type key = coords_key<key_type>(coords_out, packed);
+    if (packed && key < 0) return;
+    int slot = packed ? hash_fmix64(key, _capacity) : hash(key, _capacity);
+    while (true)
+    {
+        key_type cur_key = table_keys[slot];
+        if (key == cur_key)
+        {
+            val_type val = table_vals[slot];
+            vals[idx * kernel_volume + kernel_idx] = val;
+            vals[(val - 1) * kernel_volume + kernel_volume - 1 - kernel_idx] = idx + 1;
+            return;
+        }
+        if (cur_key == EMPTY_CELL)
+        {
+            return;
+        }
+        slot = (slot + 1) % _capacity;
+    }
+}
+
+
 template <typename key_type, typename val_type>
 void GPUHashTable<key_type, val_type>::insert_many(const key_type *keys, const int n){
-  insert_kernel<key_type, val_type><<<(n + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(table_keys, table_vals, keys, n, _capacity);
+  insert_kernel<key_type, val_type><<<(n + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(table_keys, table_vals, keys, n, _capacity, _packed);
 }
 
 template <typename key_type, typename val_type>
 void GPUHashTable<key_type, val_type>::insert_many_coords(int *coords, const int n){
-  insert_coords_kernel<key_type, val_type><<<(n + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(table_keys, table_vals, coords, n, _capacity);
+  insert_coords_kernel<key_type, val_type><<<(n + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(table_keys, table_vals, coords, n, _capacity, _packed);
 }
 
 template <typename key_type, typename val_type>
@@ -276,7 +367,7 @@ void GPUHashTable<key_type, val_type>::insert_coords(at::Tensor coords){
 
 template <typename key_type, typename val_type>
 void GPUHashTable<key_type, val_type>::lookup_many(const key_type *keys, val_type *results, const int n){
-  lookup_kernel<key_type, val_type><<<(n + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(table_keys, table_vals, keys, results, n, _capacity);
+  lookup_kernel<key_type, val_type><<<(n + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(table_keys, table_vals, keys, results, n, _capacity, _packed);
 }
 
 template <typename key_type, typename val_type>
@@ -287,11 +378,20 @@ void GPUHashTable<key_type, val_type>::lookup_many_coords(
   if (kernel_volume % 2)
     lookup_coords_kernel<key_type, val_type, true><<<(n * kernel_volume + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(
       table_keys, table_vals, coords, results, kernel_sizes, strides,
-      n, _capacity, kernel_volume);
+      n, _capacity, kernel_volume, _packed);
   else
     lookup_coords_kernel<key_type, val_type, false><<<(n * kernel_volume + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(
       table_keys, table_vals, coords, results, kernel_sizes, strides,
-      n, _capacity, kernel_volume);
+      n, _capacity, kernel_volume, _packed);
+}
+
+template <typename key_type, typename val_type>
+void GPUHashTable<key_type, val_type>::lookup_many_coords_subm(
+  int *coords, val_type *results, const int* kernel_sizes,
+  const int n, const int kernel_volume){
+  lookup_coords_subm_kernel<key_type, val_type><<<(n * (kernel_volume / 2) + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(
+    table_keys, table_vals, coords, results, kernel_sizes,
+    n, _capacity, kernel_volume, _packed);
 }
 
 template <typename key_type, typename val_type>
@@ -313,6 +413,16 @@ at::Tensor GPUHashTable<key_type, val_type>::lookup_coords(at::Tensor coords, at
   return results;
 }
 
+template <typename key_type, typename val_type>
+at::Tensor GPUHashTable<key_type, val_type>::lookup_coords_subm(at::Tensor coords, at::Tensor kernel_sizes, int kernel_volume){
+  auto options =
+      torch::TensorOptions().dtype(at::ScalarType::Int).device(coords.device());
+  at::Tensor results = torch::zeros({(coords.size(0) + _divisor - 1) / _divisor * _divisor, kernel_volume}, options);
+  lookup_many_coords_subm(coords.data_ptr<int>(), results.data_ptr<val_type>(),
+  kernel_sizes.data_ptr<int>(), coords.size(0), kernel_volume);
+  return results;
+}
+
 template <typename key_type, typename val_type>
 __device__ void GPUHashTable<key_type, val_type>::device_view::insert(const key_type key, const val_type val){
   int slot = hash_murmur3(key, _capacity);
@@ -0,0 +1,129 @@
+#include <torch/extension.h>
+#include <torch/torch.h>
+
+#include <algorithm>
+#include <cstdio>
+#include <vector>
+
+#include "../hashmap/hashmap_cpu.hpp"
+#include "downsample_cpu.h"
+#define NDim 4
+
+/*
+Transform input coordinates to 1D ravel hash values.
+in_coords: NDIM
+coords_min: NDIM
+coords_max: NDIM
+*/
+inline int64_t transform_coords_cpu(const int *in_coords,
+                                    const int *coords_min,
+                                    const int *coords_max) {
+  int64_t cur = 0;
+  for (int i = 0; i < NDim; i++) {
+    cur *= (coords_max[i] - coords_min[i] + 1);
+    cur += (in_coords[i] - coords_min[i]);
+  }
+  return cur;
+}
+
+/*
+Transform 1D ravel hash values back to 4D coordinates.
+*/
+inline void inverse_transform_coords_cpu(int64_t cur, const int *coords_min,
+                                         const int *coords_max,
+                                         int *out_coords) {
+  for (int i = NDim - 1; i >= 0; i--) {
+    int size = coords_max[i] - coords_min[i] + 1;
+    out_coords[i] = coords_min[i] + (cur % size);
+    cur /= size;
+  }
+}
+
+/*
+Same algorithm as downsample_cuda: every input point enumerates the outputs
+whose receptive field covers it, the candidates are packed into ravel keys
+and deduplicated. Deduplication goes through a CPUHashTable, so only the
+unique keys are sorted (to return the same coordinate order as the CUDA
+version, which sorts with torch::_unique).
+*/
+at::Tensor downsample_cpu(at::Tensor _in_coords, at::Tensor _coords_max,
+                          at::Tensor _coords_min, at::Tensor _kernel_sizes,
+                          at::Tensor _stride, at::Tensor _padding) {
+  int N = _in_coords.size(0);
+  int kernel_volume = (int)(torch::prod(_kernel_sizes).item<int>());
+  const int *in_coords = _in_coords.data_ptr<int>();
+  const int *coords_min = _coords_min.data_ptr<int>();
+  const int *coords_max = _coords_max.data_ptr<int>();
+  const int *kernel_sizes = _kernel_sizes.data_ptr<int>();
+  const int *stride = _stride.data_ptr<int>();
+  const int *padding = _padding.data_ptr<int>();
+  auto options_long = torch::TensorOptions()
+                          .dtype(at::ScalarType::Long)
+                          .device(_in_coords.device());
+
+  // stage1: packed keys of all candidate outputs, -1 for invalid ones
+  at::Tensor _candidates = torch::full({N, kernel_volume}, -1, options_long);
+  int64_t *candidates = _candidates.data_ptr<int64_t>();
+  int n_candidates = 0;
+#pragma omp parallel for reduction(+ : n_candidates)
+  for (int idx = 0; idx < N; idx++) {
+    const int *cur_in = in_coords + idx * NDim;
+    int coords_out[NDim];
+    coords_out[0] = cur_in[0];
+    for (int kernel_idx = 0; kernel_idx < kernel_volume; kernel_idx++) {
+      int _kernel_idx = kernel_idx;
+      bool valid = true;
+      for (int j = NDim - 1; j >= 1; --j) {
+        int cur = cur_in[j] - (kernel_sizes[j - 1] - 1) +
+                  _kernel_idx % kernel_sizes[j - 1] + padding[j - 1];
+        _kernel_idx /= kernel_sizes[j - 1];
+        int cur_div = cur / stride[j - 1];
+        if ((cur % stride[j - 1]) != 0 || cur_div < coords_min[j] ||
+            cur_div > coords_max[j]) {
+          valid = false;
+          break;
+        }
+        coords_out[j] = cur_div;
+      }
+      if (valid) {
+        candidates[idx * kernel_volume + kernel_idx] =
+            transform_coords_cpu(coords_out, coords_min, coords_max);
+        n_candidates++;
+      }
+    }
+  }
+
+  // stage2: deduplicate the keys with a hash table (keys are shifted by one
+  // since 0 marks an empty cell)
+  int capacity = std::max(2 * n_candidates, 1);
+  at::Tensor _table_keys = torch::zeros({capacity}, options_long);
+  at::Tensor _table_vals = torch::zeros(
+      {capacity},
+      torch::TensorOptions().dtype(at::ScalarType::Int).device(
+          _in_coords.device()));
+  hashtable_cpu table(_table_keys, _table_vals);
+  bool full = false;
+#pragma omp parallel for
+  for (int64_t i = 0; i < (int64_t)N * kernel_volume; i++) {
+    if (candidates[i] >= 0 && !table.insert(candidates[i] + 1, 1)) full = true;
+  }
+  if (full) hashtable_cpu::throw_capacity_error();
+  at::Tensor _out_coords_transformed =
+      std::get<0>(torch::sort(_table_keys.masked_select(_table_keys > 0))) - 1;
+
+  // stage3: transform the unique keys back to N x 4 coordinates
+  int num_out_points = _out_coords_transformed.size(0);
+  const int64_t *out_coords_transformed =
+      _out_coords_transformed.data_ptr<int64_t>();
+  at::Tensor _out_coords = torch::zeros(
+      {num_out_points, NDim},
+      torch::TensorOptions().dtype(at::ScalarType::Int).device(
+          _in_coords.device()));
+  int *out_coords = _out_coords.data_ptr<int>();
+#pragma omp parallel for
+  for (int idx = 0; idx < num_out_points; idx++) {
+    inverse_transform_coords_cpu(out_coords_transformed[idx], coords_min,
+                                 coords_max, out_coords + idx * NDim);
+  }
+  return _out_coords;
+}
@@ -3,7 +3,6 @@
 #include <torch/torch.h>
 
 #include <cmath>
-#include <google/dense_hash_map>
 #include <iostream>
 #include <vector>
 
@@ -15,23 +14,72 @@ at::Tensor hash_query_cpu(const at::Tensor hash_query,
   int n = hash_target.size(0);
   int n1 = hash_query.size(0);
 
-  google::dense_hash_map<int64_t, int64_t> hashmap;
-  hashmap.set_empty_key(0);
+  hashtable_cpu in_hash_table(std::max(n * 2, 1));
+  in_hash_table.insert_many(hash_target.data_ptr<int64_t>(), n);
+
   at::Tensor out = torch::zeros(
+      {n1}, at::device(hash_query.device()).dtype(at::ScalarType::Int));
+  in_hash_table.lookup_many(hash_query.data_ptr<int64_t>(),
+                            out.data_ptr<int>(), n1);
+
+  // the table stores (position + 1); translate positions to target indices
+  int64_t *idx = idx_target.data_ptr<int64_t>();
+  int *pos = out.data_ptr<int>();
+  at::Tensor result = torch::zeros(
       {n1}, at::device(hash_query.device()).dtype(at::ScalarType::Long));
-  for (int idx = 0; idx < n; idx++) {
-    int64_t key = *(hash_target.data_ptr<int64_t>() + idx);
-    int64_t val = *(idx_target.data_ptr<int64_t>() + idx) + 1;
-    hashmap.insert(std::make_pair(key, val));
+  int64_t *result_ = result.data_ptr<int64_t>();
+#pragma omp parallel for
+  for (int i = 0; i < n1; i++) {
+    if (pos[i] > 0) {
+      result_[i] = idx[pos[i] - 1] + 1;
+    }
   }
+  return result;
+}
+
+void convert_transposed_out_in_map_cpu(const at::Tensor out_in_map,
+                                       at::Tensor out_in_map_t) {
+  int n = out_in_map.size(0);
+  int kernel_volume = out_in_map.size(1);
+  const int *map = out_in_map.data_ptr<int>();
+  int *map_t = out_in_map_t.data_ptr<int>();
+  // Each (input, offset) pair has at most one output, so writes never
+  // collide.
 #pragma omp parallel for
-  for (int idx = 0; idx < n1; idx++) {
-    int64_t key = *(hash_query.data_ptr<int64_t>() + idx);
-    google::dense_hash_map<int64_t, int64_t>::iterator iter = hashmap.find(key);
-    if (iter != hashmap.end()) {
-      *(out.data_ptr<int64_t>() + idx) = iter->second;
+  for (int idx = 0; idx < n; idx++) {
+    for (int k = 0; k < kernel_volume; k++) {
+      int input_idx = map[idx * kernel_volume + k];
+      if (input_idx >= 0) map_t[input_idx * kernel_volume + k] = idx;
     }
   }
+}
 
-  return out;
+at::Tensor derive_bitmask_from_out_in_map_cpu(const at::Tensor out_in_map,
+                                              const int split_mask_num,
+                                              int valid_n) {
+  int n = out_in_map.size(0);
+  int kernel_volume = out_in_map.size(1);
+  at::Tensor bitmask = torch::full(
+      {split_mask_num, n}, -1,
+      at::device(out_in_map.device()).dtype(at::ScalarType::Int));
+  const int *map = out_in_map.data_ptr<int>();
+  int *bitmask_ = bitmask.data_ptr<int>();
+  int split_mask_len = (kernel_volume + split_mask_num - 1) / split_mask_num;
+#pragma omp parallel for
+  for (int idx = 0; idx < valid_n; idx++) {
+    for (int split_mask_iter = 0; split_mask_iter < split_mask_num;
+         split_mask_iter++) {
+      const int *cur_map =
+          map + kernel_volume * idx + split_mask_iter * split_mask_len;
+      int cur_len = split_mask_iter == split_mask_num - 1
+                        ? kernel_volume - split_mask_iter * split_mask_len
+                        : split_mask_len;
+      int cur_bitmask = 0;
+      for (int i = 0; i < cur_len; i++) {
+        cur_bitmask += (int)(cur_map[i] >= 0) * (int)(1u << i);
+      }
+      bitmask_[split_mask_iter * n + idx] = cur_bitmask;
+    }
+  }
+  return bitmask;
 }
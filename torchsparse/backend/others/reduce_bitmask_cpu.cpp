@@ -0,0 +1,37 @@
+#include <torch/extension.h>
+
+#include <algorithm>
+
+#include "reduce_bitmask_cpu.h"
+
+// OR-reduce every M_tile consecutive rows of the (sorted) bitmask.
+torch::Tensor reduce_bitmask_cpu(torch::Tensor _bitmask_int, int M_tile) {
+  if (M_tile % 4 != 0) {
+    throw std::runtime_error(
+        "[Bitmask reduce] reduce tile size must be multiple of 4.");
+  }
+  int split_mask_num = _bitmask_int.size(0);
+  int output_node_num = _bitmask_int.size(1);
+  int reduced_row_num = (output_node_num - 1) / M_tile + 1;
+  auto options = torch::TensorOptions()
+                     .dtype(torch::kInt32)
+                     .device(_bitmask_int.device());
+  torch::Tensor _reduced_bitmask_int =
+      torch::zeros({split_mask_num, reduced_row_num}, options);
+
+  const int *bitmask_int = _bitmask_int.data_ptr<int>();
+  int *reduced_bitmask_int = _reduced_bitmask_int.data_ptr<int>();
+
+#pragma omp parallel for collapse(2)
+  for (int split_mask_iter = 0; split_mask_iter < split_mask_num;
+       split_mask_iter++) {
+    for (int row = 0; row < reduced_row_num; row++) {
+      const int *cur_bitmask = bitmask_int + split_mask_iter * output_node_num;
+      int end = std::min((row + 1) * M_tile, output_node_num);
+      int reduced = 0;
+      for (int i = row * M_tile; i < end; i++) reduced |= cur_bitmask[i];
+      reduced_bitmask_int[split_mask_iter * reduced_row_num + row] = reduced;
+    }
+  }
+  return _reduced_bitmask_int;
+}
@@ -0,0 +1,4 @@
+#pragma once
+#include <torch/torch.h>
+
+torch::Tensor reduce_bitmask_cpu(torch::Tensor _bitmask_int, int M_tile);
@@ -0,0 +1,31 @@
+#include <torch/extension.h>
+
+#include "reorder_map_cpu.h"
+
+at::Tensor reorder_out_in_map_cpu(torch::Tensor _out_in_map,
+                                  torch::Tensor _reorder_loc) {
+  int M = _out_in_map.size(0);
+  int kernel_volume = _out_in_map.size(1);
+  int split_mask_num = _reorder_loc.size(0);
+  int split_mask_len = (kernel_volume + split_mask_num - 1) / split_mask_num;
+
+  auto options = torch::TensorOptions()
+                     .dtype(_out_in_map.dtype())
+                     .device(_out_in_map.device());
+  at::Tensor _reorder_out_in_map = torch::empty({M, kernel_volume}, options);
+
+  const int *out_in_map = _out_in_map.data_ptr<int>();
+  const int *reorder_loc = _reorder_loc.data_ptr<int>();
+  int *reorder_out_in_map = _reorder_out_in_map.data_ptr<int>();
+
+#pragma omp parallel for
+  for (int row = 0; row < M; row++) {
+    for (int col = 0; col < kernel_volume; col++) {
+      int split_mask_iter = col / split_mask_len;
+      int input_row = reorder_loc[split_mask_iter * M + row];
+      reorder_out_in_map[row * kernel_volume + col] =
+          out_in_map[input_row * kernel_volume + col];
+    }
+  }
+  return _reorder_out_in_map;
+}
@@ -0,0 +1,5 @@
+#pragma once
+#include <torch/torch.h>
+
+at::Tensor reorder_out_in_map_cpu(torch::Tensor _out_in_map,
+                                  torch::Tensor _reorder_loc);
@@ -0,0 +1,25 @@
+#include "segment_csr_cpu.h"
+
+#include <torch/torch.h>
+
+#include <vector>
+
+// Groups the positions of `keys` by key value. Returns {order, row_ptr}
+// (both int64) such that order[row_ptr[s]:row_ptr[s + 1]] lists, in
+// increasing order, the positions i with keys[i] == s. Keys outside
+// [0, num_segments) are dropped. Used to turn scatter-adds into per-segment
+// reductions that can run in parallel without atomics.
+std::vector<at::Tensor> segment_csr_cpu(const at::Tensor keys,
+                                        const int num_segments) {
+  at::Tensor _keys = keys.reshape({-1}).to(at::ScalarType::Long);
+  _keys = torch::where((_keys >= 0).logical_and(_keys < num_segments), _keys,
+                       torch::full_like(_keys, num_segments));
+  at::Tensor order = std::get<1>(_keys.sort(/*stable=*/true, 0, false));
+  at::Tensor row_ptr = torch::zeros(
+      {num_segments + 1}, at::device(keys.device()).dtype(at::ScalarType::Long));
+  row_ptr.narrow(0, 1, num_segments)
+      .copy_(torch::bincount(_keys, {}, num_segments + 1)
+                 .narrow(0, 0, num_segments)
+                 .cumsum(0));
+  return {order, row_ptr};
+}
@@ -0,0 +1,6 @@
+#pragma once
+
+#include <torch/torch.h>
+
+std::vector<at::Tensor> segment_csr_cpu(const at::Tensor keys,
+                                        const int num_segments);
@@ -0,0 +1,259 @@
+#include <torch/extension.h>
+#include <torch/torch.h>
+
+#include <algorithm>
+#include <cstdio>
+#include <vector>
+
+#include "sparsemapping_cpu.h"
+#define NDim 4
+
+// CPU counterparts of the fused kernel map builders in sparsemapping_cuda.cu.
+// Every loop below replaces one CUDA kernel launch and enumerates kernel
+// offsets in the same order, so the resulting out_in_map is bit-identical.
+
+template <typename type_int>  // int32_t or int64_t
+inline type_int transform_coords_cpu(const int *in_coords,
+                                     const int *coords_min,
+                                     const int *coords_max) {
+  type_int cur = 0;
+  for (int i = 0; i < NDim; i++) {
+    cur *= (coords_max[i] - coords_min[i] + 1);
+    cur += (in_coords[i] - coords_min[i]);
+  }
+  return cur;
+}
+
+template <typename type_int>  // int32_t or int64_t
+inline void inverse_transform_coords_cpu(type_int cur, const int *coords_min,
+                                         const int *coords_max,
+                                         int *out_coords) {
+  for (int i = NDim - 1; i >= 0; i--) {
+    int size = coords_max[i] - coords_min[i] + 1;
+    out_coords[i] = coords_min[i] + (cur % size);
+    cur /= size;
+  }
+}
+
+inline bool in_range_cpu(const int *coords, const int *coords_min,
+                         const int *coords_max) {
+  return coords[1] >= coords_min[1] && coords[1] <= coords_max[1] &&
+         coords[2] >= coords_min[2] && coords[2] <= coords_max[2] &&
+         coords[3] >= coords_min[3] && coords[3] <= coords_max[3];
+}
+
+template <typename type_hashtable, typename type_int>
+std::vector<at::Tensor> build_kernel_map_subm_hashmap_cpu_template(
+    type_hashtable &table, at::Tensor _in_coords, at::Tensor _coords_min,
+    at::Tensor _coords_max, at::Tensor _kernel_sizes, bool to_insert) {
+  int n_points = _in_coords.size(0);
+  int kernel_volume = (int)(torch::prod(_kernel_sizes).item<int>());
+  const int *in_coords = _in_coords.data_ptr<int>();
+  const int *coords_min = _coords_min.data_ptr<int>();
+  const int *coords_max = _coords_max.data_ptr<int>();
+  const int *kernel_sizes = _kernel_sizes.data_ptr<int>();
+  auto options = torch::TensorOptions()
+                     .dtype(at::ScalarType::Int)
+                     .device(_in_coords.device());
+  int divisor = table.get_divisor();
+  int n_points_pad = (n_points + divisor - 1) / divisor * divisor;
+  at::Tensor _out_in_map =
+      torch::full({n_points_pad, kernel_volume}, -1, options);
+  int *out_in_map = _out_in_map.data_ptr<int>();
+
+  // stage1: insert to hashmap
+  if (to_insert) {
+    bool full = false;
+#pragma omp parallel for
+    for (int idx = 0; idx < n_points; idx++) {
+      type_int grid_index = transform_coords_cpu<type_int>(
+          in_coords + idx * NDim, coords_min, coords_max);
+      if (!table.insert(grid_index + 1, idx + 1)) full = true;
+    }
+    if (full) type_hashtable::throw_capacity_error();
+  }
+
+  // stage2: query
+  if (kernel_volume % 2 != 0) {
+    // Only the first half of the offsets is probed; the mirrored entry of
+    // every hit is written for the neighbor, and the center maps to itself.
+#pragma omp parallel for
+    for (int idx = 0; idx < n_points; idx++) {
+      out_in_map[idx * kernel_volume + kernel_volume / 2] = idx;
+      int coords_out[NDim];
+      coords_out[0] = in_coords[idx * NDim];
+      for (int kernel_idx = 0; kernel_idx < kernel_volume / 2; kernel_idx++) {
+        int _kernel_idx = kernel_idx;
+        for (int i = 1; i <= NDim - 1; i++) {
+          int cur_offset = _kernel_idx % kernel_sizes[i - 1];
+          cur_offset -= (kernel_sizes[i - 1] - 1) / 2;
+          coords_out[i] = in_coords[idx * NDim + i] + cur_offset;
+          _kernel_idx /= kernel_sizes[i - 1];
+        }
+        if (!in_range_cpu(coords_out, coords_min, coords_max)) continue;
+        type_int grid_index =
+            transform_coords_cpu<type_int>(coords_out, coords_min, coords_max);
+        int input_idx = table.lookup(grid_index + 1) - 1;
+        if (input_idx >= 0) {
+          out_in_map[idx * kernel_volume + kernel_idx] = input_idx;
+          out_in_map[input_idx * kernel_volume + kernel_volume - 1 -
+                     kernel_idx] = idx;
+        }
+      }
+    }
+  } else {
+#pragma omp parallel for
+    for (int idx = 0; idx < n_points; idx++) {
+      int coords_out[NDim];
+      coords_out[0] = in_coords[idx * NDim];
+      for (int kernel_idx = 0; kernel_idx < kernel_volume; kernel_idx++) {
+        int _kernel_idx = kernel_idx;
+        for (int i = NDim - 1; i > 0; i--) {
+          int cur_offset = _kernel_idx % kernel_sizes[i - 1];
+          coords_out[i] = in_coords[idx * NDim + i] + cur_offset;
+          _kernel_idx /= kernel_sizes[i - 1];
+        }
+        if (!in_range_cpu(coords_out, coords_min, coords_max)) continue;
+        type_int grid_index =
+            transform_coords_cpu<type_int>(coords_out, coords_min, coords_max);
+        int input_idx = table.lookup(grid_index + 1) - 1;
+        if (input_idx >= 0) {
+          out_in_map[idx * kernel_volume + kernel_idx] = input_idx;
+        }
+      }
+    }
+  }
+  return {_out_in_map};
+}
+
+template <typename type_hashtable, typename type_int>
+std::vector<at::Tensor> build_kernel_map_downsample_hashmap_cpu_template(
+    type_hashtable &table, at::Tensor _in_coords, at::Tensor _coords_min,
+    at::Tensor _coords_max, at::Tensor _kernel_sizes, at::Tensor _stride,
+    at::Tensor _padding) {
+  int n_points = _in_coords.size(0);
+  int kernel_volume = (int)(torch::prod(_kernel_sizes).item<int>());
+  const int *in_coords = _in_coords.data_ptr<int>();
+  const int *coords_min = _coords_min.data_ptr<int>();
+  const int *coords_max = _coords_max.data_ptr<int>();
+  const int *kernel_sizes = _kernel_sizes.data_ptr<int>();
+  const int *stride = _stride.data_ptr<int>();
+  const int *padding = _padding.data_ptr<int>();
+  bool odd = kernel_volume % 2 == 1;
+  auto options = torch::TensorOptions()
+                     .dtype(at::ScalarType::Int)
+                     .device(_in_coords.device());
+  auto options_key = torch::TensorOptions()
+                         .dtype(c10::CppTypeToScalarType<type_int>::value)
+                         .device(_in_coords.device());
+
+  // stage1: ravel every candidate output of every input point
+  at::Tensor _out_kmap =
+      torch::full({n_points, kernel_volume}, -1, options_key);
+  type_int *out_kmap = _out_kmap.data_ptr<type_int>();
+#pragma omp parallel for
+  for (int idx = 0; idx < n_points; idx++) {
+    int coords_out[NDim];
+    coords_out[0] = in_coords[idx * NDim];
+    for (int kernel_idx = 0; kernel_idx < kernel_volume; kernel_idx++) {
+      int _kernel_idx = kernel_idx;
+      bool valid = true;
+      for (int j = 1; j <= NDim - 1; j++) {
+        // odd kernels enumerate x first, even kernels z first
+        int i = odd ? j : NDim - j;
+        int cur_offset = _kernel_idx % kernel_sizes[i - 1];
+        cur_offset -= (kernel_sizes[i - 1] - 1);
+        coords_out[i] = in_coords[idx * NDim + i] + padding[i - 1] + cur_offset;
+        if (coords_out[i] % stride[i - 1] != 0) {
+          valid = false;
+          break;
+        }
+        coords_out[i] /= stride[i - 1];
+        _kernel_idx /= kernel_sizes[i - 1];
+      }
+      if (valid && in_range_cpu(coords_out, coords_min, coords_max)) {
+        out_kmap[idx * kernel_volume + kernel_idx] =
+            transform_coords_cpu<type_int>(coords_out, coords_min, coords_max);
+      }
+    }
+  }
+
+  // stage2: get unique coordinates and insert them to the hashmap.
+  at::Tensor _out_coords =
+      std::get<0>(torch::_unique(_out_kmap.masked_select(_out_kmap >= 0)));
+  const type_int *out_coords = _out_coords.data_ptr<type_int>();
+  int n_out_points = _out_coords.size(0);
+  int capacity = table.get_capacity();
+  if (capacity < n_out_points)
+    throw std::invalid_argument(
+        "The capacity of hashtable is not sufficient. Please enlarge reserved "
+        "space for hashtable:\n # Python \nimport "
+        "torchsparse.backends\ntorchsparse.backends.hash_rsv_ratio=#Value");
+
+  at::Tensor final_out_coords = torch::zeros({n_out_points, NDim}, options);
+  int *final_out_coords_ptr = final_out_coords.data_ptr<int>();
+  bool full = false;
+#pragma omp parallel for
+  for (int idx = 0; idx < n_out_points; idx++) {
+    inverse_transform_coords_cpu<type_int>(out_coords[idx], coords_min,
+                                           coords_max,
+                                           final_out_coords_ptr + idx * NDim);
+    if (!table.insert(out_coords[idx] + 1, idx + 1)) full = true;
+  }
+  if (full) type_hashtable::throw_capacity_error();
+
+  // stage3: replace the coordinate ravel hashes with the output idx
+  int divisor = table.get_divisor();
+  at::Tensor _out_in_map = torch::full(
+      {(n_out_points + divisor - 1) / divisor * divisor, kernel_volume}, -1,
+      options);
+  int *out_in_map = _out_in_map.data_ptr<int>();
+#pragma omp parallel for
+  for (int idx = 0; idx < n_points; idx++) {
+    for (int kernel_idx = 0; kernel_idx < kernel_volume; kernel_idx++) {
+      type_int opt_coords = out_kmap[idx * kernel_volume + kernel_idx];
+      if (opt_coords >= 0) {
+        int oidx = table.lookup(opt_coords + 1) - 1;
+        out_in_map[oidx * kernel_volume + kernel_volume - 1 - kernel_idx] =
+            idx;
+      }
+    }
+  }
+  return {_out_in_map, final_out_coords};
+}
+
+std::vector<at::Tensor> build_kernel_map_subm_hashmap_cpu(
+    hashtable_cpu &table, at::Tensor _in_coords, at::Tensor _coords_min,
+    at::Tensor _coords_max, at::Tensor _kernel_sizes, at::Tensor _stride,
+    at::Tensor _padding, bool to_insert) {
+  return build_kernel_map_subm_hashmap_cpu_template<hashtable_cpu, int64_t>(
+      table, _in_coords, _coords_min, _coords_max, _kernel_sizes, to_insert);
+}
+
+std::vector<at::Tensor> build_kernel_map_subm_hashmap_int32_cpu(
+    hashtable32_cpu &table, at::Tensor _in_coords, at::Tensor _coords_min,
+    at::Tensor _coords_max, at::Tensor _kernel_sizes, at::Tensor _stride,
+    at::Tensor _padding, bool to_insert) {
+  return build_kernel_map_subm_hashmap_cpu_template<hashtable32_cpu, int32_t>(
+      table, _in_coords, _coords_min, _coords_max, _kernel_sizes, to_insert);
+}
+
+std::vector<at::Tensor> build_kernel_map_downsample_hashmap_cpu(
+    hashtable_cpu &table, at::Tensor _in_coords, at::Tensor _coords_min,
+    at::Tensor _coords_max, at::Tensor _kernel_sizes, at::Tensor _stride,
+    at::Tensor _padding, bool to_insert) {
+  return build_kernel_map_downsample_hashmap_cpu_template<hashtable_cpu,
+                                                          int64_t>(
+      table, _in_coords, _coords_min, _coords_max, _kernel_sizes, _stride,
+      _padding);
+}
+
+std::vector<at::Tensor> build_kernel_map_downsample_hashmap_int32_cpu(
+    hashtable32_cpu &table, at::Tensor _in_coords, at::Tensor _coords_min,
+    at::Tensor _coords_max, at::Tensor _kernel_sizes, at::Tensor _stride,
+    at::Tensor _padding, bool to_insert) {
+  return build_kernel_map_downsample_hashmap_cpu_template<hashtable32_cpu,
+                                                          int32_t>(
+      table, _in_coords, _coords_min, _coords_max, _kernel_sizes, _stride,
+      _padding);
+}
@@ -0,0 +1,28 @@
+#pragma once
+
+#include <torch/torch.h>
+#include "../hashmap/hashmap_cpu.hpp"
+
+std::vector<at::Tensor> build_kernel_map_subm_hashmap_cpu(
+    hashtable_cpu& table,
+    at::Tensor _in_coords, at::Tensor _coords_min, at::Tensor _coords_max,
+    at::Tensor _kernel_sizes, at::Tensor _stride,
+    at::Tensor padding, bool to_insert);
+
+std::vector<at::Tensor> build_kernel_map_downsample_hashmap_cpu(
+    hashtable_cpu& table,
+    at::Tensor _in_coords, at::Tensor _coords_min, at::Tensor _coords_max,
+    at::Tensor _kernel_sizes, at::Tensor _stride,
+    at::Tensor _padding, bool to_insert);
+
+std::vector<at::Tensor> build_kernel_map_subm_hashmap_int32_cpu(
+    hashtable32_cpu& table,
+    at::Tensor _in_coords, at::Tensor _coords_min, at::Tensor _coords_max,
+    at::Tensor _kernel_sizes, at::Tensor _stride,
+    at::Tensor padding, bool to_insert);
+
+std::vector<at::Tensor> build_kernel_map_downsample_hashmap_int32_cpu(
+    hashtable32_cpu& table,
+    at::Tensor _in_coords, at::Tensor _coords_min, at::Tensor _coords_max,
+    at::Tensor _kernel_sizes, at::Tensor _stride,
+    at::Tensor _padding, bool to_insert);
@@ -2,22 +2,66 @@
 #include <torch/extension.h>
 #include <torch/serialize/tensor.h>
 
+#include "convolution/convolution_fetch_on_demand_cpu.h"
 #include "convolution/convolution_gather_scatter_cpu.h"
+#include "convolution/convolution_implicit_gemm_cpu.h"
 #include "devoxelize/devoxelize_cpu.h"
 #include "hash/hash_cpu.h"
+#include "hashmap/hashmap_cpu.hpp"
 #include "others/count_cpu.h"
+#include "others/downsample_cpu.h"
 #include "others/query_cpu.h"
+#include "others/reduce_bitmask_cpu.h"
+#include "others/reorder_map_cpu.h"
+#include "others/sparsemapping_cpu.h"
 #include "voxelize/voxelize_cpu.h"
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
+  py::class_<hashtable_cpu>(m, "CPUHashTable")
+        .def(py::init<const int>())
+        .def(py::init<torch::Tensor, torch::Tensor>())
+        .def(py::init<torch::Tensor, torch::Tensor, bool>())
+        .def("insert_vals", &hashtable_cpu::insert_vals)
+        .def("lookup_vals", &hashtable_cpu::lookup_vals)
+        .def("insert_coords", &hashtable_cpu::insert_coords)
+        .def("lookup_coords", &hashtable_cpu::lookup_coords)
+        .def("lookup_coords_subm", &hashtable_cpu::lookup_coords_subm)
+        .def("lookup_offsets", &hashtable_cpu::lookup_offsets);
+  py::class_<hashtable32_cpu>(m, "CPUHashTable32")
+        .def(py::init<const int>())
+        .def(py::init<torch::Tensor, torch::Tensor>())
+        .def(py::init<torch::Tensor, torch::Tensor, bool>())
+        .def("insert_vals", &hashtable32_cpu::insert_vals)
+        .def("lookup_vals", &hashtable32_cpu::lookup_vals)
+        .def("insert_coords", &hashtable32_cpu::insert_coords)
+        .def("lookup_coords", &hashtable32_cpu::lookup_coords)
+        .def("lookup_coords_subm", &hashtable32_cpu::lookup_coords_subm)
+        .def("lookup_offsets", &hashtable32_cpu::lookup_offsets);
   m.def("conv_forward_gather_scatter_cpu", &conv_forward_gather_scatter_cpu);
   m.def("conv_backward_gather_scatter_cpu", &conv_backward_gather_scatter_cpu);
+  m.def("conv_forward_fetch_on_demand_cpu", &conv_forward_fetch_on_demand_cpu);
+  m.def("conv_forward_fetch_on_demand_no_fusion_cpu", &conv_forward_fetch_on_demand_no_fusion_cpu);
+  m.def("conv_forward_implicit_gemm_cpu", &conv_forward_implicit_gemm_cpu, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("num_out_feats"), py::arg("num_out_channels"));
+  m.def("conv_forward_implicit_gemm_sorted_cpu", &conv_forward_implicit_gemm_sorted_cpu, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("_reduced_mask"), py::arg("_reorder_loc"), py::arg("num_out_feats"), py::arg("num_out_channels"));
+  m.def("conv_backward_wgrad_implicit_gemm_cpu", &conv_backward_wgrad_implicit_gemm_cpu, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("split_k_iters"));
+  m.def("conv_backward_wgrad_implicit_gemm_sorted_cpu", &conv_backward_wgrad_implicit_gemm_sorted_cpu, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("_reduced_mask"), py::arg("_reorder_loc"), py::arg("split_k_iters"));
   m.def("voxelize_forward_cpu", &voxelize_forward_cpu);
   m.def("voxelize_backward_cpu", &voxelize_backward_cpu);
+  m.def("to_dense_forward_cpu", &to_dense_forward_cpu);
+  m.def("to_dense_backward_cpu", &to_dense_backward_cpu);
   m.def("devoxelize_forward_cpu", &devoxelize_forward_cpu);
   m.def("devoxelize_backward_cpu", &devoxelize_backward_cpu);
   m.def("hash_cpu", &hash_cpu);
   m.def("kernel_hash_cpu", &kernel_hash_cpu);
   m.def("hash_query_cpu", &hash_query_cpu);
+  m.def("convert_transposed_out_in_map_cpu", &convert_transposed_out_in_map_cpu);
+  m.def("derive_bitmask_from_out_in_map_cpu", &derive_bitmask_from_out_in_map_cpu);
+  m.def("reduce_bitmask_cpu", &reduce_bitmask_cpu);
+  m.def("reorder_out_in_map_cpu", &reorder_out_in_map_cpu);
   m.def("count_cpu", &count_cpu);
+  m.def("downsample_cpu", &downsample_cpu);
+  m.def("build_kernel_map_subm_hashmap_cpu", &build_kernel_map_subm_hashmap_cpu);
+  m.def("build_kernel_map_downsample_hashmap_cpu", &build_kernel_map_downsample_hashmap_cpu);
+  m.def("build_kernel_map_subm_hashmap_int32_cpu", &build_kernel_map_subm_hashmap_int32_cpu);
+  m.def("build_kernel_map_downsample_hashmap_int32_cpu", &build_kernel_map_downsample_hashmap_int32_cpu);
 }
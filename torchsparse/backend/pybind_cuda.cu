@@ -2,7 +2,9 @@
 #include <torch/extension.h>
 #include <torch/serialize/tensor.h>
 
+#include "convolution/convolution_fetch_on_demand_cpu.h"
 #include "convolution/convolution_gather_scatter_cpu.h"
+#include "convolution/convolution_implicit_gemm_cpu.h"
 #include "convolution/convolution_gather_scatter_cuda.h"
 #include "convolution/convolution_forward_fetch_on_demand_cuda.h"
 #include "convolution/convolution_forward_implicit_gemm_cuda.h"
@@ -14,10 +16,14 @@
 #include "hash/hash_cpu.h"
 #include "hash/hash_cuda.h"
 #include "others/count_cpu.h"
+#include "others/downsample_cpu.h"
 #include "others/count_cuda.h"
 #include "others/downsample_cuda.h"
 #include "others/exclusive_scan_cuda.h"
 #include "others/query_cpu.h"
+#include "others/reduce_bitmask_cpu.h"
+#include "others/reorder_map_cpu.h"
+#include "others/sparsemapping_cpu.h"
 #include "others/query_cuda.h"
 #include "others/reduce_bitmask_cuda.h"
 #include "others/reorder_map_cuda.h"
@@ -25,22 +31,47 @@
 #include "voxelize/voxelize_cpu.h"
 #include "voxelize/voxelize_cuda.h"
 #include "hashmap/hashmap_cuda.cuh"
+#include "hashmap/hashmap_cpu.hpp"
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   py::class_<hashtable>(m, "GPUHashTable")
         .def(py::init<const int>())
         .def(py::init<torch::Tensor, torch::Tensor>())
+        .def(py::init<torch::Tensor, torch::Tensor, bool>())
         .def("insert_vals", &hashtable::insert_vals)
         .def("lookup_vals", &hashtable::lookup_vals)
         .def("insert_coords", &hashtable::insert_coords)
-        .def("lookup_coords", &hashtable::lookup_coords);
+        .def("lookup_coords", &hashtable::lookup_coords)
+        .def("lookup_coords_subm", &hashtable::lookup_coords_subm);
   py::class_<hashtable32>(m, "GPUHashTable32")
         .def(py::init<const int>())
         .def(py::init<torch::Tensor, torch::Tensor>())
+        .def(py::init<torch::Tensor, torch::Tensor, bool>())
         .def("insert_vals", &hashtable32::insert_vals)
         .def("lookup_vals", &hashtable32::lookup_vals)
         .def("insert_coords", &hashtable32::insert_coords)
-        .def("lookup_coords", &hashtable32::lookup_coords);
+        .def("lookup_coords", &hashtable32::lookup_coords)
+        .def("lookup_coords_subm", &hashtable32::lookup_coords_subm);
+  py::class_<hashtable_cpu>(m, "CPUHashTable")
+        .def(py::init<const int>())
+        .def(py::init<torch::Tensor, torch::Tensor>())
+        .def(py::init<torch::Tensor, torch::Tensor, bool>())
+        .def("insert_vals", &hashtable_cpu::insert_vals)
+        .def("lookup_vals", &hashtable_cpu::lookup_vals)
+        .def("insert_coords", &hashtable_cpu::insert_coords)
+        .def("lookup_coords", &hashtable_cpu::lookup_coords)
+        .def("lookup_coords_subm", &hashtable_cpu::lookup_coords_subm)
+        .def("lookup_offsets", &hashtable_cpu::lookup_offsets);
+  py::class_<hashtable32_cpu>(m, "CPUHashTable32")
+        .def(py::init<const int>())
+        .def(py::init<torch::Tensor, torch::Tensor>())
+        .def(py::init<torch::Tensor, torch::Tensor, bool>())
+        .def("insert_vals", &hashtable32_cpu::insert_vals)
+        .def("lookup_vals", &hashtable32_cpu::lookup_vals)
+        .def("insert_coords", &hashtable32_cpu::insert_coords)
+        .def("lookup_coords", &hashtable32_cpu::lookup_coords)
+        .def("lookup_coords_subm", &hashtable32_cpu::lookup_coords_subm)
+        .def("lookup_offsets", &hashtable32_cpu::lookup_offsets);
   m.def("conv_forward_gather_scatter_cpu", &conv_forward_gather_scatter_cpu);
   m.def("conv_forward_gather_scatter_cuda", &conv_forward_gather_scatter_cuda);
   m.def("conv_forward_fetch_on_demand_cuda", &conv_forward_fetch_on_demand_cuda);
@@ -49,6 +80,12 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("conv_forward_implicit_gemm_sorted_cuda", &conv_forward_implicit_gemm_sorted_cuda, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("_reduced_mask"), py::arg("_reorder_loc"), py::arg("num_out_feats"), py::arg("num_out_channels"), py::arg("allow_tf32") = false, py::arg("allow_fp16") = true);
   m.def("conv_backward_wgrad_implicit_gemm_cuda", &conv_backward_wgrad_implicit_gemm_cuda, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("split_k_iters"), py::arg("allow_tf32") = false, py::arg("allow_fp16") = true);
   m.def("conv_backward_wgrad_implicit_gemm_sorted_cuda", &conv_backward_wgrad_implicit_gemm_sorted_cuda, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("_reduced_mask"), py::arg("_reorder_loc"), py::arg("split_k_iters"), py::arg("allow_tf32") = false, py::arg("allow_fp16") = true);
+  m.def("conv_forward_fetch_on_demand_cpu", &conv_forward_fetch_on_demand_cpu);
+  m.def("conv_forward_fetch_on_demand_no_fusion_cpu", &conv_forward_fetch_on_demand_no_fusion_cpu);
+  m.def("conv_forward_implicit_gemm_cpu", &conv_forward_implicit_gemm_cpu, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("num_out_feats"), py::arg("num_out_channels"));
+  m.def("conv_forward_implicit_gemm_sorted_cpu", &conv_forward_implicit_gemm_sorted_cpu, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("_reduced_mask"), py::arg("_reorder_loc"), py::arg("num_out_feats"), py::arg("num_out_channels"));
+  m.def("conv_backward_wgrad_implicit_gemm_cpu", &conv_backward_wgrad_implicit_gemm_cpu, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("split_k_iters"));
+  m.def("conv_backward_wgrad_implicit_gemm_sorted_cpu", &conv_backward_wgrad_implicit_gemm_sorted_cpu, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("_reduced_mask"), py::arg("_reorder_loc"), py::arg("split_k_iters"));
   m.def("conv_backward_gather_scatter_cpu", &conv_backward_gather_scatter_cpu);
   m.def("conv_backward_gather_scatter_cuda", &conv_backward_gather_scatter_cuda);
   m.def("voxelize_forward_cpu", &voxelize_forward_cpu);
@@ -57,6 +94,8 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("voxelize_backward_cuda", &voxelize_backward_cuda);
   m.def("to_dense_forward_cuda", &to_dense_forward_cuda);
   m.def("to_dense_backward_cuda", &to_dense_backward_cuda);
+  m.def("to_dense_forward_cpu", &to_dense_forward_cpu);
+  m.def("to_dense_backward_cpu", &to_dense_backward_cpu);
   m.def("devoxelize_forward_cpu", &devoxelize_forward_cpu);
   m.def("devoxelize_forward_cuda", &devoxelize_forward_cuda);
   m.def("devoxelize_backward_cpu", &devoxelize_backward_cpu);
@@ -72,12 +111,21 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("derive_bitmask_from_out_in_map", &derive_bitmask_from_out_in_map);
   m.def("reduce_bitmask_cuda", &reduce_bitmask_cuda);
   m.def("reorder_out_in_map_cuda", &reorder_out_in_map_cuda);
+  m.def("convert_transposed_out_in_map_cpu", &convert_transposed_out_in_map_cpu);
+  m.def("derive_bitmask_from_out_in_map_cpu", &derive_bitmask_from_out_in_map_cpu);
+  m.def("reduce_bitmask_cpu", &reduce_bitmask_cpu);
+  m.def("reorder_out_in_map_cpu", &reorder_out_in_map_cpu);
   m.def("build_kernel_map_subm_hashmap", &build_kernel_map_subm_hashmap);
   m.def("build_kernel_map_downsample_hashmap", &build_kernel_map_downsample_hashmap);
   m.def("build_kernel_map_subm_hashmap_int32", &build_kernel_map_subm_hashmap_int32);
   m.def("build_kernel_map_downsample_hashmap_int32", &build_kernel_map_downsample_hashmap_int32);
+  m.def("build_kernel_map_subm_hashmap_cpu", &build_kernel_map_subm_hashmap_cpu);
+  m.def("build_kernel_map_downsample_hashmap_cpu", &build_kernel_map_downsample_hashmap_cpu);
+  m.def("build_kernel_map_subm_hashmap_int32_cpu", &build_kernel_map_subm_hashmap_int32_cpu);
+  m.def("build_kernel_map_downsample_hashmap_int32_cpu", &build_kernel_map_downsample_hashmap_int32_cpu);
   m.def("build_mask_from_kmap", &build_mask_from_kmap);
   m.def("downsample_cuda", &downsample_cuda);
+  m.def("downsample_cpu", &downsample_cpu);
   m.def("count_cpu", &count_cpu);
   m.def("count_cuda", &count_cuda);
 }
@@ -1,26 +1,77 @@
 #include "voxelize_cpu.h"
 
+#include <ATen/OpMathType.h>
+#include <ATen/Parallel.h>
 #include <torch/torch.h>
 
+#include <algorithm>
 #include <vector>
 
+#include "../others/segment_csr_cpu.h"
+
+// voxelize: inputs (N x C), idx (N), counts (N1) -> out (N1 x C), the mean
+// of the points in every voxel. Points are grouped by voxel first so that
+// each voxel is reduced by a single thread, in fp32 for reduced precision.
+template <typename scalar_t>
+void voxelize_forward_kernel_cpu(int N1, int c, const scalar_t *inputs,
+                                 const int64_t *order, const int64_t *row_ptr,
+                                 const int *counts, scalar_t *out) {
+  using acc_t = at::opmath_type<scalar_t>;
+  at::parallel_for(0, N1, 64, [&](int64_t begin, int64_t end) {
+    std::vector<acc_t> acc(c);
+    for (int64_t pos = begin; pos < end; pos++) {
+      if (counts[pos] == 0 || row_ptr[pos] == row_ptr[pos + 1]) continue;
+      std::fill(acc.begin(), acc.end(), (acc_t)0);
+      for (int64_t e = row_ptr[pos]; e < row_ptr[pos + 1]; e++) {
+        const scalar_t *cur_inputs = inputs + order[e] * c;
+#pragma omp simd
+        for (int j = 0; j < c; j++) acc[j] += static_cast<acc_t>(cur_inputs[j]);
+      }
+      acc_t inv_count = (acc_t)1 / (acc_t)counts[pos];
+      scalar_t *cur_out = out + pos * c;
+#pragma omp simd
+      for (int j = 0; j < c; j++)
+        cur_out[j] = static_cast<scalar_t>(acc[j] * inv_count);
+    }
+  });
+}
+
+// voxelize backward: top_grad (N1 x C), idx (N) -> bottom_grad (N x C)
+template <typename scalar_t>
+void voxelize_backward_kernel_cpu(int N, int N1, int c,
+                                  const scalar_t *top_grad, const int *idx,
+                                  const int *counts, scalar_t *bottom_grad) {
+  using acc_t = at::opmath_type<scalar_t>;
+  at::parallel_for(0, N, 256, [&](int64_t begin, int64_t end) {
+    for (int64_t i = begin; i < end; i++) {
+      int pos = idx[i];
+      if (pos < 0 || pos >= N1 || counts[pos] == 0) continue;
+      acc_t inv_count = (acc_t)1 / (acc_t)counts[pos];
+      const scalar_t *cur_top = top_grad + (int64_t)pos * c;
+      scalar_t *cur_grad = bottom_grad + i * c;
+#pragma omp simd
+      for (int j = 0; j < c; j++)
+        cur_grad[j] =
+            static_cast<scalar_t>(static_cast<acc_t>(cur_top[j]) * inv_count);
+    }
+  });
+}
+
 at::Tensor voxelize_forward_cpu(const at::Tensor inputs, const at::Tensor idx,
                                 const at::Tensor counts) {
-  int N = inputs.size(0);
   int c = inputs.size(1);
   int N1 = counts.size(0);
-  at::Tensor out = torch::zeros(
-      {N1, c}, at::device(idx.device()).dtype(at::ScalarType::Float));
-  for (int i = 0; i < N; i++) {
-    int pos = *(idx.data_ptr<int>() + i);
-    if (*(counts.data_ptr<int>() + pos) == 0) continue;
-#pragma omp parallel for
-    for (int j = 0; j < c; j++) {
-      *(out.data_ptr<float>() + pos * c + j) +=
-          *(inputs.data_ptr<float>() + i * c + j) /
-          (float)(*(counts.data_ptr<int>() + pos));
-    }
-  }
+  at::Tensor out = torch::zeros({N1, c}, inputs.options());
+  std::vector<at::Tensor> csr = segment_csr_cpu(idx, N1);
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, inputs.scalar_type(),
+      "voxelize_forward_cpu", ([&] {
+        voxelize_forward_kernel_cpu<scalar_t>(
+            N1, c, inputs.data_ptr<scalar_t>(), csr[0].data_ptr<int64_t>(),
+            csr[1].data_ptr<int64_t>(), counts.data_ptr<int>(),
+            out.data_ptr<scalar_t>());
+      }));
   return out;
 }
 
@@ -28,16 +79,94 @@ at::Tensor voxelize_backward_cpu(const at::Tensor top_grad,
                                  const at::Tensor idx, const at::Tensor counts,
                                  const int N) {
   int c = top_grad.size(1);
-  at::Tensor bottom_grad = torch::zeros(
-      {N, c}, at::device(idx.device()).dtype(at::ScalarType::Float));
+  int N1 = counts.size(0);
+  at::Tensor bottom_grad = torch::zeros({N, c}, top_grad.options());
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, top_grad.scalar_type(),
+      "voxelize_backward_cpu", ([&] {
+        voxelize_backward_kernel_cpu<scalar_t>(
+            N, N1, c, top_grad.data_ptr<scalar_t>(), idx.data_ptr<int>(),
+            counts.data_ptr<int>(), bottom_grad.data_ptr<scalar_t>());
+      }));
+  return bottom_grad;
+}
+
+// to_dense: feats (N x C), coords (N x 4), output (B x H x W x D x C), or
+// (B x C x H x W x D) if channels_first
+// coords: batch, x, y, z
+template <typename scalar_t>
+void to_dense_forward_kernel_cpu(int N, int c, const scalar_t *feats,
+                                 const int *coords, const int *range,
+                                 bool channels_first, scalar_t *out) {
+  int64_t spatial = (int64_t)range[1] * range[2] * range[3];
+#pragma omp parallel for
   for (int i = 0; i < N; i++) {
-    if (*(counts.data_ptr<int>() + *(idx.data_ptr<int>() + i)) == 0) continue;
+    const int *cur_coords = coords + 4 * i;
+    int64_t pos = ((int64_t)cur_coords[1] * range[2] + cur_coords[2]) * range[3] +
+                  cur_coords[3];
+    const scalar_t *cur_feats = feats + (int64_t)i * c;
+    if (channels_first) {
+      scalar_t *cur_out = out + (int64_t)cur_coords[0] * c * spatial + pos;
+      for (int j = 0; j < c; j++) cur_out[j * spatial] = cur_feats[j];
+    } else {
+      std::copy(cur_feats, cur_feats + c,
+                out + ((int64_t)cur_coords[0] * spatial + pos) * c);
+    }
+  }
+}
+
+// to_dense: top_grad (B x H x W x D x C) or (B x C x H x W x D),
+// coords (N x 4), bottom_grad (N x C)
+template <typename scalar_t>
+void to_dense_backward_kernel_cpu(int N, int c, const scalar_t *top_grad,
+                                  const int *coords, const int *range,
+                                  bool channels_first, scalar_t *bottom_grad) {
+  int64_t spatial = (int64_t)range[1] * range[2] * range[3];
 #pragma omp parallel for
-    for (int j = 0; j < c; j++) {
-      *(bottom_grad.data_ptr<float>() + i * c + j) =
-          *(top_grad.data_ptr<float>() + *(idx.data_ptr<int>() + i) * c + j) /
-          (float)(*(counts.data_ptr<int>() + *(idx.data_ptr<int>() + i)));
+  for (int i = 0; i < N; i++) {
+    const int *cur_coords = coords + 4 * i;
+    int64_t pos = ((int64_t)cur_coords[1] * range[2] + cur_coords[2]) * range[3] +
+                  cur_coords[3];
+    scalar_t *cur_grad = bottom_grad + (int64_t)i * c;
+    if (channels_first) {
+      const scalar_t *cur_top =
+          top_grad + (int64_t)cur_coords[0] * c * spatial + pos;
+      for (int j = 0; j < c; j++) cur_grad[j] = cur_top[j * spatial];
+    } else {
+      const scalar_t *cur_top =
+          top_grad + ((int64_t)cur_coords[0] * spatial + pos) * c;
+      std::copy(cur_top, cur_top + c, cur_grad);
     }
   }
-  return bottom_grad;
+}
+
+void to_dense_forward_cpu(const at::Tensor inputs, const at::Tensor idx,
+                          const at::Tensor range, at::Tensor outputs,
+                          bool channels_first) {
+  int N = inputs.size(0);
+  int c = inputs.size(1);
+
+  AT_DISPATCH_FLOATING_TYPES_AND_HALF(
+      inputs.scalar_type(), "to_dense_forward_cpu", ([&] {
+        to_dense_forward_kernel_cpu<scalar_t>(
+            N, c, inputs.data_ptr<scalar_t>(), idx.data_ptr<int>(),
+            range.data_ptr<int>(), channels_first,
+            outputs.data_ptr<scalar_t>());
+      }));
+}
+
+void to_dense_backward_cpu(const at::Tensor top_grad, const at::Tensor idx,
+                           const at::Tensor range, const at::Tensor bottom_grad,
+                           bool channels_first) {
+  int N = bottom_grad.size(0);
+  int c = bottom_grad.size(1);
+
+  AT_DISPATCH_FLOATING_TYPES_AND_HALF(
+      top_grad.scalar_type(), "to_dense_backward_cpu", ([&] {
+        to_dense_backward_kernel_cpu<scalar_t>(
+            N, c, top_grad.data_ptr<scalar_t>(), idx.data_ptr<int>(),
+            range.data_ptr<int>(), channels_first,
+            bottom_grad.data_ptr<scalar_t>());
+      }));
 }
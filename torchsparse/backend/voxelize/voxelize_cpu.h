@@ -8,3 +8,11 @@ at::Tensor voxelize_forward_cpu(const at::Tensor inputs, const at::Tensor idx,
 at::Tensor voxelize_backward_cpu(const at::Tensor top_grad,
                                  const at::Tensor idx, const at::Tensor counts,
                                  const int N);
+
+void to_dense_forward_cpu(const at::Tensor inputs, const at::Tensor idx,
+                          const at::Tensor range, at::Tensor outputs,
+                          bool channels_first);
+
+void to_dense_backward_cpu(const at::Tensor top_grad, const at::Tensor idx,
+                           const at::Tensor range, const at::Tensor bottom_grad,
+                           bool channels_first);
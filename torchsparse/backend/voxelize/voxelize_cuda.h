@@ -10,8 +10,9 @@ at::Tensor voxelize_backward_cuda(const at::Tensor top_grad,
                                   const int N);
 
 void to_dense_forward_cuda(const at::Tensor inputs, const at::Tensor idx,
-                           const at::Tensor range, at::Tensor outputs);
+                           const at::Tensor range, at::Tensor outputs,
+                           bool channels_first);
 
 void to_dense_backward_cuda(const at::Tensor top_grad,
                             const at::Tensor idx, const at::Tensor range,
-                            const at::Tensor bottom_grad);
+                            const at::Tensor bottom_grad, bool channels_first);
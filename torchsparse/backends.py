@@ -1,11 +1,85 @@
+import threading
+
 import torch
 
 
+class Workspace:
+    """Scratch memory reused by the CPU convolution kernels.
+
+    Every thread keeps one growing byte buffer per device, and requests are
+    served as typed views of it. A buffer never grows beyond ``max_bytes``;
+    larger requests get a fresh tensor that is not retained. A view is only
+    valid until the next request from the same thread.
+    """
+
+    def __init__(self, max_bytes: int = 1 << 30) -> None:
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def _buffers(self):
+        if not hasattr(self._local, "buffers"):
+            self._local.buffers = {}
+        return self._local.buffers
+
+    def get(self, numel: int, dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+        nbytes = numel * torch.empty((), dtype=dtype).element_size()
+        device = torch.device(device)
+        if nbytes > self.max_bytes:
+            with self._lock:
+                self.num_overflows += 1
+            return torch.empty(numel, dtype=dtype, device=device)
+
+        buffers = self._buffers()
+        buffer = buffers.get(device)
+        if buffer is None or buffer.numel() < nbytes:
+            buffer = torch.empty(nbytes, dtype=torch.uint8, device=device)
+            buffers[device] = buffer
+            with self._lock:
+                self.num_allocs += 1
+                self.high_water_mark = max(self.high_water_mark, nbytes)
+        else:
+            with self._lock:
+                self.num_hits += 1
+        return buffer[:nbytes].view(dtype)
+
+    def clear(self) -> None:
+        self._buffers().clear()
+
+    def reset_stats(self) -> None:
+        self.high_water_mark = 0
+        self.num_allocs = 0
+        self.num_hits = 0
+        self.num_overflows = 0
+
+    def stats(self):
+        return {
+            "high_water_mark": self.high_water_mark,
+            "num_allocs": self.num_allocs,
+            "num_hits": self.num_hits,
+            "num_overflows": self.num_overflows,
+        }
+
+
 def init():
     global benchmark, allow_tf32, allow_fp16, device_capability, hash_rsv_ratio
+    global workspace, hash_key_mode, grid_max_bytes, compact_kmaps
     benchmark = False
-    device_capability = torch.cuda.get_device_capability()
-    device_capability = device_capability[0] * 100 + device_capability[1] * 10
+    if torch.cuda.is_available():
+        device_capability = torch.cuda.get_device_capability()
+        device_capability = device_capability[0] * 100 + device_capability[1] * 10
+    else:
+        device_capability = 0
     allow_tf32 = device_capability >= 800
     allow_fp16 = device_capability >= 750
     hash_rsv_ratio = 2  # default value, reserve 2x ( 2 * original_point_number) space for downsampling
+    workspace = Workspace()
+    # "auto": exact packed (b, x, y, z) keys when the spatial range allows,
+    # "packed": always packed keys, "fnv": always hashed keys
+    hash_key_mode = "auto"
+    # largest occupancy grid (in bytes) used by the "grid" kmap_mode
+    grid_max_bytes = 1 << 28
+    # keep the index maps of cached kernel maps as bitmasks and packed
+    # indices, expanded only while a convolution reads them
+    compact_kmaps = False
@@ -1,4 +1,5 @@
 from typing import List, Dict, Optional, Tuple, Union
+import weakref
 
 # import numpy as np
 import torch
@@ -6,6 +7,7 @@ import torch
 import torchsparse
 from torchsparse import SparseTensor
 from torchsparse.utils import make_ntuple
+from torchsparse.utils.kmap_cache import coords_fingerprint, get_kmap_cache
 
 from .func import *
 
@@ -33,13 +35,8 @@ def conv3d(
     stride = make_ntuple(stride, ndim=3)
     dilation = make_ntuple(dilation, ndim=3)
 
-    conv_mode = F.get_conv_mode()
-    if config is None:
-        config = F.conv_config.get_global_conv_config()
-        if config is None:
-            config = F.conv_config.get_default_conv_config(
-                conv_mode=conv_mode, training=training
-            )
+    config = _resolve_config(config, training)
+    input._caches.bind(input.stride, coords, input.spatial_range)
 
     # TODO: Deal with kernel volume > 32. (Split mask or unsort)
 
@@ -50,14 +47,11 @@ def conv3d(
         ConvolutionFunction = ImplicitGEMMConvolutionFuntion
     elif dataflow == F.Dataflow.GatherScatter:
         ConvolutionFunction = GatherScatterConvolutionFuntion
-        config.ifsort = False
     elif dataflow == F.Dataflow.FetchOnDemand:
         ConvolutionFunction = FetchOnDemandConvolutionFuntion
-        config.ifsort = False
     elif (
         dataflow == F.Dataflow.CodedCSR
     ):  # Placeholder for PCEngine integration. Mode name can be modified.
-        config.ifsort = False
         assert 0, "CodedCSR has not been integrated."
     else:
         raise ValueError("unsupported dataflow: {}".format(dataflow))
@@ -76,41 +70,74 @@ def conv3d(
         kmap = input._caches.kmaps.get((input.stride, kernel_size, stride, dilation))
 
         if kmap_mode != "hashmap_on_the_fly":
-            hashmap = input._caches.hashmaps.get(input.stride)
+            hashmap_stride = input.stride
         else:
-            hashmap = input._caches.hashmaps.get(
-                tuple(input.stride[k] * stride[k] for k in range(3))
-            )
+            # downsampling hash tables hold the output coordinates
+            hashmap_stride = tuple(input.stride[k] * stride[k] for k in range(3))
+        hashmap = input._caches.hashmaps.get(hashmap_stride)
         if hashmap is None:
-            hashmap_keys, hashmap_vals = None, None
+            hashmap_keys, hashmap_vals, hashmap_scheme = None, None, None
+        else:
+            hashmap_keys, hashmap_vals, hashmap_scheme = hashmap
+
+        if kmap_mode == "grid":
+            grid = input._caches.grids.get(input.stride)
         else:
-            hashmap_keys, hashmap_vals = hashmap
+            grid = None
+        if kmap_mode == "sorted":
+            sortedmap = input._caches.sortedmaps.get(input.stride)
+        else:
+            sortedmap = None
 
         spatial_range = input.spatial_range
 
+        if kmap is None and stride == (1, 1, 1):
+            # smaller submanifold kernels select columns of a cached kernel map
+            kmap = F.find_sub_kernel_map(
+                input._caches.kmaps,
+                input.stride,
+                kernel_size,
+                dilation,
+                dataflow,
+                config.ifsort,
+                training,
+            )
+            if kmap is not None:
+                kmap = _compact_kernel_map(kmap)
+                key = (input.stride, kernel_size, stride, dilation)
+                input._caches.kmaps[key] = kmap
+
         if kmap is None:
-            kmap = F.build_kernel_map(
+            kmap = _build_kernel_map(
                 coords,
-                feats.shape[0],
+                input.stride,
+                spatial_range,
                 kernel_size,
                 stride,
                 padding,
+                dilation,
                 hashmap_keys,
                 hashmap_vals,
-                spatial_range,
-                kmap_mode,
-                dataflow,
-                downsample_mode=config.downsample_mode,
-                training=training,
-                ifsort=config.ifsort,
-                split_mask_num=config.split_mask_num,
-                split_mask_num_bwd=config.split_mask_num_bwd,
+                hashmap_scheme,
+                grid,
+                sortedmap,
+                config,
+                training,
             )
 
-            hashmap = [kmap["hashmap_keys"], kmap["hashmap_vals"]]
+            hashmap = [
+                kmap["hashmap_keys"],
+                kmap["hashmap_vals"],
+                kmap["hashmap_scheme"],
+            ]
 
+            input._caches.hashmaps[hashmap_stride] = hashmap
+            if kmap["grid"] is not None:
+                input._caches.grids[input.stride] = kmap["grid"]
+            if kmap["sortedmap"] is not None:
+                input._caches.sortedmaps[input.stride] = kmap["sortedmap"]
+            # inserted last so that it cannot be evicted before it is pinned
             input._caches.kmaps[(input.stride, kernel_size, stride, dilation)] = kmap
-            input._caches.hashmaps[input.stride] = hashmap
 
         feats = ConvolutionFunction.apply(
             feats,
@@ -122,6 +149,12 @@ def conv3d(
 
         if bias is not None:
             feats += bias
+        if feats.requires_grad:
+            _pin_until_backward(
+                input._caches.kmaps,
+                (input.stride, kernel_size, stride, dilation),
+                feats,
+            )
         output = SparseTensor(
             coords=kmap["coords"],
             feats=feats,
@@ -131,17 +164,39 @@ def conv3d(
     else:
         tensor_stride = tuple(input.stride[k] // stride[k] for k in range(3))
         if not generative:
-            kmap = input._caches.kmaps.get(
-                (tensor_stride, kernel_size, stride, dilation)
-            )
-
-            kmap = F.transpose_kernel_map(
-                kmap,
+            # transposed kernel maps are cached next to the forward one, so
+            # that decoder layers sharing a downsampling map transpose it once
+            transposed_key = (
+                tensor_stride,
+                kernel_size,
+                stride,
+                dilation,
                 config.ifsort,
-                training=training,
-                split_mask_num=config.split_mask_num,
-                split_mask_num_bwd=config.split_mask_num_bwd,
+                config.split_mask_num,
+                config.split_mask_num_bwd,
+                training,
             )
+            kmap = input._caches.kmaps.get(transposed_key)
+            if kmap is None:
+                kmap = input._caches.kmaps.get(
+                    (tensor_stride, kernel_size, stride, dilation)
+                )
+                if kmap is None:
+                    raise RuntimeError(
+                        "The kernel map of the matching downsampling layer is not "
+                        "in the tensor cache (it may have been evicted, please "
+                        "increase the tensor cache max_bytes)."
+                    )
+
+                kmap = F.transpose_kernel_map(
+                    kmap,
+                    config.ifsort,
+                    training=training,
+                    split_mask_num=config.split_mask_num,
+                    split_mask_num_bwd=config.split_mask_num_bwd,
+                )
+                kmap = _compact_kernel_map(kmap)
+                input._caches.kmaps[transposed_key] = kmap
 
             feats = ConvolutionFunction.apply(
                 feats,
@@ -153,6 +208,8 @@ def conv3d(
 
             if bias is not None:
                 feats += bias
+            if feats.requires_grad:
+                _pin_until_backward(input._caches.kmaps, transposed_key, feats)
             output = SparseTensor(
                 coords=input._caches.cmaps[tensor_stride][0],
                 feats=feats,
@@ -199,12 +256,123 @@ def conv3d(
                 stride=tensor_stride,
                 spatial_range=input._caches.cmaps[tensor_stride][1],
             )
-            hashmap = [kmap["hashmap_keys"], kmap["hashmap_vals"]]
-            input._caches.kmaps = dict()  # new_kmap
-            input._caches.hashmaps = dict()
+            input._caches.kmaps.clear()  # new_kmap
+            input._caches.hashmaps.clear()
+            input._caches.grids.clear()
+            input._caches.sortedmaps.clear()
 
     output._caches = input._caches
     output._caches.cmaps.setdefault(
         output.stride, (output.coords, output.spatial_range)
     )
     return output
+
+
+def _resolve_config(config: Optional[Dict], training: bool) -> Dict:
+    from torchsparse.nn import functional as F
+
+    if config is None:
+        config = F.conv_config.get_global_conv_config()
+        if config is None:
+            config = F.conv_config.get_default_conv_config(
+                conv_mode=F.get_conv_mode(), training=training
+            )
+    if config.dataflow in (
+        F.Dataflow.GatherScatter,
+        F.Dataflow.FetchOnDemand,
+        F.Dataflow.CodedCSR,
+    ):
+        config.ifsort = False
+    return config
+
+
+def _build_kernel_map(
+    coords: torch.Tensor,
+    tensor_stride: Tuple[int, ...],
+    spatial_range: Optional[Tuple[int, ...]],
+    kernel_size: Tuple[int, ...],
+    stride: Tuple[int, ...],
+    padding: Union[int, Tuple[int, ...]],
+    dilation: Tuple[int, ...],
+    hashmap_keys: Optional[torch.Tensor],
+    hashmap_vals: Optional[torch.Tensor],
+    hashmap_scheme: Optional[Tuple],
+    grid: Optional[torch.Tensor],
+    sortedmap: Optional[List[torch.Tensor]],
+    config: Dict,
+    training: bool,
+) -> Dict:
+    # looks the kernel map up in the cross-tensor kmap cache before building it
+    from torchsparse.nn import functional as F
+
+    kmap_cache = get_kmap_cache()
+    if kmap_cache is not None:
+        cache_key = (
+            coords_fingerprint(coords),
+            str(coords.device),
+            tensor_stride,
+            kernel_size,
+            stride,
+            dilation,
+            make_ntuple(padding, ndim=3),
+            spatial_range,
+            config.kmap_mode,
+            config.dataflow,
+            config.downsample_mode,
+            config.ifsort,
+            config.split_mask_num,
+            config.split_mask_num_bwd,
+            training,
+            torchsparse.backends.hash_key_mode,
+        )
+        kmap = kmap_cache.get(cache_key, coords.device)
+        if kmap is not None:
+            return _compact_kernel_map(kmap)
+
+    kmap = F.build_kernel_map(
+        coords,
+        coords.shape[0],
+        kernel_size,
+        stride,
+        padding,
+        hashmap_keys,
+        hashmap_vals,
+        spatial_range,
+        config.kmap_mode,
+        config.dataflow,
+        downsample_mode=config.downsample_mode,
+        training=training,
+        ifsort=config.ifsort,
+        split_mask_num=config.split_mask_num,
+        split_mask_num_bwd=config.split_mask_num_bwd,
+        grid=grid,
+        hashmap_scheme=hashmap_scheme,
+        sortedmap=sortedmap,
+    )
+    if kmap_cache is not None:
+        kmap_cache.put(cache_key, kmap)
+    return _compact_kernel_map(kmap)
+
+
+def _compact_kernel_map(kmap: Dict) -> Dict:
+    # kernel maps are compacted as they enter the tensor cache
+    from torchsparse.nn import functional as F
+
+    if not torchsparse.backends.compact_kmaps:
+        return kmap
+    return F.compact_kernel_map(kmap)
+
+
+class _GraphPin:
+    # held by an autograd node, finalized when the node is freed
+    pass
+
+
+def _pin_until_backward(kmaps, key, feats: torch.Tensor) -> None:
+    # the kernel map is referenced by the autograd graph anyway, evicting it
+    # while the graph is alive would not free any memory; the graph is freed
+    # by the backward pass or when its outputs are dropped without one
+    kmaps.pin(key)
+    pin = _GraphPin()
+    feats.grad_fn.metadata.setdefault("torchsparse_pins", []).append(pin)
+    weakref.finalize(pin, kmaps.unpin, key)
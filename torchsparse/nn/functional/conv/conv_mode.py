@@ -1,6 +1,6 @@
 from enum import Enum
 
-_global_kmap_mode = "hashmap_on_the_fly"  # or "hashmap"
+_global_kmap_mode = "hashmap_on_the_fly"  # or "hashmap", "sorted", "grid"
 _global_downsample_mode = "spconv"  # or "minkowski"
 
 
@@ -11,12 +11,12 @@ def get_kmap_mode():
 
 def set_kmap_mode(kmap_mode: str):
     global _global_kmap_mode
-    if kmap_mode in ["hashmap_on_the_fly", "hashmap"]:
+    if kmap_mode in ["hashmap_on_the_fly", "hashmap", "sorted", "grid"]:
         _global_kmap_mode = kmap_mode
     else:
         assert (
             0
-        ), f'Unsupport kmap_mode: {kmap_mode}. Please set kmap_mode to "hashmap_on_the_fly" or "hashmap".'
+        ), f'Unsupport kmap_mode: {kmap_mode}. Please set kmap_mode to "hashmap_on_the_fly", "hashmap", "sorted" or "grid".'
 
 
 def get_downsample_mode():
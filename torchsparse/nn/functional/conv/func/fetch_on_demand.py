@@ -59,17 +59,6 @@ class FetchOnDemandConvolutionFuntion(Function):
         # qnbaddrs = qnbaddrs.int().contiguous()
         # nbsizes = nbsizes.int().contiguous()
 
-        if not input.device.type == "cuda":
-            if not transposed:
-                output = torch.zeros(
-                    sizes[1], weight.size(-1), dtype=input.dtype, device=input.device
-                )
-            else:
-                # TODO(Haotian): ensure the original, upsampled size to be the same.
-                output = torch.zeros(
-                    sizes[0], weight.size(-1), dtype=input.dtype, device=input.device
-                )
-
         if input.device.type == "cuda":
             if torch.float16 in [input.dtype, weight.dtype]:
                 input = input.to(torch.float16)
@@ -104,6 +93,41 @@ class FetchOnDemandConvolutionFuntion(Function):
                     )
                 )
 
+        elif input.device.type == "cpu":
+            if input.dtype != weight.dtype:
+                input = input.to(weight.dtype)
+
+            if config["FOD_fusion"] == True:
+                output = torchsparse.backend.conv_forward_fetch_on_demand_cpu(
+                    input,
+                    weight,
+                    nbmaps,
+                    mapsize,
+                    nbaddrs,
+                    qnbaddrs,
+                    sizes[1] if not transposed else sizes[0],
+                    qmapsize,
+                    transposed,
+                )
+            else:
+                workspace = torchsparse.backends.workspace.get(
+                    int(nbsizes.max()) * (weight.size(1) + weight.size(2)),
+                    input.dtype,
+                    input.device,
+                )
+                output = (
+                    torchsparse.backend.conv_forward_fetch_on_demand_no_fusion_cpu(
+                        input,
+                        weight,
+                        nbmaps,
+                        nbsizes,
+                        mapsize,
+                        sizes[1] if not transposed else sizes[0],
+                        transposed,
+                        workspace,
+                    )
+                )
+
         else:
             raise NotImplementedError
 
@@ -123,6 +147,8 @@ class FetchOnDemandConvolutionFuntion(Function):
         )
         grad_input = torch.zeros_like(input)
         grad_weight = torch.zeros_like(weight)
+        # Gather-Scatter expects (M, 2) pairs, Fetch-on-Demand stores (2, M).
+        nbmaps = nbmaps.t().contiguous()
 
         if grad_output.device.type == "cuda":
             torchsparse.backend.conv_backward_gather_scatter_cuda(
@@ -136,6 +162,11 @@ class FetchOnDemandConvolutionFuntion(Function):
                 transposed,
             )
         elif grad_output.device.type == "cpu":
+            workspace = torchsparse.backends.workspace.get(
+                int(nbsizes.max()) * (2 * weight.size(1) + weight.size(2)),
+                input.dtype,
+                input.device,
+            )
             torchsparse.backend.conv_backward_gather_scatter_cpu(
                 input,
                 grad_input,
@@ -145,6 +176,7 @@ class FetchOnDemandConvolutionFuntion(Function):
                 nbmaps,
                 nbsizes.cpu(),
                 transposed,
+                workspace,
             )
         else:
             raise NotImplementedError
@@ -80,8 +80,13 @@ class GatherScatterConvolutionFuntion(Function):  # TorchSparse_v2
                 buffer,
             )
         elif input.device.type == "cpu":
+            workspace = torchsparse.backends.workspace.get(
+                int(nbsizes.max()) * (weight.size(1) + weight.size(2)),
+                input.dtype,
+                input.device,
+            )
             torchsparse.backend.conv_forward_gather_scatter_cpu(
-                input, output, weight, nbmaps, nbsizes.cpu(), transposed
+                input, output, weight, nbmaps, nbsizes.cpu(), transposed, workspace
             )
         else:
             # use the native pytorch XLA APIs for the TPU.
@@ -124,6 +129,11 @@ class GatherScatterConvolutionFuntion(Function):  # TorchSparse_v2
                 transposed,
             )
         elif grad_output.device.type == "cpu":
+            workspace = torchsparse.backends.workspace.get(
+                int(nbsizes.max()) * (2 * weight.size(1) + weight.size(2)),
+                input.dtype,
+                input.device,
+            )
             torchsparse.backend.conv_backward_gather_scatter_cpu(
                 input,
                 grad_input,
@@ -133,6 +143,7 @@ class GatherScatterConvolutionFuntion(Function):  # TorchSparse_v2
                 nbmaps,
                 nbsizes.cpu(),
                 transposed,
+                workspace,
             )
         else:
             raise NotImplementedError
@@ -2,7 +2,13 @@ import torch
 
 import torchsparse.backend
 
-__all__ = ["sphashquery", "convert_transposed_out_in_map"]
+__all__ = [
+    "sphashquery",
+    "convert_transposed_out_in_map",
+    "derive_bitmask_from_out_in_map",
+    "reorder_out_in_map",
+    "reduce_bitmask",
+]
 
 
 def sphashquery(queries: torch.Tensor, references: torch.Tensor) -> torch.Tensor:
@@ -51,5 +57,30 @@ def convert_transposed_out_in_map(out_in_map, size):
         device=out_in_map.device,
         dtype=torch.int32,
     )
-    torchsparse.backend.convert_transposed_out_in_map(out_in_map, out_in_map_t)
+    if out_in_map.device.type == "cuda":
+        torchsparse.backend.convert_transposed_out_in_map(out_in_map, out_in_map_t)
+    else:
+        torchsparse.backend.convert_transposed_out_in_map_cpu(out_in_map, out_in_map_t)
     return out_in_map_t
+
+
+def derive_bitmask_from_out_in_map(out_in_map, split_mask_num, valid_n):
+    if out_in_map.device.type == "cuda":
+        return torchsparse.backend.derive_bitmask_from_out_in_map(
+            out_in_map, split_mask_num, valid_n
+        )
+    return torchsparse.backend.derive_bitmask_from_out_in_map_cpu(
+        out_in_map, split_mask_num, valid_n
+    )
+
+
+def reorder_out_in_map(out_in_map, reorder_loc):
+    if out_in_map.device.type == "cuda":
+        return torchsparse.backend.reorder_out_in_map_cuda(out_in_map, reorder_loc)
+    return torchsparse.backend.reorder_out_in_map_cpu(out_in_map, reorder_loc)
+
+
+def reduce_bitmask(bitmask, M_tile):
+    if bitmask.device.type == "cuda":
+        return torchsparse.backend.reduce_bitmask_cuda(bitmask, M_tile)
+    return torchsparse.backend.reduce_bitmask_cpu(bitmask, M_tile)
@@ -1,3 +1,8 @@
+from .kernel_map import *
 from .build_kmap import *
 from .downsample import *
 from .upsample import *
+from .derive_kmap import *
+from .update_kmap import *
+from .merge_kmap import *
+from .compact_kmap import *
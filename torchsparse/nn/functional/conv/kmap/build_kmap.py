@@ -1,12 +1,15 @@
 from typing import Dict, Tuple, Union
+from functools import partial
 import math
 import numpy as np
 import torch
 
 import torchsparse.backend
+import torchsparse.backends
 from torchsparse.utils import make_ntuple, make_tensor, make_divisible
 
 from .func import *
+from .kernel_map import KernelMap
 
 from ..conv_config import *
 
@@ -15,6 +18,14 @@ __all__ = ["build_kernel_map", "transpose_kernel_map"]
 cta_M = 128
 cta_M_wgrad = 64
 
+backward_fields = (
+    "out_in_map_bwd",
+    "reorder_out_in_map_bwd",
+    "reduced_sorted_mask_bwd_wgrad",
+    "reduced_sorted_mask_bwd_dgrad",
+    "reorder_loc_bwd",
+)
+
 
 def build_kernel_map(
     _coords: torch.Tensor,
@@ -33,10 +44,13 @@ def build_kernel_map(
     generative: bool = False,
     split_mask_num: int = 1,
     split_mask_num_bwd: int = 1,
+    grid: torch.Tensor = None,
+    hashmap_scheme: Tuple = None,
+    sortedmap: Tuple[torch.Tensor, torch.Tensor] = None,
 ) -> Dict:
     from torchsparse.nn import functional as F
 
-    kmap = dict(
+    kmap = KernelMap(
         [
             ("out_in_map", None),
             ("coords", None),
@@ -50,7 +64,13 @@ def build_kernel_map(
             ("output_mask", None),
             ("hashmap_keys", hashmap_keys),
             ("hashmap_vals", hashmap_vals),
+            # how the keys of the hash table were built, see hashmap.py
+            ("hashmap_scheme", hashmap_scheme),
             ("spatial_range", spatial_range),
+            # [grid]: dense occupancy grid of the input coordinates
+            ("grid", grid),
+            # [sorted]: sorted coordinate keys and their sorting permutation
+            ("sortedmap", sortedmap),
             # [Fetch-on-Demand]: (quantified) neighbor addresses
             ("nbaddrs", None),
             ("qnbaddrs", None),
@@ -73,11 +93,49 @@ def build_kernel_map(
     else:
         new_spatial_range = None
     subm = not (any(s > 1 for s in stride))
+    packed_keys = use_packed_keys(spatial_range, stride if generative else (1, 1, 1))
+    direct = (
+        not generative
+        and mode != "hashmap_on_the_fly"
+        and use_direct(_coords, kernel_size, stride)
+    )
     stride = make_tensor(stride, dtype=torch.int, device=_coords.device)
     padding = make_tensor(padding, dtype=torch.int, device=_coords.device)
     kernel_size = make_tensor(kernel_size, dtype=torch.int, device=_coords.device)
 
-    if mode == "hashmap_on_the_fly":
+    if mode == "grid" and (generative or not use_grid(_coords, spatial_range, grid)):
+        mode = "hashmap"
+
+    if direct:
+
+        if dataflow == Dataflow.ImplicitGEMM:
+            kmap = build_kmap_implicit_GEMM_direct(
+                kmap,
+                input_node_num,
+                _coords,
+                kernel_size,
+                stride,
+                cta_M=cta_M,
+                ifsort=ifsort,
+                split_mask_num=split_mask_num,
+            )
+
+        elif dataflow == Dataflow.GatherScatter:
+            kmap = build_kmap_Gather_Scatter_direct(
+                kmap, input_node_num, _coords, kernel_size, stride, cta_M=cta_M
+            )
+
+        elif dataflow == Dataflow.FetchOnDemand:
+            kmap = build_kmap_Fetch_on_Demand_direct(
+                kmap, input_node_num, _coords, kernel_size, stride, cta_M=cta_M
+            )
+
+        else:
+            raise ValueError(
+                "[Build kernel map] unsupported dataflow: {}".format(dataflow)
+            )
+
+    elif mode == "hashmap_on_the_fly":
         if generative:
             raise ValueError(
                 f"Unsupported kmap_mode: {mode} for generative convolution (please switch to kmap_mode=hashmap)."
@@ -145,6 +203,7 @@ def build_kernel_map(
                 downsample_mode=downsample_mode,
                 generative=generative,
                 split_mask_num=split_mask_num,
+                packed_keys=packed_keys,
             )
 
         elif dataflow == Dataflow.GatherScatter:
@@ -160,6 +219,7 @@ def build_kernel_map(
                 subm=subm,
                 downsample_mode=downsample_mode,
                 generative=generative,
+                packed_keys=packed_keys,
             )
 
         elif dataflow == Dataflow.FetchOnDemand:
@@ -175,6 +235,61 @@ def build_kernel_map(
                 subm=subm,
                 downsample_mode=downsample_mode,
                 generative=generative,
+                packed_keys=packed_keys,
+            )
+
+        else:
+            raise ValueError(
+                "[Build kernel map] unsupported dataflow: {}".format(dataflow)
+            )
+
+    elif mode == "sorted":
+
+        if dataflow == Dataflow.ImplicitGEMM:
+            kmap = build_kmap_implicit_GEMM_sorted(
+                kmap,
+                input_node_num,
+                _coords,
+                kernel_size,
+                stride,
+                padding=padding,
+                spatial_range=new_spatial_range,
+                cta_M=cta_M,
+                subm=subm,
+                ifsort=ifsort,
+                downsample_mode=downsample_mode,
+                generative=generative,
+                split_mask_num=split_mask_num,
+            )
+
+        elif dataflow == Dataflow.GatherScatter:
+            kmap = build_kmap_Gather_Scatter_sorted(
+                kmap,
+                input_node_num,
+                _coords,
+                kernel_size,
+                stride,
+                padding=padding,
+                spatial_range=new_spatial_range,
+                cta_M=cta_M,
+                subm=subm,
+                downsample_mode=downsample_mode,
+                generative=generative,
+            )
+
+        elif dataflow == Dataflow.FetchOnDemand:
+            kmap = build_kmap_Fetch_on_Demand_sorted(
+                kmap,
+                input_node_num,
+                _coords,
+                kernel_size,
+                stride,
+                padding=padding,
+                spatial_range=new_spatial_range,
+                cta_M=cta_M,
+                subm=subm,
+                downsample_mode=downsample_mode,
+                generative=generative,
             )
 
         else:
@@ -183,44 +298,152 @@ def build_kernel_map(
             )
 
     elif mode == "grid":
-        assert 0, "grid mode is temporarily deprecated."
+
+        if dataflow == Dataflow.ImplicitGEMM:
+            kmap = build_kmap_implicit_GEMM_grid(
+                kmap,
+                input_node_num,
+                _coords,
+                kernel_size,
+                stride,
+                padding=padding,
+                input_spatial_range=spatial_range,
+                spatial_range=new_spatial_range,
+                cta_M=cta_M,
+                subm=subm,
+                ifsort=ifsort,
+                downsample_mode=downsample_mode,
+                split_mask_num=split_mask_num,
+            )
+
+        elif dataflow == Dataflow.GatherScatter:
+            kmap = build_kmap_Gather_Scatter_grid(
+                kmap,
+                input_node_num,
+                _coords,
+                kernel_size,
+                stride,
+                padding=padding,
+                input_spatial_range=spatial_range,
+                spatial_range=new_spatial_range,
+                cta_M=cta_M,
+                subm=subm,
+                downsample_mode=downsample_mode,
+            )
+
+        elif dataflow == Dataflow.FetchOnDemand:
+            kmap = build_kmap_Fetch_on_Demand_grid(
+                kmap,
+                input_node_num,
+                _coords,
+                kernel_size,
+                stride,
+                padding=padding,
+                input_spatial_range=spatial_range,
+                spatial_range=new_spatial_range,
+                cta_M=cta_M,
+                subm=subm,
+                downsample_mode=downsample_mode,
+            )
+
+        else:
+            raise ValueError(
+                "[Build kernel map] unsupported dataflow: {}".format(dataflow)
+            )
 
     else:
         raise ValueError("[Build kernel map] unknown mode: {}".format(mode))
 
     if dataflow == Dataflow.ImplicitGEMM:
         if training:
-            out_in_map_bwd = F.convert_transposed_out_in_map(
-                kmap["out_in_map"], make_divisible(kmap["sizes"][0], cta_M)
-            )
-            bitmask_bwd = torchsparse.backend.derive_bitmask_from_out_in_map(
-                out_in_map_bwd, split_mask_num_bwd, kmap["sizes"][0]
-            )
-            sorted_mask_bwd, reorder_loc_bwd = torch.sort(bitmask_bwd, descending=True)
-            reorder_loc_bwd = reorder_loc_bwd.to(torch.int32)
-            reorder_out_in_map_bwd = torchsparse.backend.reorder_out_in_map_cuda(
-                out_in_map_bwd, reorder_loc_bwd
-            )
-            reduced_sorted_mask_bwd_wgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M_wgrad
-            )
-            reduced_sorted_mask_bwd_dgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M
+            # only derived when the backward pass reads them
+            kmap.set_lazy(
+                backward_fields,
+                partial(_build_backward_maps, split_mask_num_bwd=split_mask_num_bwd),
             )
         else:
-            out_in_map_bwd = None
-            reorder_out_in_map_bwd = None
-            reduced_sorted_mask_bwd_wgrad = None
-            reduced_sorted_mask_bwd_dgrad = None
-            reorder_loc_bwd = None
-        kmap["out_in_map_bwd"] = out_in_map_bwd
-        kmap["reorder_out_in_map_bwd"] = reorder_out_in_map_bwd
-        kmap["reduced_sorted_mask_bwd_wgrad"] = reduced_sorted_mask_bwd_wgrad
-        kmap["reduced_sorted_mask_bwd_dgrad"] = reduced_sorted_mask_bwd_dgrad
-        kmap["reorder_loc_bwd"] = reorder_loc_bwd
+            for name in backward_fields:
+                kmap[name] = None
     return kmap
 
 
+def _build_backward_maps(kmap: Dict, split_mask_num_bwd: int = 1) -> Tuple:
+    from torchsparse.nn import functional as F
+
+    out_in_map_bwd = F.convert_transposed_out_in_map(
+        kmap["out_in_map"], make_divisible(kmap["sizes"][0], cta_M)
+    )
+    bitmask_bwd = F.derive_bitmask_from_out_in_map(
+        out_in_map_bwd, split_mask_num_bwd, kmap["sizes"][0]
+    )
+    sorted_mask_bwd, reorder_loc_bwd = torch.sort(bitmask_bwd, descending=True)
+    reorder_loc_bwd = reorder_loc_bwd.to(torch.int32)
+    reorder_out_in_map_bwd = F.reorder_out_in_map(out_in_map_bwd, reorder_loc_bwd)
+    reduced_sorted_mask_bwd_wgrad = F.reduce_bitmask(sorted_mask_bwd, cta_M_wgrad)
+    reduced_sorted_mask_bwd_dgrad = F.reduce_bitmask(sorted_mask_bwd, cta_M)
+    return (
+        out_in_map_bwd,
+        reorder_out_in_map_bwd,
+        reduced_sorted_mask_bwd_wgrad,
+        reduced_sorted_mask_bwd_dgrad,
+        reorder_loc_bwd,
+    )
+
+
+def use_packed_keys(spatial_range, scale=(1, 1, 1)) -> bool:
+    """Whether the coordinate hash tables should be keyed on packed coords.
+
+    Packed keys are exact, but only defined for batch indices below 32766 and
+    coordinates within 16 bits, other coordinates are never found. With
+    torchsparse.backends.hash_key_mode set to "auto", they are used when the
+    spatial range guarantees this.
+    """
+    hash_key_mode = torchsparse.backends.hash_key_mode
+    if hash_key_mode == "packed":
+        return True
+    if hash_key_mode != "auto" or spatial_range is None:
+        return False
+    return spatial_range[0] < 32766 and all(
+        spatial_range[i + 1] * int(scale[i]) <= 32768 for i in range(3)
+    )
+
+
+def use_direct(coords: torch.Tensor, kernel_size, stride) -> bool:
+    """Whether the kernel map can be read off the coordinates directly.
+
+    This holds for downsampling with the kernel size equal to the stride on
+    every axis, where each input belongs to exactly one output. The output
+    coordinates are found on packed keys, so they must fit into 16 bits.
+    """
+    if not all(k == s for k, s in zip(kernel_size, stride)):
+        return False
+    if all(s == 1 for s in stride) or coords.shape[0] == 0:
+        return False
+    lo = coords.min(0).values.tolist()
+    hi = coords.max(0).values.tolist()
+    return (
+        lo[0] >= 0
+        and hi[0] < 32766
+        and all(l >= -32768 and h < 32768 for l, h in zip(lo[1:], hi[1:]))
+    )
+
+
+def use_grid(coords: torch.Tensor, spatial_range, grid: torch.Tensor = None) -> bool:
+    """Whether the kernel map can be built on a dense occupancy grid.
+
+    The grid needs a known spatial range, must fit in
+    torchsparse.backends.grid_max_bytes and must contain every coordinate.
+    """
+    if grid is not None:
+        return True
+    if spatial_range is None:
+        return False
+    if 4 * math.prod(spatial_range) > torchsparse.backends.grid_max_bytes:
+        return False
+    extent = make_tensor(spatial_range, dtype=torch.int, device=coords.device)
+    return bool(((coords >= 0) & (coords < extent)).all())
+
+
 def transpose_kernel_map(
     kmap: Dict,
     ifsort: bool = False,
@@ -230,76 +453,43 @@ def transpose_kernel_map(
 ) -> Dict:
     from torchsparse.nn import functional as F
 
+    # the transposed fields are added to a copy, so that kernel maps for
+    # different settings can be cached next to each other
+    kmap = kmap.copy() if isinstance(kmap, KernelMap) else KernelMap(kmap)
     out_in_map = F.convert_transposed_out_in_map(
         kmap["out_in_map"], make_divisible(kmap["sizes"][0], cta_M)
     )
 
+    transposed_backward_fields = tuple(name + "_t" for name in backward_fields)
     if ifsort:
         if training:
-            out_in_map_bwd = kmap["out_in_map"]
-            reorder_out_in_map_bwd = kmap["reorder_out_in_map"]
-            reorder_loc_bwd = kmap["reorder_loc"]
-            sorted_mask_bwd = kmap["sorted_mask"]
-            reduced_sorted_mask_bwd_wgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M_wgrad
-            )
-            reduced_sorted_mask_bwd_dgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M
-            )
-            kmap["out_in_map_bwd_t"] = out_in_map_bwd
-            kmap["reorder_out_in_map_bwd_t"] = reorder_out_in_map_bwd
-            kmap["reduced_sorted_mask_bwd_wgrad_t"] = reduced_sorted_mask_bwd_wgrad
-            kmap["reduced_sorted_mask_bwd_dgrad_t"] = reduced_sorted_mask_bwd_dgrad
-            kmap["reorder_loc_bwd_t"] = reorder_loc_bwd
+            kmap.set_lazy(transposed_backward_fields, _build_transposed_backward_maps)
         else:
-            kmap["out_in_map_bwd_t"] = None
-            kmap["reorder_out_in_map_bwd_t"] = None
-            kmap["reduced_sorted_mask_bwd_wgrad_t"] = None
-            kmap["reduced_sorted_mask_bwd_dgrad_t"] = None
-            kmap["reorder_loc_bwd_t"] = None
+            for name in transposed_backward_fields:
+                kmap[name] = None
 
-        bitmask = torchsparse.backend.derive_bitmask_from_out_in_map(
+        bitmask = F.derive_bitmask_from_out_in_map(
             out_in_map, split_mask_num, kmap["sizes"][0]
         )
         sorted_mask, reorder_loc = torch.sort(bitmask, descending=True)
         reorder_loc = reorder_loc.to(torch.int32)
-        reorder_out_in_map = torchsparse.backend.reorder_out_in_map_cuda(
-            out_in_map, reorder_loc
-        )
-        reduced_sorted_mask = torchsparse.backend.reduce_bitmask_cuda(
-            sorted_mask, cta_M
-        )
+        reorder_out_in_map = F.reorder_out_in_map(out_in_map, reorder_loc)
+        reduced_sorted_mask = F.reduce_bitmask(sorted_mask, cta_M)
         kmap["reorder_out_in_map_t"] = reorder_out_in_map
         kmap["reduced_sorted_mask_t"] = reduced_sorted_mask
         kmap["reorder_loc_t"] = reorder_loc
     else:
         if training:
-            out_in_map_bwd = kmap["out_in_map"]
-            bitmask_bwd = torchsparse.backend.derive_bitmask_from_out_in_map(
-                out_in_map_bwd, split_mask_num_bwd, kmap["sizes"][1]
-            )
-            sorted_mask_bwd, reorder_loc_bwd = torch.sort(bitmask_bwd, descending=True)
-            reorder_loc_bwd = reorder_loc_bwd.to(torch.int32)
-            reorder_out_in_map_bwd = torchsparse.backend.reorder_out_in_map_cuda(
-                out_in_map_bwd, reorder_loc_bwd
+            kmap.set_lazy(
+                transposed_backward_fields,
+                partial(
+                    _build_transposed_backward_maps,
+                    split_mask_num_bwd=split_mask_num_bwd,
+                ),
             )
-            reduced_sorted_mask_bwd_wgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M_wgrad
-            )
-            reduced_sorted_mask_bwd_dgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M
-            )
-            kmap["out_in_map_bwd_t"] = out_in_map_bwd
-            kmap["reorder_out_in_map_bwd_t"] = reorder_out_in_map_bwd
-            kmap["reduced_sorted_mask_bwd_wgrad_t"] = reduced_sorted_mask_bwd_wgrad
-            kmap["reduced_sorted_mask_bwd_dgrad_t"] = reduced_sorted_mask_bwd_dgrad
-            kmap["reorder_loc_bwd_t"] = reorder_loc_bwd
         else:
-            kmap["out_in_map_bwd_t"] = None
-            kmap["reorder_out_in_map_bwd_t"] = None
-            kmap["reduced_sorted_mask_bwd_wgrad_t"] = None
-            kmap["reduced_sorted_mask_bwd_dgrad_t"] = None
-            kmap["reorder_loc_bwd_t"] = None
+            for name in transposed_backward_fields:
+                kmap[name] = None
         kmap["reorder_out_in_map_t"] = None
         kmap["reduced_sorted_mask_t"] = None
         kmap["reorder_loc_t"] = None
@@ -307,3 +497,33 @@ def transpose_kernel_map(
     kmap["out_in_map_t"] = out_in_map
 
     return kmap
+
+
+def _build_transposed_backward_maps(
+    kmap: Dict, split_mask_num_bwd: int = None
+) -> Tuple:
+    from torchsparse.nn import functional as F
+
+    # the backward pass of a transposed convolution uses the forward kernel map
+    out_in_map_bwd = kmap["out_in_map"]
+    if split_mask_num_bwd is None:
+        # sorted forward kernel map
+        reorder_out_in_map_bwd = kmap["reorder_out_in_map"]
+        reorder_loc_bwd = kmap["reorder_loc"]
+        sorted_mask_bwd = kmap["sorted_mask"]
+    else:
+        bitmask_bwd = F.derive_bitmask_from_out_in_map(
+            out_in_map_bwd, split_mask_num_bwd, kmap["sizes"][1]
+        )
+        sorted_mask_bwd, reorder_loc_bwd = torch.sort(bitmask_bwd, descending=True)
+        reorder_loc_bwd = reorder_loc_bwd.to(torch.int32)
+        reorder_out_in_map_bwd = F.reorder_out_in_map(out_in_map_bwd, reorder_loc_bwd)
+    reduced_sorted_mask_bwd_wgrad = F.reduce_bitmask(sorted_mask_bwd, cta_M_wgrad)
+    reduced_sorted_mask_bwd_dgrad = F.reduce_bitmask(sorted_mask_bwd, cta_M)
+    return (
+        out_in_map_bwd,
+        reorder_out_in_map_bwd,
+        reduced_sorted_mask_bwd_wgrad,
+        reduced_sorted_mask_bwd_dgrad,
+        reorder_loc_bwd,
+    )
@@ -0,0 +1,135 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from functools import partial
+import torch
+
+from .kernel_map import KernelMap
+
+__all__ = [
+    "compact_out_in_map",
+    "expand_out_in_map",
+    "compact_kernel_map",
+    "expand_kernel_map",
+]
+
+compact_fields = (
+    "out_in_map",
+    "reorder_out_in_map",
+    "out_in_map_bwd",
+    "reorder_out_in_map_bwd",
+    "out_in_map_t",
+    "reorder_out_in_map_t",
+    "out_in_map_bwd_t",
+    "reorder_out_in_map_bwd_t",
+)
+
+suffix = "_compact"
+
+
+def compact_out_in_map(out_in_map: torch.Tensor) -> Tuple:
+    """Occupancy bitmask and packed input indices of an out_in_map.
+
+    Bit k % 32 of bitmask[i, k // 32] is set if out_in_map[i, k] is valid,
+    and the valid entries are packed row by row into indices. Returns
+    (bitmask, indices, shape).
+    """
+    rows, kernel_volume = out_in_map.shape
+    bitmask = torch.zeros(
+        (rows, (kernel_volume + 31) // 32), dtype=torch.long, device=out_in_map.device
+    )
+    for k in range(kernel_volume):
+        bitmask[:, k // 32] |= (out_in_map[:, k] >= 0).long() << (k % 32)
+    # wrap the words into the int32 range
+    bitmask = torch.where(bitmask >= 1 << 31, bitmask - (1 << 32), bitmask).int()
+    indices = out_in_map[out_in_map >= 0]
+    return bitmask, indices, (rows, kernel_volume)
+
+
+def expand_out_in_map(compact: Tuple) -> torch.Tensor:
+    """The out_in_map of `compact_out_in_map`, with -1 for missing entries."""
+    bitmask, indices, (rows, kernel_volume) = compact
+    valid = torch.empty((rows, kernel_volume), dtype=torch.bool, device=bitmask.device)
+    for k in range(kernel_volume):
+        valid[:, k] = ((bitmask[:, k // 32] >> (k % 32)) & 1).bool()
+    out_in_map = torch.full(
+        (rows, kernel_volume), -1, dtype=indices.dtype, device=indices.device
+    )
+    out_in_map[valid] = indices
+    return out_in_map
+
+
+def compact_kernel_map(kmap: Dict) -> KernelMap:
+    """Copy of `kmap` that keeps its index maps in compact form.
+
+    Every out_in_map-like field, including backward and transposed ones
+    that are computed later, is kept as a bitmask and packed indices (see
+    `compact_out_in_map`). Reading such a field expands it again without
+    storing the result, so the dense map only lives while a convolution
+    uses it.
+    """
+    kmap = kmap.copy() if isinstance(kmap, KernelMap) else KernelMap(kmap)
+    groups: Dict[Callable, Tuple[str, ...]] = {}
+    for name in compact_fields:
+        if kmap.is_lazy(name):
+            names, fn, cache = kmap.get_lazy(name)
+            if cache:
+                groups[fn] = names
+        elif dict.get(kmap, name) is not None:
+            kmap[name + suffix] = compact_out_in_map(dict.__getitem__(kmap, name))
+            kmap.set_lazy((name,), partial(_expand_field, name), cache=False)
+        elif name + suffix in kmap and name not in kmap:
+            # compact fields that were saved or copied without registrations
+            kmap.set_lazy((name,), partial(_expand_field, name), cache=False)
+
+    # pending fields are compacted once they are computed
+    for fn, names in groups.items():
+        positions = [i for i, name in enumerate(names) if name in compact_fields]
+        kmap.set_lazy(
+            tuple(
+                name + suffix if i in positions else name
+                for i, name in enumerate(names)
+            ),
+            partial(_compact_results, fn, positions),
+        )
+        for i in positions:
+            kmap.set_lazy((names[i],), partial(_expand_field, names[i]), cache=False)
+    return kmap
+
+
+def expand_kernel_map(kmap: Dict) -> Dict:
+    """Copy of `kmap` with dense index maps, the inverse of `compact_kernel_map`.
+
+    Kernel maps without compact fields are returned as they are.
+    """
+    if not isinstance(kmap, KernelMap) or not any(
+        name + suffix in kmap for name in compact_fields
+    ):
+        return kmap
+    kmap = kmap.copy()
+    for name in compact_fields:
+        if kmap.is_lazy(name + suffix):
+            # restore the registration of fields that are still pending
+            names, fn, _ = kmap.get_lazy(name + suffix)
+            original = tuple(
+                n[: -len(suffix)] if n.endswith(suffix) else n for n in names
+            )
+            for n in names:
+                del kmap[n]
+            kmap.set_lazy(original, fn.args[0])
+        elif name + suffix in kmap:
+            compact = dict.__getitem__(kmap, name + suffix)
+            del kmap[name + suffix]
+            kmap[name] = None if compact is None else expand_out_in_map(compact)
+    return kmap
+
+
+def _expand_field(name: str, kmap: Dict) -> Tuple[Optional[torch.Tensor]]:
+    compact = kmap[name + suffix]
+    return (None if compact is None else expand_out_in_map(compact),)
+
+
+def _compact_results(fn: Callable, positions: List[int], kmap: Dict) -> List:
+    values = list(fn(kmap))
+    for i in positions:
+        if values[i] is not None:
+            values[i] = compact_out_in_map(values[i])
+    return values
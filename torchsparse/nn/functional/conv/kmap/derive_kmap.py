@@ -0,0 +1,195 @@
+from typing import Any, Dict, Optional, Tuple
+from functools import partial
+import torch
+
+import torchsparse.backend
+
+from .build_kmap import _build_backward_maps, backward_fields
+from .compact_kmap import expand_kernel_map
+from .func.sortedmap import kernel_offsets
+from .kernel_map import KernelMap
+
+__all__ = ["derive_kernel_map", "derive_sub_kernel_map", "find_sub_kernel_map"]
+
+cta_M = 128
+
+
+def derive_kernel_map(kmap: Dict, out_in_map: torch.Tensor, **fields: Any) -> Dict:
+    """Kernel map with the dataflow of `kmap` and a new out_in_map.
+
+    `fields` replace fields of `kmap` before the remaining ones (sorted maps,
+    gather-scatter or fetch-on-demand maps) are derived from `out_in_map`.
+    Backward maps are derived on demand and transposed fields are left out.
+    """
+    from torchsparse.nn import functional as F
+
+    kmap = expand_kernel_map(kmap)
+    new_kmap = KernelMap({k: v for k, v in kmap.items() if not k.endswith("_t")})
+    new_kmap["out_in_map"] = out_in_map
+    for name, value in fields.items():
+        new_kmap[name] = value
+    num_out = new_kmap["sizes"][1]
+
+    if kmap["nbaddrs"] is not None:
+        _derive_Fetch_on_Demand(new_kmap)
+    elif kmap["nbmaps"] is not None:
+        _derive_Gather_Scatter(new_kmap)
+    else:
+        if kmap["reorder_out_in_map"] is not None:
+            bitmask = F.derive_bitmask_from_out_in_map(
+                out_in_map, kmap["sorted_mask"].shape[0], num_out
+            )
+            sorted_mask, reorder_loc = torch.sort(bitmask, descending=True)
+            reorder_loc = reorder_loc.to(torch.int32)
+            new_kmap["reorder_out_in_map"] = F.reorder_out_in_map(
+                out_in_map, reorder_loc
+            )
+            new_kmap["reduced_sorted_mask"] = F.reduce_bitmask(sorted_mask, cta_M)
+            new_kmap["reorder_loc"] = reorder_loc
+            new_kmap["sorted_mask"] = sorted_mask
+        if isinstance(kmap, KernelMap) and kmap.is_lazy("out_in_map_bwd"):
+            new_kmap.set_lazy(*kmap.get_lazy("out_in_map_bwd"))
+        elif kmap.get("out_in_map_bwd") is not None:
+            new_kmap.set_lazy(
+                backward_fields,
+                partial(
+                    _build_backward_maps,
+                    split_mask_num_bwd=kmap["reorder_loc_bwd"].shape[0],
+                ),
+            )
+    return new_kmap
+
+
+def derive_sub_kernel_map(
+    kmap: Dict, kernel_size: Tuple[int, ...], sub_kernel_size: Tuple[int, ...]
+) -> Dict:
+    """Submanifold kernel map of a smaller, centered kernel.
+
+    Both kernels must have odd sizes and `sub_kernel_size` must fit into
+    `kernel_size` along every axis. Every offset of the smaller kernel is
+    also an offset of the larger one, so its out_in_map is a selection of
+    columns and no coordinate has to be searched again.
+    """
+    device = kmap["out_in_map"].device
+    offsets = kernel_offsets(torch.tensor(sub_kernel_size), device)
+    # offsets of odd kernels are enumerated with x varying fastest
+    local = offsets + torch.tensor(
+        [(k - 1) // 2 for k in kernel_size], dtype=torch.long, device=device
+    )
+    columns = local[:, 0] + kernel_size[0] * (
+        local[:, 1] + kernel_size[1] * local[:, 2]
+    )
+    out_in_map = kmap["out_in_map"][:, columns].contiguous()
+    return derive_kernel_map(kmap, out_in_map)
+
+
+def find_sub_kernel_map(
+    kmaps,
+    tensor_stride: Tuple[int, ...],
+    kernel_size: Tuple[int, ...],
+    dilation: Tuple[int, ...],
+    dataflow=None,
+    ifsort: bool = False,
+    training: bool = False,
+) -> Optional[Dict]:
+    """Derives a submanifold kernel map from a cached one with a larger kernel.
+
+    `kmaps` is the kmaps cache of a TensorCache. The smallest cached
+    submanifold kernel that contains `kernel_size` and was built for the
+    same dataflow, ifsort and training settings is used. Returns None if
+    there is none or `kernel_size` has an even size.
+    """
+    if not all(k % 2 == 1 for k in kernel_size):
+        return None
+    source = None
+    for key in list(kmaps):
+        if len(key) != 4:
+            # transposed kernel maps
+            continue
+        _tensor_stride, _kernel_size, _stride, _dilation = key
+        if (
+            _tensor_stride != tensor_stride
+            or _stride != (1, 1, 1)
+            or _dilation != dilation
+            or _kernel_size == kernel_size
+            or not all(k % 2 == 1 for k in _kernel_size)
+            or not all(k >= s for k, s in zip(_kernel_size, kernel_size))
+        ):
+            continue
+        if source is None or _volume(_kernel_size) < _volume(source[1]):
+            if _compatible(kmaps[key], dataflow, ifsort, training):
+                source = key
+    if source is None:
+        return None
+    return derive_sub_kernel_map(kmaps[source], source[1], kernel_size)
+
+
+def _volume(kernel_size: Tuple[int, ...]) -> int:
+    return kernel_size[0] * kernel_size[1] * kernel_size[2]
+
+
+def _compatible(kmap: Dict, dataflow, ifsort: bool, training: bool) -> bool:
+    from torchsparse.nn import functional as F
+
+    if kmap["nbaddrs"] is not None:
+        return dataflow == F.Dataflow.FetchOnDemand
+    if kmap["nbmaps"] is not None:
+        return dataflow == F.Dataflow.GatherScatter
+    return (
+        dataflow == F.Dataflow.ImplicitGEMM
+        and _has_field(kmap, "reorder_out_in_map") == bool(ifsort)
+        and _has_field(kmap, "out_in_map_bwd") == bool(training)
+    )
+
+
+def _has_field(kmap: Dict, name: str) -> bool:
+    # pending and compact fields must not be computed here
+    if isinstance(kmap, KernelMap) and kmap.is_lazy(name):
+        return True
+    return kmap.get(name) is not None
+
+
+def _derive_Gather_Scatter(kmap: Dict) -> None:
+    results = torch.t(kmap["out_in_map"]).contiguous()
+    nbsizes = torch.sum(results != -1, dim=1)
+    nbmaps = torch.nonzero(results != -1)
+    nbmaps[:, 0] = results.view(-1)[nbmaps[:, 0] * results.size(1) + nbmaps[:, 1]]
+    nbmaps = nbmaps.contiguous()
+    if nbmaps.device.type == "cuda":
+        input_mask, output_mask = torchsparse.backend.build_mask_from_kmap(
+            kmap["sizes"][0],
+            kmap["sizes"][1],
+            nbmaps.int(),
+            nbsizes.int()[0 : kmap["sizes"][1]],
+        )
+    else:
+        # masks are only consumed by the CUDA gather-scatter kernels
+        input_mask, output_mask = None, None
+    kmap["nbmaps"] = nbmaps
+    kmap["nbsizes"] = nbsizes
+    kmap["input_mask"] = input_mask
+    kmap["output_mask"] = output_mask
+
+
+def _derive_Fetch_on_Demand(kmap: Dict) -> None:
+    results = torch.t(kmap["out_in_map"]).contiguous()
+    nbsizes = torch.sum(results != -1, dim=1).to(torch.int)
+    nbmaps = torch.nonzero(results != -1)
+    nbmaps[:, 0] = results.view(-1)[nbmaps[:, 0] * results.size(1) + nbmaps[:, 1]]
+
+    kernel_volume = nbsizes.size(0)
+    nbaddrs = torch.zeros((kernel_volume + 1), dtype=torch.int, device=nbmaps.device)
+    qnbaddrs = torch.zeros((kernel_volume + 1), dtype=torch.int, device=nbmaps.device)
+    if nbmaps.device.type == "cuda":
+        torchsparse.backend.exclusive_scan_quantified_wrapper(
+            kernel_volume, nbsizes, nbaddrs, qnbaddrs
+        )
+    else:
+        nbaddrs[1:] = torch.cumsum(nbsizes, dim=0)
+        qnbaddrs[1:] = torch.cumsum((nbsizes + 127) // 128 * 128, dim=0)
+
+    kmap["nbmaps"] = nbmaps.transpose(0, 1).int()
+    kmap["nbsizes"] = nbsizes
+    kmap["nbaddrs"] = nbaddrs
+    kmap["qnbaddrs"] = qnbaddrs
+    kmap["qmapsize"] = qnbaddrs[-1].cpu().int()
@@ -36,44 +36,43 @@ def spdownsample(
         coords = torch.unique(coords, dim=0)
         return coords
     else:
-        if _coords.device.type == "cuda":
-            _coords = _coords.contiguous()
-
-            padding_t = make_tensor(padding, dtype=torch.int, device=_coords.device)
-            kernel_size_t = make_tensor(
-                kernel_size, dtype=torch.int, device=_coords.device
-            )
-            stride_t = make_tensor(stride, dtype=torch.int, device=_coords.device)
+        _coords = _coords.contiguous()
 
-            if spatial_range is not None:
-                coords_max_tuple = tuple(x - 1 for x in spatial_range)
-                coords_max = make_tensor(
-                    coords_max_tuple, dtype=torch.int, device=_coords.device
-                )
-            else:
-                coords_max = _coords.max(0).values
-                coords_max[1:] = (
-                    coords_max[1:] + 2 * padding_t - (kernel_size_t - 1)
-                ) // stride_t
+        padding_t = make_tensor(padding, dtype=torch.int, device=_coords.device)
+        kernel_size_t = make_tensor(kernel_size, dtype=torch.int, device=_coords.device)
+        stride_t = make_tensor(stride, dtype=torch.int, device=_coords.device)
 
-            if torchsparse.tensor.get_allow_negative_coordinates():
-                coords_min = _coords.min(0).values
-                coords_min[1:] = torch.div(
-                    coords_min[1:] - 2 * padding_t + (kernel_size_t - 1), stride_t
-                )
-            else:
-                coords_min = make_tensor(
-                    (0, 0, 0, 0), dtype=torch.int, device=_coords.device
-                )
+        if spatial_range is not None:
+            coords_max_tuple = tuple(x - 1 for x in spatial_range)
+            coords_max = make_tensor(
+                coords_max_tuple, dtype=torch.int, device=_coords.device
+            )
+        else:
+            coords_max = _coords.max(0).values
+            coords_max[1:] = (
+                coords_max[1:] + 2 * padding_t - (kernel_size_t - 1)
+            ) // stride_t
 
-            out_coords = torchsparse.backend.downsample_cuda(
-                _coords,
-                coords_max,
-                coords_min,
-                kernel_size_t,
-                stride_t,
-                padding_t,
+        if torchsparse.tensor.get_allow_negative_coordinates():
+            coords_min = _coords.min(0).values
+            coords_min[1:] = torch.div(
+                coords_min[1:] - 2 * padding_t + (kernel_size_t - 1), stride_t
             )
-            return out_coords
         else:
-            raise NotImplementedError
+            coords_min = make_tensor(
+                (0, 0, 0, 0), dtype=torch.int, device=_coords.device
+            )
+
+        if _coords.device.type == "cuda":
+            downsample_func = torchsparse.backend.downsample_cuda
+        else:
+            downsample_func = torchsparse.backend.downsample_cpu
+        out_coords = downsample_func(
+            _coords,
+            coords_max,
+            coords_min,
+            kernel_size_t,
+            stride_t,
+            padding_t,
+        )
+        return out_coords
@@ -1,2 +1,5 @@
 from .hashmap import *
 from .hashmap_on_the_fly import *
+from .sortedmap import *
+from .grid import *
+from .direct import *
@@ -0,0 +1,136 @@
+from typing import Dict
+import torch
+
+from torchsparse.utils import make_divisible
+
+
+def build_kmap_implicit_GEMM_direct(
+    kmap: Dict,
+    input_node_num: int,
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    cta_M: int = 128,
+    ifsort: bool = False,
+    split_mask_num: int = 1,
+) -> Dict:
+    """Builds the kernel map of a convolution whose kernel size equals its
+    stride, without a hash table.
+
+    The output coordinates are the input coordinates divided by the stride,
+    found with one unique over packed keys, which sorts them like
+    spdownsample does. The kernel windows of the outputs do not overlap, so
+    every input lies in at most one of them and its kernel offset follows
+    from the remainder.
+    """
+    from torchsparse.nn import functional as F
+
+    kernel_volume = int(torch.prod(kernel_size))
+    stride = stride.long()
+    coords = _coords.long()
+    batch = coords[:, :1]
+    quotients = torch.div(coords[:, 1:], stride, rounding_mode="floor")
+    keys = F.pack_coords(torch.cat([quotients, batch], dim=1))
+    keys, outputs = torch.unique(keys, return_inverse=True)
+    out_coords = torch.empty(
+        (keys.shape[0], 4), dtype=_coords.dtype, device=keys.device
+    )
+    out_coords[:, 0] = (keys >> 48) - 1
+    out_coords[:, 1] = ((keys >> 32) & 0xFFFF) - 32768
+    out_coords[:, 2] = ((keys >> 16) & 0xFFFF) - 32768
+    out_coords[:, 3] = (keys & 0xFFFF) - 32768
+
+    shift = (kernel_size.long() - 1) // 2
+    if bool((shift == 0).all()):
+        # every input lies in the window of its own output
+        index = coords[:, 1:] - quotients * stride
+        valid = None
+    else:
+        # kernel offsets are centered, so the window of output o covers
+        # o * stride - (k - 1) // 2 up to o * stride + k // 2
+        shifted = coords[:, 1:] + shift
+        windows = torch.div(shifted, stride, rounding_mode="floor")
+        index = shifted - windows * stride
+        queries = F.pack_coords(torch.cat([windows, batch], dim=1))
+        outputs = torch.searchsorted(keys, queries).clamp_(max=keys.shape[0] - 1)
+        valid = keys[outputs] == queries
+
+    # same offset enumeration as the hash table lookups: x varies fastest
+    # for odd kernel volumes, z varies fastest otherwise
+    kernel_size = kernel_size.long()
+    if kernel_volume % 2:
+        offsets = index[:, 0] + kernel_size[0] * (
+            index[:, 1] + kernel_size[1] * index[:, 2]
+        )
+    else:
+        offsets = index[:, 2] + kernel_size[2] * (
+            index[:, 1] + kernel_size[1] * index[:, 0]
+        )
+
+    results = torch.full(
+        (make_divisible(out_coords.shape[0], cta_M), kernel_volume),
+        -1,
+        dtype=torch.int,
+        device=_coords.device,
+    )
+    inputs = torch.arange(_coords.shape[0], dtype=torch.int, device=_coords.device)
+    if valid is not None:
+        outputs, offsets, inputs = outputs[valid], offsets[valid], inputs[valid]
+    results[outputs, offsets] = inputs
+
+    kmap["out_in_map"] = results
+    kmap["coords"] = out_coords
+    kmap["sizes"] = (input_node_num, out_coords.shape[0])
+
+    if ifsort:
+        bitmask = F.derive_bitmask_from_out_in_map(
+            results, split_mask_num, kmap["sizes"][1]
+        )
+        sorted_mask, reorder_loc = torch.sort(bitmask, descending=True)
+        reorder_loc = reorder_loc.to(torch.int32)
+        reorder_out_in_map = F.reorder_out_in_map(results, reorder_loc)
+        reduced_sorted_mask = F.reduce_bitmask(sorted_mask, cta_M)
+        kmap["reorder_out_in_map"] = reorder_out_in_map
+        kmap["reduced_sorted_mask"] = reduced_sorted_mask
+        kmap["reorder_loc"] = reorder_loc
+        kmap["sorted_mask"] = sorted_mask
+
+    return kmap
+
+
+def build_kmap_Gather_Scatter_direct(
+    kmap: Dict,
+    input_node_num: int,
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    cta_M: int = 128,
+) -> Dict:
+    from ..derive_kmap import _derive_Gather_Scatter
+
+    kmap = build_kmap_implicit_GEMM_direct(
+        kmap, input_node_num, _coords, kernel_size, stride, cta_M, False, 1
+    )
+
+    _derive_Gather_Scatter(kmap)
+
+    return kmap
+
+
+def build_kmap_Fetch_on_Demand_direct(
+    kmap: Dict,
+    input_node_num: int,
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    cta_M: int = 128,
+) -> Dict:
+    from ..derive_kmap import _derive_Fetch_on_Demand
+
+    kmap = build_kmap_implicit_GEMM_direct(
+        kmap, input_node_num, _coords, kernel_size, stride, cta_M, False, 1
+    )
+
+    _derive_Fetch_on_Demand(kmap)
+
+    return kmap
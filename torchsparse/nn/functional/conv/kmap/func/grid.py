@@ -0,0 +1,175 @@
+from typing import Dict, Tuple, Optional
+import torch
+
+from torchsparse.utils import make_divisible, make_tensor
+
+from .sortedmap import kernel_offsets, mirror_out_in_map, symmetric_offsets
+
+
+def build_grid(_coords: torch.Tensor, spatial_range: Tuple[int, ...]) -> torch.Tensor:
+    """Dense (B, X, Y, Z) int32 volume holding the index of every coordinate.
+
+    Cells without a coordinate hold -1.
+    """
+    grid = torch.full(tuple(spatial_range), -1, dtype=torch.int, device=_coords.device)
+    coords = _coords.long()
+    grid[coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3]] = torch.arange(
+        _coords.shape[0], dtype=torch.int, device=_coords.device
+    )
+    return grid
+
+
+def build_kmap_implicit_GEMM_grid(
+    kmap: Dict,
+    input_node_num: int,
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    padding: torch.Tensor,
+    input_spatial_range: Tuple[int, ...],
+    spatial_range: Optional[Tuple[int]] = None,
+    cta_M: int = 128,
+    subm: bool = False,
+    ifsort: bool = False,
+    split_mask_num: int = 1,
+    downsample_mode: str = "spconv",
+) -> Dict:
+    """Builds the kernel map by direct indexing into a dense occupancy grid.
+
+    The grid covers `input_spatial_range` and is stored in kmap["grid"] so
+    that it can be reused by every convolution at the same tensor stride.
+    """
+    from torchsparse.nn import functional as F
+
+    if subm:
+        coords = _coords
+    else:
+        coords = F.spdownsample(
+            _coords,
+            stride,
+            kernel_size,
+            padding,
+            spatial_range,
+            downsample_mode=downsample_mode,
+        )
+
+    if kmap["grid"] is None:
+        kmap["grid"] = build_grid(_coords, input_spatial_range)
+    grid = kmap["grid"]
+    extent = make_tensor(grid.shape[1:], dtype=torch.long, device=coords.device)
+
+    queries = coords[:, 1:].long() * stride.long()
+    # flattened grid index of every query, offsets are added per kernel offset
+    base = (coords[:, 0].long() * extent[0] + queries[:, 0]) * extent[1]
+    base = (base + queries[:, 1]) * extent[2] + queries[:, 2]
+    offsets = kernel_offsets(kernel_size, coords.device)
+    deltas = (offsets[:, 0] * extent[1] + offsets[:, 1]) * extent[2] + offsets[:, 2]
+
+    results = torch.full(
+        (make_divisible(coords.shape[0], cta_M), offsets.shape[0]),
+        -1,
+        dtype=torch.int,
+        device=coords.device,
+    )
+    grid = grid.view(-1)
+    symmetric = symmetric_offsets(kernel_size, subm)
+    for k in range(offsets.shape[0] // 2 if symmetric else offsets.shape[0]):
+        query = queries + offsets[k]
+        valid = ((query >= 0) & (query < extent)).all(dim=1)
+        index = torch.where(valid, base + deltas[k], torch.zeros_like(base))
+        results[: coords.shape[0], k] = torch.where(
+            valid, grid[index], torch.full_like(grid[index], -1)
+        )
+    if symmetric:
+        mirror_out_in_map(results, coords.shape[0])
+
+    kmap["out_in_map"] = results
+    kmap["coords"] = coords
+    kmap["sizes"] = (input_node_num, coords.shape[0])
+
+    if ifsort:
+        bitmask = F.derive_bitmask_from_out_in_map(
+            results, split_mask_num, kmap["sizes"][1]
+        )
+        sorted_mask, reorder_loc = torch.sort(bitmask, descending=True)
+        reorder_loc = reorder_loc.to(torch.int32)
+        reorder_out_in_map = F.reorder_out_in_map(results, reorder_loc)
+        reduced_sorted_mask = F.reduce_bitmask(sorted_mask, cta_M)
+        kmap["reorder_out_in_map"] = reorder_out_in_map
+        kmap["reduced_sorted_mask"] = reduced_sorted_mask
+        kmap["reorder_loc"] = reorder_loc
+        kmap["sorted_mask"] = sorted_mask
+
+    return kmap
+
+
+def build_kmap_Gather_Scatter_grid(
+    kmap: Dict,
+    input_node_num: int,
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    padding: torch.Tensor,
+    input_spatial_range: Tuple[int, ...],
+    spatial_range: Optional[Tuple[int]] = None,
+    cta_M: int = 128,
+    subm: bool = False,
+    downsample_mode: str = "spconv",
+) -> Dict:
+    from ..derive_kmap import _derive_Gather_Scatter
+
+    kmap = build_kmap_implicit_GEMM_grid(
+        kmap,
+        input_node_num,
+        _coords,
+        kernel_size,
+        stride,
+        padding,
+        input_spatial_range,
+        spatial_range,
+        cta_M,
+        subm,
+        False,
+        1,
+        downsample_mode,
+    )
+
+    _derive_Gather_Scatter(kmap)
+
+    return kmap
+
+
+def build_kmap_Fetch_on_Demand_grid(
+    kmap: Dict,
+    input_node_num: int,
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    padding: torch.Tensor,
+    input_spatial_range: Tuple[int, ...],
+    spatial_range: Optional[Tuple[int]] = None,
+    cta_M: int = 128,
+    subm: bool = False,
+    downsample_mode: str = "spconv",
+) -> Dict:
+    from ..derive_kmap import _derive_Fetch_on_Demand
+
+    kmap = build_kmap_implicit_GEMM_grid(
+        kmap,
+        input_node_num,
+        _coords,
+        kernel_size,
+        stride,
+        padding,
+        input_spatial_range,
+        spatial_range,
+        cta_M,
+        subm,
+        False,
+        1,
+        downsample_mode,
+    )
+
+    _derive_Fetch_on_Demand(kmap)
+
+    return kmap
@@ -5,6 +5,15 @@ import torchsparse.backend
 from torchsparse.utils import make_tensor
 
 
+def _check_hashmap_scheme(kmap: Dict, scheme: Tuple) -> None:
+    # a cached table is only reused if its keys were built the same way,
+    # probing it with another key scheme would silently miss
+    if kmap["hashmap_scheme"] != scheme:
+        kmap["hashmap_keys"] = None
+        kmap["hashmap_vals"] = None
+        kmap["hashmap_scheme"] = scheme
+
+
 def build_kmap_implicit_GEMM_hashmap(
     kmap: Dict,
     input_node_num: int,
@@ -19,6 +28,7 @@ def build_kmap_implicit_GEMM_hashmap(
     split_mask_num: int = 1,
     downsample_mode: str = "spconv",
     generative: bool = False,
+    packed_keys: bool = False,
 ) -> Dict:
     from torchsparse.nn import functional as F
 
@@ -41,6 +51,7 @@ def build_kmap_implicit_GEMM_hashmap(
 
     kernel_volume = torch.prod(kernel_size)
 
+    _check_hashmap_scheme(kmap, ("hashmap", packed_keys))
     to_insert = False
     if kmap["hashmap_keys"] is None:
         kmap["hashmap_keys"] = torch.zeros(
@@ -51,9 +62,14 @@ def build_kmap_implicit_GEMM_hashmap(
         kmap["hashmap_vals"] = torch.zeros(
             2 * _coords.shape[0], dtype=torch.int32, device=coords.device
         )
-    hashmap = torchsparse.backend.GPUHashTable(
-        kmap["hashmap_keys"], kmap["hashmap_vals"]
-    )
+    if coords.device.type == "cuda":
+        hashmap = torchsparse.backend.GPUHashTable(
+            kmap["hashmap_keys"], kmap["hashmap_vals"], packed_keys
+        )
+    else:
+        hashmap = torchsparse.backend.CPUHashTable(
+            kmap["hashmap_keys"], kmap["hashmap_vals"], packed_keys
+        )
 
     if to_insert:
         if not generative:
@@ -63,7 +79,15 @@ def build_kmap_implicit_GEMM_hashmap(
             _insert_coords[:, 1:] *= stride
             hashmap.insert_coords(_insert_coords[:, [1, 2, 3, 0]])
 
-    if not generative:
+    if subm and not generative and kernel_volume % 2 and kernel_volume > 1:
+        # mirrored offsets are derived from the first half of the lookups
+        results = (
+            hashmap.lookup_coords_subm(
+                coords[:, [1, 2, 3, 0]], kernel_size, kernel_volume
+            )
+            - 1
+        )
+    elif not generative:
         results = (
             hashmap.lookup_coords(
                 coords[:, [1, 2, 3, 0]], kernel_size, stride, kernel_volume
@@ -86,17 +110,13 @@ def build_kmap_implicit_GEMM_hashmap(
     kmap["sizes"] = (input_node_num, coords.shape[0])
 
     if ifsort:
-        bitmask = torchsparse.backend.derive_bitmask_from_out_in_map(
+        bitmask = F.derive_bitmask_from_out_in_map(
             results, split_mask_num, kmap["sizes"][1]
         )
         sorted_mask, reorder_loc = torch.sort(bitmask, descending=True)
         reorder_loc = reorder_loc.to(torch.int32)
-        reorder_out_in_map = torchsparse.backend.reorder_out_in_map_cuda(
-            results, reorder_loc
-        )
-        reduced_sorted_mask = torchsparse.backend.reduce_bitmask_cuda(
-            sorted_mask, cta_M
-        )
+        reorder_out_in_map = F.reorder_out_in_map(results, reorder_loc)
+        reduced_sorted_mask = F.reduce_bitmask(sorted_mask, cta_M)
         kmap["reorder_out_in_map"] = reorder_out_in_map
         kmap["reduced_sorted_mask"] = reduced_sorted_mask
         kmap["reorder_loc"] = reorder_loc
@@ -117,6 +137,7 @@ def build_kmap_Gather_Scatter_hashmap(
     subm: bool = False,
     downsample_mode: str = "spconv",
     generative: bool = False,
+    packed_keys: bool = False,
 ) -> Dict:
 
     kmap = build_kmap_implicit_GEMM_hashmap(
@@ -133,6 +154,7 @@ def build_kmap_Gather_Scatter_hashmap(
         1,
         downsample_mode,
         generative,
+        packed_keys,
     )
 
     results = torch.t(kmap["out_in_map"]).contiguous()
@@ -141,12 +163,16 @@ def build_kmap_Gather_Scatter_hashmap(
     nbmaps[:, 0] = results.view(-1)[nbmaps[:, 0] * results.size(1) + nbmaps[:, 1]]
     # important for build masks
     nbmaps = nbmaps.contiguous()
-    input_mask, output_mask = torchsparse.backend.build_mask_from_kmap(
-        _coords.shape[0],
-        kmap["coords"].shape[0],
-        nbmaps.int(),
-        nbsizes.int()[0 : kmap["coords"].shape[0]],
-    )
+    if nbmaps.device.type == "cuda":
+        input_mask, output_mask = torchsparse.backend.build_mask_from_kmap(
+            _coords.shape[0],
+            kmap["coords"].shape[0],
+            nbmaps.int(),
+            nbsizes.int()[0 : kmap["coords"].shape[0]],
+        )
+    else:
+        # masks are only consumed by the CUDA gather-scatter kernels
+        input_mask, output_mask = None, None
 
     kmap["nbmaps"] = nbmaps
     kmap["nbsizes"] = nbsizes
@@ -168,6 +194,7 @@ def build_kmap_Fetch_on_Demand_hashmap(
     subm: bool = False,
     downsample_mode: str = "spconv",
     generative: bool = False,
+    packed_keys: bool = False,
 ) -> Dict:
 
     kmap = build_kmap_implicit_GEMM_hashmap(
@@ -184,6 +211,7 @@ def build_kmap_Fetch_on_Demand_hashmap(
         1,
         downsample_mode,
         generative,
+        packed_keys,
     )
 
     results = torch.t(kmap["out_in_map"]).contiguous()
@@ -196,9 +224,13 @@ def build_kmap_Fetch_on_Demand_hashmap(
     qnbaddrs = torch.zeros((kernel_volume + 1), dtype=torch.int, device=nbmaps.device)
 
     # Derive quantified arrays
-    torchsparse.backend.exclusive_scan_quantified_wrapper(
-        kernel_volume, nbsizes, nbaddrs, qnbaddrs
-    )
+    if nbmaps.device.type == "cuda":
+        torchsparse.backend.exclusive_scan_quantified_wrapper(
+            kernel_volume, nbsizes, nbaddrs, qnbaddrs
+        )
+    else:
+        nbaddrs[1:] = torch.cumsum(nbsizes, dim=0)
+        qnbaddrs[1:] = torch.cumsum((nbsizes + 127) // 128 * 128, dim=0)
 
     # nbmaps need to be transposed for Fetch-on-Demand
     kmap["nbmaps"] = nbmaps.transpose(0, 1).int()
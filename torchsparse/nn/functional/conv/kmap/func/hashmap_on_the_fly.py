@@ -6,6 +6,8 @@ import torchsparse.backend
 import torchsparse.backends
 from torchsparse.utils import make_tensor
 
+from .hashmap import _check_hashmap_scheme
+
 
 def build_kmap_implicit_GEMM_hashmap_on_the_fly(
     kmap: Dict,
@@ -20,6 +22,8 @@ def build_kmap_implicit_GEMM_hashmap_on_the_fly(
     ifsort: bool = False,
     split_mask_num: int = 1,
 ) -> Dict:
+    from torchsparse.nn import functional as F
+
     kmap["coords"] = _coords
     kmap["spatial_range"] = spatial_range
     # coords = _coords[:, [3, 0, 1, 2]]
@@ -29,6 +33,9 @@ def build_kmap_implicit_GEMM_hashmap_on_the_fly(
         coords_max = make_tensor(
             coords_max_tuple, dtype=torch.int, device=coords.device
         )
+        if subm:
+            # `spatial_range` bounds the outputs, the table holds the inputs
+            coords_max[1:] += (kernel_size - 1) - 2 * padding
     else:
         coords_max = coords.max(0).values
         if not subm:
@@ -44,10 +51,21 @@ def build_kmap_implicit_GEMM_hashmap_on_the_fly(
     else:
         coords_min = make_tensor((0, 0, 0, 0), dtype=torch.int, device=coords.device)
 
-    if subm:
-        func = torchsparse.backend.build_kernel_map_subm_hashmap
+    if coords.device.type == "cuda":
+        if subm:
+            func = torchsparse.backend.build_kernel_map_subm_hashmap
+        else:
+            func = torchsparse.backend.build_kernel_map_downsample_hashmap
     else:
-        func = torchsparse.backend.build_kernel_map_downsample_hashmap
+        if subm:
+            func = torchsparse.backend.build_kernel_map_subm_hashmap_cpu
+        else:
+            func = torchsparse.backend.build_kernel_map_downsample_hashmap_cpu
+    # tables are keyed on the index into the grid between the two bounds
+    _check_hashmap_scheme(
+        kmap,
+        ("hashmap_on_the_fly",) + tuple(torch.cat([coords_min, coords_max]).tolist()),
+    )
     to_insert = False
 
     assert (
@@ -65,9 +83,14 @@ def build_kmap_implicit_GEMM_hashmap_on_the_fly(
         kmap["hashmap_vals"] = torch.zeros(
             hashmap_capacity, dtype=torch.int32, device=coords.device
         )
-    hashtable = torchsparse.backend.GPUHashTable(
-        kmap["hashmap_keys"], kmap["hashmap_vals"]
-    )
+    if coords.device.type == "cuda":
+        hashtable = torchsparse.backend.GPUHashTable(
+            kmap["hashmap_keys"], kmap["hashmap_vals"]
+        )
+    else:
+        hashtable = torchsparse.backend.CPUHashTable(
+            kmap["hashmap_keys"], kmap["hashmap_vals"]
+        )
 
     out = func(
         hashtable,
@@ -90,17 +113,13 @@ def build_kmap_implicit_GEMM_hashmap_on_the_fly(
     kmap["sizes"] = (input_node_num, coords.shape[0])
 
     if ifsort:
-        bitmask = torchsparse.backend.derive_bitmask_from_out_in_map(
+        bitmask = F.derive_bitmask_from_out_in_map(
             out_in_map, split_mask_num, kmap["sizes"][1]
         )
         sorted_mask, reorder_loc = torch.sort(bitmask, descending=True)
         reorder_loc = reorder_loc.to(torch.int32)
-        reorder_out_in_map = torchsparse.backend.reorder_out_in_map_cuda(
-            out_in_map, reorder_loc
-        )
-        reduced_sorted_mask = torchsparse.backend.reduce_bitmask_cuda(
-            sorted_mask, cta_M
-        )
+        reorder_out_in_map = F.reorder_out_in_map(out_in_map, reorder_loc)
+        reduced_sorted_mask = F.reduce_bitmask(sorted_mask, cta_M)
         kmap["reorder_out_in_map"] = reorder_out_in_map
         kmap["reduced_sorted_mask"] = reduced_sorted_mask
         kmap["reorder_loc"] = reorder_loc
@@ -141,12 +160,16 @@ def build_kmap_Gather_Scatter_hashmap_on_the_fly(
     nbmaps[:, 0] = results.view(-1)[nbmaps[:, 0] * results.size(1) + nbmaps[:, 1]]
     # important for build masks
     nbmaps = nbmaps.contiguous()
-    input_mask, output_mask = torchsparse.backend.build_mask_from_kmap(
-        _coords.shape[0],
-        kmap["coords"].shape[0],
-        nbmaps.int(),
-        nbsizes.int()[0 : kmap["coords"].shape[0]],
-    )
+    if nbmaps.device.type == "cuda":
+        input_mask, output_mask = torchsparse.backend.build_mask_from_kmap(
+            _coords.shape[0],
+            kmap["coords"].shape[0],
+            nbmaps.int(),
+            nbsizes.int()[0 : kmap["coords"].shape[0]],
+        )
+    else:
+        # masks are only consumed by the CUDA gather-scatter kernels
+        input_mask, output_mask = None, None
 
     kmap["nbmaps"] = nbmaps
     kmap["nbsizes"] = nbsizes
@@ -192,9 +215,13 @@ def build_kmap_Fetch_on_Demand_hashmap_on_the_fly(
     qnbaddrs = torch.zeros((kernel_volume + 1), dtype=torch.int, device=nbmaps.device)
 
     # Derive quantified arrays
-    torchsparse.backend.exclusive_scan_quantified_wrapper(
-        kernel_volume, nbsizes, nbaddrs, qnbaddrs
-    )
+    if nbmaps.device.type == "cuda":
+        torchsparse.backend.exclusive_scan_quantified_wrapper(
+            kernel_volume, nbsizes, nbaddrs, qnbaddrs
+        )
+    else:
+        nbaddrs[1:] = torch.cumsum(nbsizes, dim=0)
+        qnbaddrs[1:] = torch.cumsum((nbsizes + 127) // 128 * 128, dim=0)
 
     # nbmaps need to be transposed for Fetch-on-Demand
     kmap["nbmaps"] = nbmaps.transpose(0, 1).int()
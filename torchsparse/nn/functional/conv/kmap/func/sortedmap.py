@@ -0,0 +1,236 @@
+from typing import Dict, Tuple, Optional
+import torch
+
+from torchsparse.utils import make_divisible
+
+
+def kernel_offsets(kernel_size: torch.Tensor, device) -> torch.Tensor:
+    """Kernel offsets in the order used by the hash table lookups.
+
+    x varies fastest for odd kernel volumes (MinkowskiEngine layout), z varies
+    fastest otherwise.
+    """
+    ranges = [
+        torch.arange(k, dtype=torch.long, device=device) - (k - 1) // 2
+        for k in kernel_size.tolist()
+    ]
+    if int(torch.prod(kernel_size)) % 2:
+        oz, oy, ox = torch.meshgrid(ranges[::-1], indexing="ij")
+    else:
+        ox, oy, oz = torch.meshgrid(ranges, indexing="ij")
+    return torch.stack([ox, oy, oz], dim=-1).view(-1, 3)
+
+
+def symmetric_offsets(kernel_size: torch.Tensor, subm: bool) -> bool:
+    """Whether offset K - 1 - k of the kernel is the negation of offset k.
+
+    Then the neighbors at offset K - 1 - k follow from the ones at offset k,
+    so submanifold kernel maps only need to search the first half.
+    """
+    kernel_volume = int(torch.prod(kernel_size))
+    return subm and kernel_volume % 2 == 1 and kernel_volume > 1
+
+
+def mirror_out_in_map(results: torch.Tensor, num: int) -> torch.Tensor:
+    """Completes a submanifold out_in_map of which the first half is filled.
+
+    Offset k of output i hitting input j means that offset K - 1 - k of
+    output j hits input i, and every coordinate is its own center neighbor.
+    """
+    kernel_volume = results.shape[1]
+    center = kernel_volume // 2
+    rows, cols = torch.nonzero(results[:num, :center] >= 0, as_tuple=True)
+    results[results[rows, cols].long(), kernel_volume - 1 - cols] = rows.to(
+        results.dtype
+    )
+    results[:num, center] = torch.arange(
+        num, dtype=results.dtype, device=results.device
+    )
+    return results
+
+
+def build_kmap_implicit_GEMM_sorted(
+    kmap: Dict,
+    input_node_num: int,
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    padding: torch.Tensor,
+    spatial_range: Optional[Tuple[int]] = None,
+    cta_M: int = 128,
+    subm: bool = False,
+    ifsort: bool = False,
+    split_mask_num: int = 1,
+    downsample_mode: str = "spconv",
+    generative: bool = False,
+) -> Dict:
+    """Builds the kernel map by binary search over sorted coordinate keys.
+
+    The input coordinates are packed into exact int64 keys and sorted once;
+    the sorted keys and the sorting permutation are kept in
+    kmap["sortedmap"], which takes the place of the hash table. Every
+    kernel offset is then resolved with one torch.searchsorted call over all
+    output coordinates, which avoids the random probing of a hash table.
+    """
+    from torchsparse.nn import functional as F
+
+    if subm and not generative:
+        coords = _coords
+    else:
+        if not generative:
+            coords = F.spdownsample(
+                _coords,
+                stride,
+                kernel_size,
+                padding,
+                spatial_range,
+                downsample_mode=downsample_mode,
+            )
+        else:
+            coords = F.spupsample_generative(
+                _coords, stride, kernel_size, padding, spatial_range
+            )
+
+    if kmap["sortedmap"] is None:
+        references = _coords[:, [1, 2, 3, 0]].long()
+        if generative:
+            references[:, :3] *= stride.long()
+        keys = F.pack_coords(references)
+        if (keys < 0).any():
+            raise ValueError(
+                "[Build kernel map] coordinates exceed the 16-bit range of the "
+                "sorted kmap_mode (please switch to kmap_mode=hashmap)."
+            )
+        keys, order = torch.sort(keys)
+        kmap["sortedmap"] = [keys, order.int()]
+    keys, order = kmap["sortedmap"]
+
+    queries = coords[:, [1, 2, 3, 0]].long()
+    if not generative:
+        queries[:, :3] *= stride.long()
+    offsets = kernel_offsets(kernel_size, coords.device)
+
+    # When no query can leave the 16-bit range, an offset only changes its
+    # own fields of the packed key and can be added to the key directly.
+    base = None
+    if queries.shape[0] > 0:
+        lo = queries[:, :3].min(0).values + offsets.min(0).values
+        hi = queries[:, :3].max(0).values + offsets.max(0).values
+        if (lo >= -32768).all() and (hi < 32768).all():
+            base = F.pack_coords(queries)
+            if (base < 0).any():
+                base = None
+    deltas = (offsets[:, 0] << 32) + (offsets[:, 1] << 16) + offsets[:, 2]
+
+    results = torch.full(
+        (make_divisible(coords.shape[0], cta_M), offsets.shape[0]),
+        -1,
+        dtype=torch.int,
+        device=coords.device,
+    )
+    symmetric = symmetric_offsets(kernel_size, subm and not generative)
+    for k in range(offsets.shape[0] // 2 if symmetric else offsets.shape[0]):
+        if base is not None:
+            query = base + deltas[k]
+        else:
+            query = queries.clone()
+            query[:, :3] += offsets[k]
+            query = F.pack_coords(query)
+        loc = torch.searchsorted(keys, query).clamp_(max=keys.shape[0] - 1)
+        found = (keys[loc] == query) & (query >= 0)
+        results[: coords.shape[0], k] = torch.where(
+            found, order[loc], torch.full_like(order[loc], -1)
+        )
+    if symmetric:
+        mirror_out_in_map(results, coords.shape[0])
+
+    kmap["out_in_map"] = results
+    kmap["coords"] = coords
+    kmap["sizes"] = (input_node_num, coords.shape[0])
+
+    if ifsort:
+        bitmask = F.derive_bitmask_from_out_in_map(
+            results, split_mask_num, kmap["sizes"][1]
+        )
+        sorted_mask, reorder_loc = torch.sort(bitmask, descending=True)
+        reorder_loc = reorder_loc.to(torch.int32)
+        reorder_out_in_map = F.reorder_out_in_map(results, reorder_loc)
+        reduced_sorted_mask = F.reduce_bitmask(sorted_mask, cta_M)
+        kmap["reorder_out_in_map"] = reorder_out_in_map
+        kmap["reduced_sorted_mask"] = reduced_sorted_mask
+        kmap["reorder_loc"] = reorder_loc
+        kmap["sorted_mask"] = sorted_mask
+
+    return kmap
+
+
+def build_kmap_Gather_Scatter_sorted(
+    kmap: Dict,
+    input_node_num: int,
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    padding: torch.Tensor,
+    spatial_range: Optional[Tuple[int]] = None,
+    cta_M: int = 128,
+    subm: bool = False,
+    downsample_mode: str = "spconv",
+    generative: bool = False,
+) -> Dict:
+    from ..derive_kmap import _derive_Gather_Scatter
+
+    kmap = build_kmap_implicit_GEMM_sorted(
+        kmap,
+        input_node_num,
+        _coords,
+        kernel_size,
+        stride,
+        padding,
+        spatial_range,
+        cta_M,
+        subm,
+        False,
+        1,
+        downsample_mode,
+        generative,
+    )
+
+    _derive_Gather_Scatter(kmap)
+
+    return kmap
+
+
+def build_kmap_Fetch_on_Demand_sorted(
+    kmap: Dict,
+    input_node_num: int,
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    padding: torch.Tensor,
+    spatial_range: Optional[Tuple[int]] = None,
+    cta_M: int = 128,
+    subm: bool = False,
+    downsample_mode: str = "spconv",
+    generative: bool = False,
+) -> Dict:
+    from ..derive_kmap import _derive_Fetch_on_Demand
+
+    kmap = build_kmap_implicit_GEMM_sorted(
+        kmap,
+        input_node_num,
+        _coords,
+        kernel_size,
+        stride,
+        padding,
+        spatial_range,
+        cta_M,
+        subm,
+        False,
+        1,
+        downsample_mode,
+        generative,
+    )
+
+    _derive_Fetch_on_Demand(kmap)
+
+    return kmap
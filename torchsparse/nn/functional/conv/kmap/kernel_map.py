@@ -0,0 +1,77 @@
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+__all__ = ["KernelMap"]
+
+
+class KernelMap(dict):
+    """A kernel map whose derived fields are computed on first access.
+
+    `set_lazy(names, fn)` registers `fn(kmap)`, which returns the values of
+    `names` in order. The first read of any of them calls it once and stores
+    all of its results. With `cache=False`, every read calls `fn` again and
+    nothing is stored. Pending fields count as present for `in` and `get`,
+    but `keys`, `values` and `items` only cover the fields computed so far.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._lazy: Dict[str, Tuple[Tuple[str, ...], Callable, bool]] = {}
+
+    def set_lazy(self, names: Sequence[str], fn: Callable, cache: bool = True) -> None:
+        names = tuple(names)
+        for name in names:
+            dict.pop(self, name, None)
+            self._lazy[name] = (names, fn, cache)
+
+    def is_lazy(self, key: str) -> bool:
+        return key in self._lazy
+
+    def get_lazy(self, key: str) -> Tuple[Tuple[str, ...], Callable, bool]:
+        return self._lazy[key]
+
+    def __missing__(self, key: str) -> Any:
+        if key not in self._lazy:
+            raise KeyError(key)
+        names, fn, cache = self._lazy[key]
+        values = fn(self)
+        if not cache:
+            return values[names.index(key)]
+        for name, value in zip(names, values):
+            # fields that were assigned in the meantime keep their value
+            if self._lazy.get(name, (None, None, None))[1] is fn:
+                del self._lazy[name]
+                dict.__setitem__(self, name, value)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._lazy.pop(key, None)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        if self._lazy.pop(key, None) is None:
+            super().__delitem__(key)
+        else:
+            dict.pop(self, key, None)
+
+    def __contains__(self, key: object) -> bool:
+        return super().__contains__(key) or key in self._lazy
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def copy(self) -> "KernelMap":
+        """Shallow copy that keeps the pending fields."""
+        kmap = KernelMap(self)
+        kmap._lazy = dict(self._lazy)
+        return kmap
+
+    def __reduce__(self):
+        # pending fields are pickled as their registrations
+        return (type(self), (dict(self),), {"_lazy": dict(self._lazy)})
+
+    def materialize(self) -> "KernelMap":
+        """Computes every pending field that is cached on access."""
+        for key in list(self._lazy):
+            if key in self._lazy and self._lazy[key][2]:
+                self[key]
+        return self
@@ -0,0 +1,83 @@
+from typing import List
+import torch
+
+from torchsparse.utils import make_divisible
+from torchsparse.utils.tensor_cache import TensorCache
+
+from .derive_kmap import derive_kernel_map
+
+__all__ = ["merge_tensor_caches"]
+
+cta_M = 128
+
+
+def merge_tensor_caches(caches: List[TensorCache]) -> TensorCache:
+    """Merges the tensor caches of single samples into one for their batch.
+
+    The coordinates of every sample must already carry its batch index.
+    The batch concatenates the samples in order at every stride, so the
+    kernel maps are merged by offsetting the indices of every sample. Only
+    coordinate maps and kernel maps present in all caches are merged;
+    transposed kernel maps, hash tables and grids are rebuilt on demand.
+    """
+    merged = TensorCache(max_bytes=caches[0].max_bytes)
+    offsets = {}
+    for stride in caches[0].cmaps:
+        if not all(stride in cache.cmaps for cache in caches):
+            continue
+        coords = [cache.cmaps[stride][0] for cache in caches]
+        merged.cmaps[stride] = (
+            torch.cat(coords, dim=0),
+            caches[0].cmaps[stride][1],
+        )
+        offsets[stride] = [0]
+        for c in coords[:-1]:
+            offsets[stride].append(offsets[stride][-1] + c.shape[0])
+
+    for key in list(caches[0].kmaps):
+        if len(key) != 4:
+            # transposed kernel maps are derived again from the merged ones
+            continue
+        if not all(key in cache.kmaps for cache in caches):
+            continue
+        tensor_stride, _, stride, _ = key
+        if tensor_stride not in offsets:
+            continue
+        kmaps = [cache.kmaps[key] for cache in caches]
+        merged.kmaps[key] = _merge_kernel_maps(kmaps, offsets[tensor_stride])
+        output_stride = tuple(a * b for a, b in zip(tensor_stride, stride))
+        merged.cmaps.setdefault(
+            output_stride,
+            (merged.kmaps[key]["coords"], merged.kmaps[key]["spatial_range"]),
+        )
+    return merged
+
+
+def _merge_kernel_maps(kmaps: List, offsets: List[int]) -> dict:
+    out_in_maps, coords = [], []
+    num_in, num_out = 0, 0
+    for kmap, offset in zip(kmaps, offsets):
+        # rows beyond the outputs are padding
+        out_in_map = kmap["out_in_map"][: kmap["sizes"][1]]
+        out_in_maps.append(torch.where(out_in_map >= 0, out_in_map + offset, -1))
+        coords.append(kmap["coords"])
+        num_in += kmap["sizes"][0]
+        num_out += kmap["sizes"][1]
+
+    out_in_map = torch.full(
+        (make_divisible(num_out, cta_M), out_in_maps[0].shape[1]),
+        -1,
+        dtype=torch.int,
+        device=out_in_maps[0].device,
+    )
+    out_in_map[:num_out] = torch.cat(out_in_maps, dim=0)
+    return derive_kernel_map(
+        kmaps[0],
+        out_in_map,
+        coords=torch.cat(coords, dim=0),
+        sizes=(num_in, num_out),
+        hashmap_keys=None,
+        hashmap_vals=None,
+        grid=None,
+        sortedmap=None,
+    )
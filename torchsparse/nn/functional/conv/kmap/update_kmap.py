@@ -0,0 +1,149 @@
+from typing import Tuple, Union
+import torch
+
+from torchsparse.utils import make_ntuple, make_divisible
+from torchsparse.utils.tensor_cache import TensorCache
+
+from .derive_kmap import derive_kernel_map
+from .func.sortedmap import kernel_offsets
+
+__all__ = ["update_tensor_cache"]
+
+cta_M = 128
+
+
+def update_tensor_cache(
+    caches: TensorCache,
+    coords: torch.Tensor,
+    inserted: torch.Tensor,
+    removed: torch.Tensor,
+    stride: Union[int, Tuple[int, ...]] = 1,
+) -> Tuple[torch.Tensor, TensorCache]:
+    """Carries the kernel maps of `coords` over to the next frame.
+
+    The coordinates of the new frame are `coords` without the `removed`
+    coordinates, followed by `inserted`; the features of the new frame must
+    use the same order. `inserted` must not repeat a kept coordinate. Submanifold kernel maps with odd kernel sizes at
+    `stride` are patched: only the neighbors of the inserted coordinates are
+    searched, entries of removed coordinates are cleared and the remaining
+    indices are renumbered. All other kernel maps, hash tables, grids and
+    coordinate maps are left out and are rebuilt on demand.
+
+    Returns the new coordinates and a new TensorCache for them.
+    """
+    from torchsparse.nn import functional as F
+
+    stride = make_ntuple(stride, ndim=3)
+    keys = F.pack_coords(coords[:, [1, 2, 3, 0]])
+    inserted_keys = F.pack_coords(inserted[:, [1, 2, 3, 0]])
+    if (keys < 0).any() or (inserted_keys < 0).any():
+        raise ValueError(
+            "[Update tensor cache] coordinates exceed the 16-bit range of "
+            "packed coordinate keys."
+        )
+    kept = ~torch.isin(keys, F.pack_coords(removed[:, [1, 2, 3, 0]]))
+    num_kept = int(kept.sum())
+    if torch.isin(inserted_keys, keys[kept]).any() or (
+        torch.unique(inserted_keys).shape[0] != inserted_keys.shape[0]
+    ):
+        raise ValueError(
+            "[Update tensor cache] inserted coordinates must be unique and "
+            "not among the kept coordinates."
+        )
+
+    # remap[i] is the new index of coords[i], remap[-1] maps -1 onto itself
+    remap = torch.full(
+        (coords.shape[0] + 1,), -1, dtype=torch.long, device=coords.device
+    )
+    remap[:-1][kept] = torch.arange(num_kept, device=coords.device)
+
+    new_coords = torch.cat([coords[kept], inserted.to(coords.dtype)], dim=0)
+    new_keys, order = torch.sort(torch.cat([keys[kept], inserted_keys]))
+    order = order.int()
+
+    new_caches = TensorCache(max_bytes=caches.max_bytes)
+    spatial_range = caches.cmaps.get(stride, (None, None))[1]
+    new_caches.cmaps[stride] = (new_coords, spatial_range)
+
+    for key in list(caches.kmaps):
+        if len(key) != 4:
+            # transposed kernel maps are derived again from the patched ones
+            continue
+        tensor_stride, kernel_size, conv_stride, dilation = key
+        if (
+            tensor_stride != stride
+            or conv_stride != (1, 1, 1)
+            or dilation != (1, 1, 1)
+            or not all(k % 2 == 1 for k in kernel_size)
+        ):
+            continue
+        kmap = caches.kmaps[key]
+        out_in_map = _patch_out_in_map(
+            kmap["out_in_map"][: coords.shape[0]],
+            kept,
+            remap,
+            num_kept,
+            inserted,
+            new_keys,
+            order,
+            kernel_size,
+        )
+        # the hash table and grid describe the previous frame
+        new_caches.kmaps[key] = derive_kernel_map(
+            kmap,
+            out_in_map,
+            coords=new_coords,
+            sizes=(new_coords.shape[0], new_coords.shape[0]),
+            hashmap_keys=None,
+            hashmap_vals=None,
+            grid=None,
+            sortedmap=None,
+        )
+
+    return new_coords, new_caches
+
+
+def _patch_out_in_map(
+    out_in_map: torch.Tensor,
+    kept: torch.Tensor,
+    remap: torch.Tensor,
+    num_kept: int,
+    inserted: torch.Tensor,
+    keys: torch.Tensor,
+    order: torch.Tensor,
+    kernel_size: Tuple[int, ...],
+) -> torch.Tensor:
+    from torchsparse.nn import functional as F
+
+    kernel_volume = out_in_map.shape[1]
+    kept_map = remap[out_in_map[kept].long()]
+
+    offsets = kernel_offsets(
+        torch.tensor(kernel_size, dtype=torch.int), inserted.device
+    )
+    inserted_map = torch.full(
+        (inserted.shape[0], kernel_volume), -1, dtype=torch.long, device=inserted.device
+    )
+    queries = inserted[:, [1, 2, 3, 0]].long()
+    for k in range(kernel_volume):
+        query = queries.clone()
+        query[:, :3] += offsets[k]
+        query = F.pack_coords(query)
+        loc = torch.searchsorted(keys, query).clamp_(max=keys.shape[0] - 1)
+        found = (keys[loc] == query) & (query >= 0)
+        inserted_map[:, k] = torch.where(found, order[loc].long(), -1)
+
+    new_map = torch.cat([kept_map, inserted_map], dim=0)
+    # offsets k and K - 1 - k are opposite, so every neighbor of an inserted
+    # coordinate gains that coordinate as its neighbor at the opposite offset
+    rows, cols = torch.nonzero(inserted_map >= 0, as_tuple=True)
+    new_map[inserted_map[rows, cols], kernel_volume - 1 - cols] = num_kept + rows
+
+    results = torch.full(
+        (make_divisible(new_map.shape[0], cta_M), kernel_volume),
+        -1,
+        dtype=torch.int,
+        device=new_map.device,
+    )
+    results[: new_map.shape[0]] = new_map
+    return results
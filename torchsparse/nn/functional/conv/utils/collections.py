@@ -318,7 +318,7 @@ class AttributeDict(dict):
         """
         Return state information for pickling.
         """
-        return self.__dict__.__reduce__()
+        return (type(self), (dict(self.__dict__),))
 
     def __eq__(self, other):
         """
@@ -4,16 +4,41 @@ import torch
 
 import torchsparse.backend
 
-__all__ = ["sphash"]
+__all__ = ["sphash", "pack_coords"]
+
+
+def pack_coords(coords: torch.Tensor) -> torch.Tensor:
+    """Exact int64 keys for (x, y, z, b) coordinates.
+
+    The key is (b + 1, x + 2^15, y + 2^15, z + 2^15) in 15 + 3 x 16 bits, the
+    same layout as the packed-key hash tables. Coordinates outside
+    [-2^15, 2^15) or batch indices outside [0, 32766) get the key -1.
+    """
+    coords = coords.long()
+    xyz = coords[..., :3] + 32768
+    batch = coords[..., 3]
+    keys = (batch + 1) << 48 | xyz[..., 0] << 32 | xyz[..., 1] << 16 | xyz[..., 2]
+    valid = ((xyz >= 0) & (xyz <= 0xFFFF)).all(-1) & (batch >= 0) & (batch < 32766)
+    return torch.where(valid, keys, torch.full_like(keys, -1))
 
 
 def sphash(
-    coords: torch.Tensor, offsets: Optional[torch.Tensor] = None
+    coords: torch.Tensor,
+    offsets: Optional[torch.Tensor] = None,
+    packed: bool = False,
 ) -> torch.Tensor:
     assert coords.dtype == torch.int, coords.dtype
     assert coords.ndim == 2 and coords.shape[1] == 4, coords.shape
     coords = coords.contiguous()
 
+    if packed:
+        if offsets is not None:
+            assert offsets.dtype == torch.int, offsets.dtype
+            assert offsets.ndim == 2 and offsets.shape[1] == 3, offsets.shape
+            coords = coords.unsqueeze(0).repeat(offsets.shape[0], 1, 1)
+            coords[:, :, :3] += offsets.unsqueeze(1)
+        return pack_coords(coords)
+
     # TODO(Zhijian): We might be able to merge `hash_kernel` and `hash`.
     if offsets is None:
         if coords.device.type == "cuda":
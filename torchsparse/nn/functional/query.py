@@ -1,8 +1,12 @@
+from typing import Tuple
+
 import torch
 
 import torchsparse.backend
 
-__all__ = ["sphashquery"]
+from .hash import sphash
+
+__all__ = ["sphashquery", "sphashtable", "sphashquery_offsets"]
 
 
 def sphashquery(queries: torch.Tensor, references: torch.Tensor) -> torch.Tensor:
@@ -18,14 +22,14 @@ def sphashquery(queries: torch.Tensor, references: torch.Tensor) -> torch.Tensor
     hashmap_vals = torch.zeros(
         2 * references.shape[0], dtype=torch.int32, device=references.device
     )
-    hashmap = torchsparse.backend.GPUHashTable(hashmap_keys, hashmap_vals)
-    hashmap.insert_vals(references)
-
     if queries.device.type == "cuda":
+        hashmap = torchsparse.backend.GPUHashTable(hashmap_keys, hashmap_vals)
+        hashmap.insert_vals(references)
         output = hashmap.lookup_vals(queries)[: queries.shape[0]]
     elif queries.device.type == "cpu":
-        indices = torch.arange(len(references), device=queries.device, dtype=torch.long)
-        output = torchsparse.backend.hash_query_cpu(queries, references, indices)
+        hashmap = torchsparse.backend.CPUHashTable(hashmap_keys, hashmap_vals)
+        hashmap.insert_vals(references)
+        output = hashmap.lookup_vals(queries)[: queries.shape[0]]
     else:
         device = queries.device
         indices = torch.arange(len(references), device=queries.device, dtype=torch.long)
@@ -35,3 +39,53 @@ def sphashquery(queries: torch.Tensor, references: torch.Tensor) -> torch.Tensor
 
     output = (output - 1).view(*sizes)
     return output
+
+
+def sphashtable(
+    references: torch.Tensor, packed: bool = False
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Builds a hash table over `sphash` keys that can be queried repeatedly.
+
+    The table maps references[i] to i. Its storage is returned as a
+    (keys, vals) pair that can be cached and passed to `sphashquery_offsets`
+    any number of times. `packed` must match the `sphash` call that produced
+    the references.
+    """
+    references = references.contiguous()
+    hashmap_keys = torch.zeros(
+        2 * references.shape[0], dtype=torch.int64, device=references.device
+    )
+    hashmap_vals = torch.zeros(
+        2 * references.shape[0], dtype=torch.int32, device=references.device
+    )
+    if references.device.type == "cuda":
+        hashmap = torchsparse.backend.GPUHashTable(hashmap_keys, hashmap_vals, packed)
+    else:
+        hashmap = torchsparse.backend.CPUHashTable(hashmap_keys, hashmap_vals, packed)
+    hashmap.insert_vals(references)
+    return hashmap_keys, hashmap_vals
+
+
+def sphashquery_offsets(
+    coords: torch.Tensor,
+    offsets: torch.Tensor,
+    table: Tuple[torch.Tensor, torch.Tensor],
+    packed: bool = False,
+) -> torch.Tensor:
+    """Equivalent to `sphashquery(sphash(coords, offsets), references).t()`.
+
+    Returns the (N, K) int32 index of the reference at coords[i] + offsets[k],
+    or -1. On CPU the keys are hashed and probed on the fly, without the
+    (K, N) key matrix.
+    """
+    assert coords.dtype == torch.int, coords.dtype
+    assert offsets.dtype == torch.int, offsets.dtype
+    if coords.device.type == "cuda":
+        hashmap = torchsparse.backend.GPUHashTable(*table, packed)
+        queries = sphash(coords, offsets, packed)
+        output = hashmap.lookup_vals(queries.view(-1))[: queries.numel()]
+        output = output.view(*queries.shape).t()
+    else:
+        hashmap = torchsparse.backend.CPUHashTable(*table, packed)
+        output = hashmap.lookup_offsets(coords, offsets)
+    return output - 1
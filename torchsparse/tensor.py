@@ -99,9 +99,9 @@ class SparseTensor:
         self.feats = self.feats.to(device, non_blocking=non_blocking)
         return self
 
-    def dense(self):
+    def dense(self, channels_first: bool = False):
         assert self.spatial_range is not None
-        return to_dense(self.feats, self.coords, self.spatial_range)
+        return to_dense(self.feats, self.coords, self.spatial_range, channels_first)
 
     def __add__(self, other):
         output = SparseTensor(
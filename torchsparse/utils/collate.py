@@ -1,14 +1,25 @@
-from typing import Any, List
+from typing import Any, List, Optional
 
 import numpy as np
 import torch
 
 from torchsparse import SparseTensor
+from torchsparse.utils.tensor_cache import TensorCache
 
 __all__ = ["sparse_collate", "sparse_collate_fn"]
 
 
-def sparse_collate(inputs: List[SparseTensor]) -> SparseTensor:
+def sparse_collate(
+    inputs: List[SparseTensor], plan: Optional[Any] = None
+) -> SparseTensor:
+    """Concatenates SparseTensors into one batch.
+
+    With a `plan` from `torchsparse.plan`, the kernel maps of every sample
+    are built and merged into the tensor cache of the batch. This moves
+    kernel map construction into the DataLoader workers, e.g. with
+    `collate_fn=functools.partial(sparse_collate_fn, plan=plan)`. The maps
+    are built on the device of the coordinates, see `TensorCache.to`.
+    """
     coords, feats = [], []
     stride = inputs[0].stride
 
@@ -27,18 +38,40 @@ def sparse_collate(inputs: List[SparseTensor]) -> SparseTensor:
         coords.append(torch.cat((batch, x.coords), dim=1))
         feats.append(x.feats)
 
-    coords = torch.cat(coords, dim=0)
-    feats = torch.cat(feats, dim=0)
-    output = SparseTensor(coords=coords, feats=feats, stride=stride)
+    output = SparseTensor(
+        coords=torch.cat(coords, dim=0), feats=torch.cat(feats, dim=0), stride=stride
+    )
+    if plan is not None:
+        output._caches = _build_tensor_cache(plan, coords, feats, stride)
     return output
 
 
-def sparse_collate_fn(inputs: List[Any]) -> Any:
+def _build_tensor_cache(
+    plan: Any, coords: List[torch.Tensor], feats: List[torch.Tensor], stride
+) -> TensorCache:
+    from torchsparse.nn import functional as F
+
+    samples = []
+    for c, f in zip(coords, feats):
+        sample = SparseTensor(coords=c, feats=f, stride=stride)
+        # samples must not share the global tensor cache
+        sample._caches = TensorCache()
+        samples.append(sample)
+    merged = F.merge_tensor_caches(plan.build_batch(samples, num_workers=1))
+    for key in list(merged.kmaps):
+        # backward maps are built here as well instead of in the training step
+        merged.kmaps[key] = merged.kmaps[key].materialize()
+    return merged
+
+
+def sparse_collate_fn(inputs: List[Any], plan: Optional[Any] = None) -> Any:
     if isinstance(inputs[0], dict):
         output = {}
         for name in inputs[0].keys():
             if isinstance(inputs[0][name], dict):
-                output[name] = sparse_collate_fn([input[name] for input in inputs])
+                output[name] = sparse_collate_fn(
+                    [input[name] for input in inputs], plan=plan
+                )
             elif isinstance(inputs[0][name], np.ndarray):
                 output[name] = torch.stack(
                     [torch.tensor(input[name]) for input in inputs], dim=0
@@ -46,7 +79,9 @@ def sparse_collate_fn(inputs: List[Any]) -> Any:
             elif isinstance(inputs[0][name], torch.Tensor):
                 output[name] = torch.stack([input[name] for input in inputs], dim=0)
             elif isinstance(inputs[0][name], SparseTensor):
-                output[name] = sparse_collate([input[name] for input in inputs])
+                output[name] = sparse_collate(
+                    [input[name] for input in inputs], plan=plan
+                )
             else:
                 output[name] = [input[name] for input in inputs]
         return output
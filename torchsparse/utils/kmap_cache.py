@@ -0,0 +1,138 @@
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+from functools import partial
+import hashlib
+import os
+import weakref
+
+import torch
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+__all__ = [
+    "KernelMapCache",
+    "coords_fingerprint",
+    "get_kmap_cache",
+    "set_kmap_cache",
+]
+
+_kmap_cache = None
+# id(coords) -> (weak reference to coords, version of coords, fingerprint)
+_fingerprints: Dict[int, Tuple[weakref.ref, int, str]] = {}
+
+
+def coords_fingerprint(coords: torch.Tensor) -> str:
+    """Content hash of a coordinate tensor.
+
+    Uses xxhash when it is installed and blake2b otherwise. The hash is
+    remembered for the tensor until it is modified in place, so the layers
+    sharing a coordinate tensor copy and hash it once.
+    """
+    entry = _fingerprints.get(id(coords))
+    if entry is not None and entry[0]() is coords and entry[1] == coords._version:
+        return entry[2]
+
+    data = coords.detach().contiguous().cpu().numpy()
+    header = f"{data.dtype}{tuple(data.shape)}".encode()
+    if xxhash is not None:
+        h = xxhash.xxh3_128(header)
+    else:
+        h = hashlib.blake2b(header, digest_size=16)
+    h.update(data.tobytes())
+    fingerprint = h.hexdigest()
+    ref = weakref.ref(coords, partial(_forget_fingerprint, id(coords)))
+    _fingerprints[id(coords)] = (ref, coords._version, fingerprint)
+    return fingerprint
+
+
+def _forget_fingerprint(key: int, ref: weakref.ref) -> None:
+    # ids are reused, only drop the entry if it still belongs to `ref`
+    entry = _fingerprints.get(key)
+    if entry is not None and entry[0] is ref:
+        del _fingerprints[key]
+
+
+class KernelMapCache:
+    """Kernel maps shared across SparseTensors with identical coordinates.
+
+    Entries are keyed by a coordinate fingerprint and device together with
+    every setting the kernel map depends on. The most recent `max_entries` kernel
+    maps are kept in memory. When `cache_dir` is given, kernel maps are also
+    written there and reloaded on an in-memory miss.
+    """
+
+    def __init__(self, max_entries: int = 256, cache_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._entries: "OrderedDict[Tuple[Any, ...], Dict]" = OrderedDict()
+        self.reset_stats()
+
+    def _path(self, key: Tuple[Any, ...]) -> str:
+        name = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, name + ".pt")
+
+    def get(self, key: Tuple[Any, ...], device=None) -> Optional[Dict]:
+        kmap = self._entries.get(key)
+        if kmap is not None:
+            self._entries.move_to_end(key)
+            self.num_hits += 1
+            return kmap
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            kmap = torch.load(self._path(key), map_location=device)
+            self._insert(key, kmap)
+            self.num_disk_hits += 1
+            return kmap
+        self.num_misses += 1
+        return None
+
+    def put(self, key: Tuple[Any, ...], kmap: Dict) -> None:
+        self._insert(key, kmap)
+        if self.cache_dir is not None:
+            path = self._path(key)
+            if hasattr(kmap, "materialize"):
+                # lazy fields are computed, the file holds a plain dict
+                kmap = dict(kmap.materialize())
+            # write to a temporary file first so readers never see a partial one
+            torch.save(kmap, path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def _insert(self, key: Tuple[Any, ...], kmap: Dict) -> None:
+        self._entries[key] = kmap
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def reset_stats(self) -> None:
+        self.num_hits = 0
+        self.num_disk_hits = 0
+        self.num_misses = 0
+
+    def stats(self):
+        return {
+            "num_entries": len(self._entries),
+            "num_hits": self.num_hits,
+            "num_disk_hits": self.num_disk_hits,
+            "num_misses": self.num_misses,
+        }
+
+
+def set_kmap_cache(kmap_cache: Optional[KernelMapCache]):
+    r"""
+    kernel maps are looked up in kmap_cache before they are built,
+    None (the default) disables the cross-tensor cache
+    """
+    global _kmap_cache
+    _kmap_cache = kmap_cache
+
+
+def get_kmap_cache() -> Optional[KernelMapCache]:
+    global _kmap_cache
+    return _kmap_cache
@@ -0,0 +1,358 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+from torchsparse import SparseTensor
+from torchsparse.nn import Conv3d
+from torchsparse.nn import functional as F
+from torchsparse.nn.functional.conv.conv import (
+    _build_kernel_map,
+    _compact_kernel_map,
+    _resolve_config,
+)
+from torchsparse.utils import make_ntuple
+from torchsparse.utils.tensor_cache import TensorCache
+
+__all__ = ["plan", "KernelMapPlan"]
+
+
+class KernelMapPlan:
+    """The kernel maps of a model, recorded from one forward pass.
+
+    `build(input)` fills the tensor cache of `input` with every kernel map
+    the model will look up, so that the forward pass only runs convolutions.
+    Downsampling maps are built first, in the order of the recorded pass,
+    since the coordinates of every stride come from them. The remaining
+    kernel maps are then built with one task per stride, in a thread pool.
+    Within a stride, larger submanifold kernels are built first and smaller
+    ones are derived from them, and all maps share one hash table, grid and
+    sorted keys.
+
+    Layer configs and training flags are those of the recorded pass. A plan
+    holds no modules, so it can be sent to DataLoader workers. Generative
+    layers are left out: they reset the tensor cache, so every layer behind
+    them builds its kernel maps on demand. `build_batch(inputs)` builds the
+    maps of every sample of a batch, see `sparse_collate`.
+    """
+
+    def __init__(self, layers: List[Dict]) -> None:
+        self.layers = layers
+        self.timings: Dict[Tuple[int, ...], float] = OrderedDict()
+
+    def build(
+        self, input: SparseTensor, num_workers: Optional[int] = None
+    ) -> TensorCache:
+        """Builds all kernel maps for `input` into `input._caches`.
+
+        Returns the tensor cache. The seconds spent on every stride are
+        kept in `self.timings`.
+        """
+        caches = input._caches
+        caches.bind(input.stride, input.coords, input.spatial_range)
+        self.timings = OrderedDict()
+
+        downsample, levels = [], OrderedDict()
+        for layer in self.layers:
+            if layer["transposed"]:
+                source = layer["forward_key"][0]
+                levels.setdefault(source, []).append(layer)
+            elif layer["stride"] != (1, 1, 1):
+                downsample.append(layer)
+            else:
+                levels.setdefault(layer["key"][0], []).append(layer)
+
+        # the stride pyramid, every level needs the coordinates of the last one
+        for layer in downsample:
+            level = layer["key"][0]
+            if level not in caches.cmaps or layer["key"] in caches.kmaps:
+                continue
+            self._build_downsample(caches, layer, caches.cmaps[level])
+
+        # the worker threads only see what is handed to them, the tensor
+        # cache is read and written here
+        tasks = []
+        for level, layers in levels.items():
+            if level not in caches.cmaps:
+                # coordinates behind generative layers are only known at runtime
+                continue
+            layers = [layer for layer in layers if layer["key"] not in caches.kmaps]
+            # larger kernels first so that smaller ones can be derived
+            layers.sort(key=lambda layer: (layer["transposed"], -_volume(layer)))
+            sources = {}
+            for layer in layers:
+                if layer["transposed"]:
+                    kmap = caches.kmaps.get(layer["forward_key"])
+                    if kmap is not None:
+                        sources[layer["forward_key"]] = kmap
+            state = {
+                "hashmap": caches.hashmaps.get(level),
+                "grid": caches.grids.get(level),
+                "sortedmap": caches.sortedmaps.get(level),
+            }
+            tasks.append((level, caches.cmaps[level], layers, sources, state))
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(_build_level, *task) for task in tasks]
+            results = [future.result() for future in futures]
+
+        for task, (kmaps, seconds) in zip(tasks, results):
+            level, state = task[0], task[-1]
+            if state["hashmap"] is not None:
+                caches.hashmaps[level] = state["hashmap"]
+            if state["grid"] is not None:
+                caches.grids[level] = state["grid"]
+            if state["sortedmap"] is not None:
+                caches.sortedmaps[level] = state["sortedmap"]
+            for key, kmap in kmaps.items():
+                caches.kmaps[key] = kmap
+            self._add_time(level, seconds)
+        return caches
+
+    def build_batch(
+        self, inputs: List[SparseTensor], num_workers: Optional[int] = None
+    ) -> List[TensorCache]:
+        """Builds all kernel maps for every sample of a batch.
+
+        Returns the tensor caches of `inputs`, which can be merged into the
+        cache of their batch with `merge_tensor_caches`. Without a spatial
+        range, spconv downsampling bounds its outputs by the largest input
+        coordinate, which is the largest over all samples for the batch.
+        Downsampling maps are therefore built level by level, for all samples
+        at once, with that bound as their spatial range. With negative
+        coordinates allowed, the lower bound is still that of every sample.
+        """
+        for input in inputs:
+            input._caches.bind(input.stride, input.coords, input.spatial_range)
+
+        for layer in self.layers:
+            if layer["transposed"] or layer["stride"] == (1, 1, 1):
+                continue
+            level = layer["key"][0]
+            cmaps = [input._caches.cmaps.get(level) for input in inputs]
+            if any(cmap is None for cmap in cmaps):
+                continue
+            spatial_range = _batch_spatial_range(cmaps, len(inputs))
+            for input, cmap in zip(inputs, cmaps):
+                caches = input._caches
+                if layer["key"] in caches.kmaps:
+                    continue
+                if cmap[1] is not None:
+                    self._build_downsample(caches, layer, cmap)
+                    continue
+                # the bound only shapes the outputs, the batch itself has no
+                # spatial range
+                kmap = _build_forward(
+                    (cmap[0], spatial_range),
+                    layer,
+                    {"hashmap": None, "grid": None, "sortedmap": None},
+                )
+                kmap["spatial_range"] = None
+                caches.kmaps[layer["key"]] = kmap
+                output_stride = tuple(a * b for a, b in zip(level, layer["stride"]))
+                caches.cmaps.setdefault(output_stride, (kmap["coords"], None))
+
+        timings = OrderedDict()
+        for input in inputs:
+            self.build(input, num_workers=num_workers)
+            for level, seconds in self.timings.items():
+                timings[level] = timings.get(level, 0.0) + seconds
+        self.timings = timings
+        return [input._caches for input in inputs]
+
+    def _build_downsample(self, caches: TensorCache, layer: Dict, cmap: Tuple) -> None:
+        level = layer["key"][0]
+        start = _now(cmap[0])
+        state = {
+            "hashmap": caches.hashmaps.get(_hashmap_stride(layer)),
+            "grid": caches.grids.get(level),
+            "sortedmap": caches.sortedmaps.get(level),
+        }
+        kmap = _build_forward(cmap, layer, state)
+        caches.hashmaps[_hashmap_stride(layer)] = state["hashmap"]
+        if state["grid"] is not None:
+            caches.grids[level] = state["grid"]
+        if state["sortedmap"] is not None:
+            caches.sortedmaps[level] = state["sortedmap"]
+        caches.kmaps[layer["key"]] = kmap
+        output_stride = tuple(a * b for a, b in zip(level, layer["stride"]))
+        caches.cmaps.setdefault(output_stride, (kmap["coords"], kmap["spatial_range"]))
+        self._add_time(level, _now(cmap[0]) - start)
+
+    def _add_time(self, level: Tuple[int, ...], seconds: float) -> None:
+        self.timings[level] = self.timings.get(level, 0.0) + seconds
+
+
+def _record_layer(module: Conv3d, tensor_stride: Tuple[int, ...]) -> Optional[Dict]:
+    kernel_size = module.kernel_size
+    stride = module.stride
+    dilation = make_ntuple(module.dilation, ndim=3)
+    if module.generative or (
+        kernel_size == (1, 1, 1) and stride == (1, 1, 1) and dilation == (1, 1, 1)
+    ):
+        return None
+    training = module.training
+    config = _resolve_config(module._config, training).copy()
+    layer = {
+        "kernel_size": kernel_size,
+        "stride": stride,
+        "padding": module.padding,
+        "dilation": dilation,
+        "transposed": module.transposed,
+        "config": config,
+        "training": training,
+    }
+    if module.transposed:
+        level = tuple(a // b for a, b in zip(tensor_stride, stride))
+        layer["forward_key"] = (level, kernel_size, stride, dilation)
+        layer["key"] = (
+            level,
+            kernel_size,
+            stride,
+            dilation,
+            config.ifsort,
+            config.split_mask_num,
+            config.split_mask_num_bwd,
+            training,
+        )
+    else:
+        layer["key"] = (tensor_stride, kernel_size, stride, dilation)
+    return layer
+
+
+def _batch_spatial_range(cmaps: List[Tuple], batch_size: int) -> Tuple[int, ...]:
+    coords = torch.cat([cmap[0] for cmap in cmaps], dim=0)
+    if coords.shape[0] == 0:
+        return (batch_size, 1, 1, 1)
+    coords_max = coords[:, 1:].max(0).values
+    return (batch_size,) + tuple((coords_max + 1).tolist())
+
+
+def _volume(layer: Dict) -> int:
+    kernel_size = layer["kernel_size"]
+    return kernel_size[0] * kernel_size[1] * kernel_size[2]
+
+
+def _hashmap_stride(layer: Dict) -> Tuple[int, ...]:
+    # in hashmap_on_the_fly, downsampling hash tables hold output coordinates
+    level, stride = layer["key"][0], layer["stride"]
+    if layer["config"].kmap_mode != "hashmap_on_the_fly":
+        return level
+    return tuple(a * b for a, b in zip(level, stride))
+
+
+def _build_forward(cmap: Tuple, layer: Dict, state: Dict) -> Dict:
+    # `state` holds the hash table, grid and sorted keys of the level, shared
+    # by its maps
+    level, kernel_size, stride, dilation = layer["key"]
+    hashmap = state["hashmap"]
+    hashmap_keys, hashmap_vals, hashmap_scheme = (
+        (None, None, None) if hashmap is None else hashmap
+    )
+    grid = state["grid"] if layer["config"].kmap_mode == "grid" else None
+    sortedmap = state["sortedmap"] if layer["config"].kmap_mode == "sorted" else None
+    kmap = _build_kernel_map(
+        cmap[0],
+        level,
+        cmap[1],
+        kernel_size,
+        stride,
+        layer["padding"],
+        dilation,
+        hashmap_keys,
+        hashmap_vals,
+        hashmap_scheme,
+        grid,
+        sortedmap,
+        layer["config"],
+        layer["training"],
+    )
+    state["hashmap"] = [
+        kmap["hashmap_keys"],
+        kmap["hashmap_vals"],
+        kmap["hashmap_scheme"],
+    ]
+    if kmap["grid"] is not None:
+        state["grid"] = kmap["grid"]
+    if kmap["sortedmap"] is not None:
+        state["sortedmap"] = kmap["sortedmap"]
+    return kmap
+
+
+def _build_level(
+    level: Tuple[int, ...],
+    cmap: Tuple,
+    layers: List[Dict],
+    sources: Dict,
+    state: Dict,
+) -> Tuple[Dict, float]:
+    start = _now(cmap[0])
+    kmaps = OrderedDict()
+    for layer in layers:
+        key, config = layer["key"], layer["config"]
+        if key in kmaps:
+            continue
+        if layer["transposed"]:
+            # stride-1 transposed layers use a map built by this task
+            source = kmaps.get(layer["forward_key"], sources.get(layer["forward_key"]))
+            if source is not None:
+                kmap = F.transpose_kernel_map(
+                    source,
+                    config.ifsort,
+                    training=layer["training"],
+                    split_mask_num=config.split_mask_num,
+                    split_mask_num_bwd=config.split_mask_num_bwd,
+                )
+                kmaps[key] = _compact_kernel_map(kmap)
+            continue
+        kmap = F.find_sub_kernel_map(
+            kmaps,
+            level,
+            layer["kernel_size"],
+            layer["dilation"],
+            config.dataflow,
+            config.ifsort,
+            layer["training"],
+        )
+        if kmap is None:
+            kmap = _build_forward(cmap, layer, state)
+        kmaps[key] = _compact_kernel_map(kmap)
+    return kmaps, _now(cmap[0]) - start
+
+
+def _now(tensor: torch.Tensor) -> float:
+    if tensor.device.type == "cuda":
+        torch.cuda.synchronize(tensor.device)
+    return time.perf_counter()
+
+
+@torch.no_grad()
+def plan(model: nn.Module, sample_input: SparseTensor) -> KernelMapPlan:
+    """Records the kernel maps `model` needs by running it on `sample_input`.
+
+    Every Conv3d call is recorded with the stride of its input and the
+    config it runs with. Use `plan(model, sample_input).build(input)` before
+    `model(input)` to build all kernel maps of `input` up front.
+    """
+    layers, seen = [], set()
+
+    def record(module, inputs):
+        layer = _record_layer(module, inputs[0].stride)
+        if layer is not None and layer["key"] not in seen:
+            seen.add(layer["key"])
+            layers.append(layer)
+
+    handles = [
+        module.register_forward_pre_hook(record)
+        for module in model.modules()
+        if isinstance(module, Conv3d)
+    ]
+    try:
+        model(sample_input)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return KernelMapPlan(layers)
@@ -1,6 +1,14 @@
-from typing import Any, Dict, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from collections import OrderedDict
+from collections.abc import MutableMapping
 from enum import Enum
 import copy
+import json
+import os
+import struct
+
+import numpy as np
+import torch
 
 
 class TensorCacheMode(Enum):
@@ -10,6 +18,7 @@ class TensorCacheMode(Enum):
 
 _tensor_cache_mode = TensorCacheMode.SEPARATE_TENSOR_CACHE
 _global_tensor_cache = None
+_tensor_cache_max_bytes = None
 
 
 def set_tensor_cache_mode(mode: TensorCacheMode):
@@ -30,13 +39,245 @@ def get_tensor_cache_mode() -> TensorCacheMode:
     return copy.deepcopy(_tensor_cache_mode)
 
 
+def set_tensor_cache_max_bytes(max_bytes: Optional[int]):
+    r"""
+    memory budget of every TensorCache created afterwards,
+    None (the default) means unbounded
+    """
+    global _tensor_cache_max_bytes
+    _tensor_cache_max_bytes = max_bytes
+
+
+def get_tensor_cache_max_bytes() -> Optional[int]:
+    global _tensor_cache_max_bytes
+    return _tensor_cache_max_bytes
+
+
+def _collect_storages(value: Any, storages: Dict[int, int]) -> None:
+    if isinstance(value, torch.Tensor):
+        storage = value.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+    elif isinstance(value, dict):
+        for v in value.values():
+            _collect_storages(v, storages)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _collect_storages(v, storages)
+
+
+def _to_device(value: Any, device, non_blocking: bool, memo: Dict[int, Any]) -> Any:
+    # `memo` keeps tensors shared by several entries shared after the move
+    if isinstance(value, torch.Tensor):
+        if id(value) not in memo:
+            memo[id(value)] = value.to(device, non_blocking=non_blocking)
+        return memo[id(value)]
+    if isinstance(value, dict):
+        # a copy keeps the type of kernel maps and their pending fields
+        moved = copy.copy(value)
+        for key, v in value.items():
+            moved[key] = _to_device(v, device, non_blocking, memo)
+        return moved
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_device(v, device, non_blocking, memo) for v in value)
+    return value
+
+
+class LRUDict(MutableMapping):
+    """A dict whose entries are accounted and evicted by a TensorCache.
+
+    Reads through `get` count as cache hits or misses and mark the entry as
+    most recently used.
+    """
+
+    def __init__(self, cache: "TensorCache", name: str) -> None:
+        self._cache = cache
+        self._name = name
+        self._data: Dict[Any, Any] = {}
+
+    def __getitem__(self, key: Any) -> Any:
+        value = self._data[key]
+        self._cache._touch((self._name, key), value)
+        return value
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        if key in self._data:
+            self._cache.num_hits += 1
+            return self[key]
+        self._cache.num_misses += 1
+        return default
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self._data[key] = value
+        self._cache._touch((self._name, key), value)
+        self._cache._evict(protect=(self._name, key))
+
+    def __delitem__(self, key: Any) -> None:
+        del self._data[key]
+        self._cache._release((self._name, key))
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._data
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        for key in list(self._data):
+            del self[key]
+
+    def pin(self, key: Any) -> None:
+        """Protects the entry from eviction until a matching `unpin`."""
+        entry = (self._name, key)
+        self._cache._pins[entry] = self._cache._pins.get(entry, 0) + 1
+
+    def unpin(self, key: Any) -> None:
+        entry = (self._name, key)
+        count = self._cache._pins.get(entry, 0)
+        if count <= 1:
+            self._cache._pins.pop(entry, None)
+        else:
+            self._cache._pins[entry] = count - 1
+
+
 class TensorCache:
-    def __init__(
+    """Coordinate maps, kernel maps, hash tables and grids of a network.
+
+    `sortedmaps` hold the sorted coordinate keys of the "sorted" kmap_mode,
+    apart from the hash tables. `kmaps`, `hashmaps`, `grids` and
+    `sortedmaps` share a least-recently-used order and are evicted once
+    their tensors exceed `max_bytes`. Tensors shared by several entries are
+    accounted once. Pinned entries, e.g. kernel maps of a pending backward
+    pass, and the entry being inserted are never evicted. `cmaps` are small
+    and needed to restore coarser strides, so they are not evicted.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None) -> None:
+        if max_bytes is None:
+            max_bytes = get_tensor_cache_max_bytes()
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._order: "OrderedDict[Tuple[str, Any], None]" = OrderedDict()
+        self._entry_storages: Dict[Tuple[str, Any], Dict[int, int]] = {}
+        self._storage_refs: Dict[int, int] = {}
+        self._pins: Dict[Tuple[str, Any], int] = {}
+        self.reset_stats()
+
+        self.cmaps: Dict[Tuple[int, ...], Tuple[torch.Tensor, Tuple[int, ...]]] = {}
+        self.kmaps: Dict[Tuple[Any, ...], Any] = LRUDict(self, "kmaps")
+        self.hashmaps: Dict[Tuple[int, ...], Tuple[Any, ...]] = LRUDict(
+            self, "hashmaps"
+        )
+        self.grids: Dict[Tuple[int, ...], torch.Tensor] = LRUDict(self, "grids")
+        self.sortedmaps: Dict[Tuple[int, ...], List[torch.Tensor]] = LRUDict(
+            self, "sortedmaps"
+        )
+
+    def _touch(self, entry: Tuple[str, Any], value: Any) -> None:
+        # kernel maps gain fields after insertion, so re-account on access
+        self._release(entry)
+        storages: Dict[int, int] = {}
+        _collect_storages(value, storages)
+        for ptr, nbytes in storages.items():
+            if ptr not in self._storage_refs:
+                self._storage_refs[ptr] = 0
+                self.nbytes += nbytes
+            self._storage_refs[ptr] += 1
+        self._entry_storages[entry] = storages
+        self._order[entry] = None
+
+    def _release(self, entry: Tuple[str, Any]) -> None:
+        self._order.pop(entry, None)
+        for ptr, nbytes in self._entry_storages.pop(entry, {}).items():
+            self._storage_refs[ptr] -= 1
+            if self._storage_refs[ptr] == 0:
+                del self._storage_refs[ptr]
+                self.nbytes -= nbytes
+
+    def _evict(self, protect: Tuple[str, Any]) -> None:
+        if self.max_bytes is None:
+            return
+        for entry in list(self._order):
+            if self.nbytes <= self.max_bytes:
+                break
+            if entry == protect or entry in self._pins:
+                continue
+            name, key = entry
+            del getattr(self, name)[key]
+            self.num_evictions += 1
+
+    def clear(self) -> None:
+        """Drops all entries. Pins are kept until they are released."""
+        self.cmaps.clear()
+        for name in ["kmaps", "hashmaps", "grids", "sortedmaps"]:
+            getattr(self, name).clear()
+
+    def bind(
         self,
+        stride: Tuple[int, ...],
+        coords: torch.Tensor,
+        spatial_range: Optional[Tuple[int, ...]] = None,
     ) -> None:
-        self.cmaps: Dict[Tuple[int, ...], Tuple[torch.Tensor, Tuple[int, ...]]] = {}
-        self.kmaps: Dict[Tuple[Any, ...], Any] = {}
-        self.hashmaps: Dict[Tuple[int, ...], Tuple[Any, ...]] = {}
+        """Makes `coords` the coordinates of `stride`.
+
+        A cache holds the maps of one set of coordinates. If it was built
+        for other coordinates at `stride`, e.g. the global tensor cache for
+        the previous input, all of its entries are dropped first.
+        """
+        cmap = self.cmaps.get(stride)
+        if cmap is not None and cmap[0] is not coords:
+            if cmap[0].shape != coords.shape or not torch.equal(cmap[0], coords):
+                self.clear()
+        self.cmaps.setdefault(stride, (coords, spatial_range))
+
+    def to(self, device, non_blocking: bool = False) -> "TensorCache":
+        """Moves all entries to `device` in place.
+
+        The entries are copied, so kernel maps shared with other caches stay
+        where they are.
+        """
+        memo: Dict[int, Any] = {}
+        for stride, cmap in self.cmaps.items():
+            self.cmaps[stride] = _to_device(cmap, device, non_blocking, memo)
+        for name in ["kmaps", "hashmaps", "grids", "sortedmaps"]:
+            entries = getattr(self, name)
+            for key in list(entries):
+                value = entries._data[key]
+                entries[key] = _to_device(value, device, non_blocking, memo)
+        return self
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the accounting refers to storage addresses of this process, it is
+        # rebuilt on unpickling; pins and stats are not carried over
+        return {
+            "max_bytes": self.max_bytes,
+            "cmaps": self.cmaps,
+            "kmaps": dict(self.kmaps._data),
+            "hashmaps": dict(self.hashmaps._data),
+            "grids": dict(self.grids._data),
+            "sortedmaps": dict(self.sortedmaps._data),
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(max_bytes=state["max_bytes"])
+        self.cmaps.update(state["cmaps"])
+        for name in ["kmaps", "hashmaps", "grids", "sortedmaps"]:
+            getattr(self, name).update(state.get(name, {}))
+
+    def reset_stats(self) -> None:
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+
+    def stats(self):
+        return {
+            "nbytes": self.nbytes,
+            "num_hits": self.num_hits,
+            "num_misses": self.num_misses,
+            "num_evictions": self.num_evictions,
+        }
 
 
 def get_global_tensor_cache():
@@ -56,3 +297,144 @@ def clear_global_tensor_cache():
     """
     global _global_tensor_cache
     _global_tensor_cache = None
+
+
+_FILE_MAGIC = b"TSTCACHE"
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct("<8sIQ")
+_FILE_ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + _FILE_ALIGNMENT - 1) // _FILE_ALIGNMENT * _FILE_ALIGNMENT
+
+
+def _encode(value: Any, tensors: List[torch.Tensor], ids: Dict[int, int]) -> Any:
+    if isinstance(value, torch.Tensor):
+        # tensors shared by several entries are written once
+        if id(value) not in ids:
+            ids[id(value)] = len(tensors)
+            tensors.append(value)
+        return {"tensor": ids[id(value)]}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (tuple, list)):
+        kind = "tuple" if isinstance(value, tuple) else "list"
+        return {kind: [_encode(v, tensors, ids) for v in value]}
+    if isinstance(value, dict):
+        # pending fields of kernel maps are computed and written as well,
+        # compact index maps are written in compact form
+        kind = "kmap" if hasattr(value, "materialize") else "dict"
+        if kind == "kmap":
+            value.materialize()
+        items = value.items()
+        return {
+            kind: [
+                [_encode(k, tensors, ids), _encode(v, tensors, ids)] for k, v in items
+            ]
+        }
+    raise TypeError(f"[Tensor cache] cannot save values of type {type(value)}")
+
+
+def save_tensor_cache(caches: TensorCache, path: str) -> None:
+    """Writes the coordinate maps, kernel maps, hash tables and grids.
+
+    The file starts with a magic string, a format version and the length of
+    a JSON index, followed by the index and the raw bytes of every tensor,
+    each aligned to 64 bytes. Kernel maps are written with all of their
+    fields, including pending ones.
+    """
+    tensors, ids = [], {}
+    sections = {"cmaps": list(caches.cmaps.items())}
+    for name in ["kmaps", "hashmaps", "grids", "sortedmaps"]:
+        sections[name] = list(getattr(caches, name)._data.items())
+    index = {
+        name: [[_encode(k, tensors, ids), _encode(v, tensors, ids)] for k, v in items]
+        for name, items in sections.items()
+    }
+
+    tensors = [t.detach().contiguous().cpu() for t in tensors]
+    offset, entries = 0, []
+    for t in tensors:
+        nbytes = t.numel() * t.element_size()
+        entries.append([str(t.dtype).split(".")[-1], list(t.shape), offset, nbytes])
+        offset = _align(offset + nbytes)
+    index["tensors"] = entries
+    index = json.dumps(index).encode()
+    data_start = _align(_FILE_HEADER.size + len(index))
+
+    # write to a temporary file first so readers never see a partial one
+    with open(path + ".tmp", "wb") as f:
+        f.write(_FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, len(index)))
+        f.write(index)
+        for t, (_, _, start, nbytes) in zip(tensors, entries):
+            if nbytes:
+                f.seek(data_start + start)
+                f.write(t.view(-1).view(torch.uint8).numpy().tobytes())
+        f.truncate(data_start + offset)
+    os.replace(path + ".tmp", path)
+
+
+def _decode(value: Any, tensors: List[torch.Tensor]) -> Any:
+    if not isinstance(value, dict):
+        return value
+    ((kind, items),) = value.items()
+    if kind == "tensor":
+        return tensors[items]
+    if kind == "tuple":
+        return tuple(_decode(v, tensors) for v in items)
+    if kind == "list":
+        return [_decode(v, tensors) for v in items]
+    decoded = {_decode(k, tensors): _decode(v, tensors) for k, v in items}
+    if kind == "kmap":
+        from torchsparse.nn.functional.conv.kmap import KernelMap, compact_kernel_map
+
+        decoded = KernelMap(decoded)
+        if any(str(k).endswith("_compact") for k in decoded):
+            # compact index maps are expanded on read again
+            decoded = compact_kernel_map(decoded)
+    return decoded
+
+
+def load_tensor_cache(
+    path: str, device=None, max_bytes: Optional[int] = None
+) -> TensorCache:
+    """Reads a tensor cache written by `save_tensor_cache`.
+
+    Every tensor is memory-mapped from the file, so nothing is copied and
+    pages are read on first access. With a `device`
+    other than the CPU, the tensors are copied there.
+    """
+    with open(path, "rb") as f:
+        magic, version, index_size = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+        if magic != _FILE_MAGIC:
+            raise ValueError(f"[Tensor cache] {path} is not a tensor cache file.")
+        if version != _FILE_VERSION:
+            raise ValueError(
+                f"[Tensor cache] unsupported file version {version} in {path}, "
+                f"expected {_FILE_VERSION}."
+            )
+        index = json.loads(f.read(index_size))
+    data_start = _align(_FILE_HEADER.size + index_size)
+
+    # one mapping per tensor, so that every tensor is accounted by its own
+    # size in `max_bytes` instead of that of the whole file
+    tensors = []
+    for dtype, shape, offset, nbytes in index["tensors"]:
+        dtype = getattr(torch, dtype)
+        if not nbytes:
+            tensors.append(torch.empty(shape, dtype=dtype))
+            continue
+        data = np.memmap(
+            path, dtype=np.uint8, mode="c", offset=data_start + offset, shape=(nbytes,)
+        )
+        tensors.append(torch.from_numpy(data).view(dtype).view(shape))
+
+    caches = TensorCache(max_bytes=max_bytes)
+    for name in ["cmaps", "kmaps", "hashmaps", "grids", "sortedmaps"]:
+        entries = getattr(caches, name)
+        for key, value in index.get(name, []):
+            entries[_decode(key, tensors)] = _decode(value, tensors)
+    if device is not None and torch.device(device).type != "cpu":
+        caches.to(device)
+    return caches
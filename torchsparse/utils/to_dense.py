@@ -18,47 +18,63 @@ class ToDenseFunction(Function):
         feats: torch.Tensor,
         coords: torch.Tensor,
         spatial_range: Tuple[int],
+        channels_first: bool = False,
     ) -> torch.Tensor:
         feats = feats.contiguous()
         coords = coords.contiguous().int()
-        outputs = torch.zeros(
-            spatial_range + (feats.size(1),), dtype=feats.dtype, device=feats.device
-        )
+        if channels_first:
+            shape = spatial_range[:1] + (feats.size(1),) + tuple(spatial_range[1:])
+        else:
+            shape = tuple(spatial_range) + (feats.size(1),)
+        outputs = torch.zeros(shape, dtype=feats.dtype, device=feats.device)
         spatial_range = make_tensor(spatial_range, dtype=torch.int, device=feats.device)
 
         if feats.device.type == "cuda":
             torchsparse.backend.to_dense_forward_cuda(
-                feats, coords, spatial_range, outputs
+                feats, coords, spatial_range, outputs, channels_first
+            )
+        elif feats.device.type == "cpu":
+            torchsparse.backend.to_dense_forward_cpu(
+                feats, coords, spatial_range, outputs, channels_first
             )
         else:
             raise NotImplementedError
 
-        ctx.for_backwards = (coords, spatial_range)
+        ctx.for_backwards = (coords, spatial_range, channels_first)
         return outputs.to(feats.dtype)
 
     @staticmethod
     # @custom_bwd
     def backward(ctx, grad_output: torch.Tensor):
-        coords, spatial_range = ctx.for_backwards
+        coords, spatial_range, channels_first = ctx.for_backwards
         grad_output = grad_output.contiguous()
-        grad_feats = torch.zeros(
+        grad_feats = torch.empty(
             coords.size(0),
-            grad_output.size(-1),
+            grad_output.size(1 if channels_first else -1),
             dtype=grad_output.dtype,
             device=grad_output.device,
         )
 
         if grad_output.device.type == "cuda":
             torchsparse.backend.to_dense_backward_cuda(
-                grad_output, coords, spatial_range, grad_feats
+                grad_output, coords, spatial_range, grad_feats, channels_first
+            )
+        elif grad_output.device.type == "cpu":
+            torchsparse.backend.to_dense_backward_cpu(
+                grad_output, coords, spatial_range, grad_feats, channels_first
             )
         else:
             raise NotImplementedError
 
-        return grad_feats, None, None
+        return grad_feats, None, None, None
 
 
 def to_dense(
-    feats: torch.Tensor, coords: torch.Tensor, spatial_range: Tuple[int]
+    feats: torch.Tensor,
+    coords: torch.Tensor,
+    spatial_range: Tuple[int],
+    channels_first: bool = False,
 ) -> torch.Tensor:
-    return ToDenseFunction.apply(feats, coords, spatial_range)
+    """Scatter the features into a dense tensor of shape (B, *spatial, C), or
+    (B, C, *spatial) if `channels_first` is set."""
+    return ToDenseFunction.apply(feats, coords, spatial_range, channels_first)
@@ -68,6 +68,8 @@ def clear_tensor_cache(inputs: SparseTensor):
     inputs = recursive_apply(inputs, lambda x: x._caches.cmaps.clear())
     inputs = recursive_apply(inputs, lambda x: x._caches.kmaps.clear())
     inputs = recursive_apply(inputs, lambda x: x._caches.hashmaps.clear())
+    inputs = recursive_apply(inputs, lambda x: x._caches.grids.clear())
+    inputs = recursive_apply(inputs, lambda x: x._caches.sortedmaps.clear())
     return inputs
 
 